@@ -1,64 +1,409 @@
 import sys
 import os
+import asyncio
+import inspect
+import functools
+import contextvars
 import importlib
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
 
 # Add the current directory to sys.path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+import metrics
+from llm_governor import PRIORITY_BACKGROUND, llm_priority
+
+AGENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agents")
+
+# Maximum number of sync-only agent runs executing at the same time.
+# Agents that only expose a blocking chat_agent are run on this pool instead of
+# the event loop, so long research runs cannot stall other requests.
+AGENT_WORKER_THREADS = int(os.getenv("AGENT_WORKER_THREADS", "32"))
+
+_executor = None
+
+def get_agent_executor():
+    """Return the shared, size-limited executor used for sync-only agents."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=AGENT_WORKER_THREADS, thread_name_prefix="agent-worker")
+    return _executor
+
+def shutdown_agent_executor(wait=True):
+    """Shut down the agent executor (called on application shutdown)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+class AgentCancelled(Exception):
+    """Raised inside a sync agent's progress callback once its run was cancelled."""
+
+@dataclass
+class AgentEntry:
+    """Entry points of a loaded agent, resolved once at load time."""
+    name: str
+    module: Any
+    chat_agent: Callable
+    achat_agent: Optional[Callable] = None
+    astream_agent: Optional[Callable] = None
+    abatch_agent: Optional[Callable] = None
+    accepts_on_event: bool = False
+    warmed: bool = False
+
+    @classmethod
+    def from_module(cls, name, module) -> "AgentEntry":
+        # Check if the module has the chat_agent function
+        if not hasattr(module, "chat_agent"):
+            raise AttributeError(f"Agent '{name}' does not expose a 'chat_agent' function")
+        achat_agent = getattr(module, "achat_agent", None)
+        return cls(
+            name=name,
+            module=module,
+            chat_agent=module.chat_agent,
+            achat_agent=achat_agent if asyncio.iscoroutinefunction(achat_agent) else None,
+            astream_agent=getattr(module, "astream_agent", None),
+            abatch_agent=getattr(module, "abatch_agent", None),
+            accepts_on_event="on_event" in inspect.signature(module.chat_agent).parameters,
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "loaded": True,
+            "async": self.achat_agent is not None,
+            "streaming": self.astream_agent is not None or self.accepts_on_event,
+            "batch": self.abatch_agent is not None,
+            "warmed": self.warmed,
+        }
+
+class AgentRegistry:
+    """
+    Discovers the agents under agents/ once and caches their entry points.
+
+    Agents are imported on first use, or ahead of time with preload(). An agent
+    module may expose warmup() (plain or coroutine) to build clients and open
+    connections, which preload() calls so the first request does not pay for it.
+    """
+
+    def __init__(self, agents_dir: str = AGENTS_DIR):
+        self.agents_dir = agents_dir
+        self._names: Optional[List[str]] = None
+        self._entries: Dict[str, AgentEntry] = {}
+        self._lock = threading.Lock()
+        # agent name -> asyncio.Lock, so concurrent first requests wait for one import
+        self._import_locks: Dict[str, asyncio.Lock] = {}
+
+    def names(self) -> List[str]:
+        """Names of the agent folders that contain an agent.py."""
+        if self._names is None:
+            self._names = sorted(
+                d for d in os.listdir(self.agents_dir)
+                if not d.startswith("__") and os.path.isfile(os.path.join(self.agents_dir, d, "agent.py"))
+            )
+        return self._names
+
+    def register(self, name: str, module) -> AgentEntry:
+        """Register an already imported agent module (e.g. a stub in benchmarks)."""
+        entry = AgentEntry.from_module(name, module)
+        with self._lock:
+            self._entries[name] = entry
+            if self._names is not None and name not in self._names:
+                self._names = sorted(self._names + [name])
+        return entry
+
+    def get(self, agent_name: str) -> AgentEntry:
+        """
+        Return the cached entry for an agent, importing it on first use.
+
+        Raises:
+            ImportError: If the agent folder or module does not exist
+            AttributeError: If the module does not expose a 'chat_agent' function
+        """
+        entry = self._entries.get(agent_name)
+        if entry is not None:
+            return entry
+
+        if agent_name not in self.names():
+            print(f"Error: Could not import agent '{agent_name}'. Make sure the folder exists in agents/")
+            print(f"Available agents: {', '.join(self.names())}")
+            raise ImportError(f"Agent '{agent_name}' not found in agents/")
+
+        with self._lock:
+            entry = self._entries.get(agent_name)
+            if entry is None:
+                agent_module = importlib.import_module(f"agents.{agent_name}.agent")
+                entry = AgentEntry.from_module(agent_name, agent_module)
+                self._entries[agent_name] = entry
+        return entry
+
+    async def aget(self, agent_name: str) -> AgentEntry:
+        """
+        get() for the event loop: an agent not loaded yet (e.g. left out of
+        PRELOAD_AGENTS) is imported on a worker thread, so its langgraph,
+        langchain and provider SDK imports do not stall other requests.
+
+        Raises:
+            ImportError: If the agent folder or module does not exist
+            AttributeError: If the module does not expose a 'chat_agent' function
+        """
+        entry = self._entries.get(agent_name)
+        if entry is not None:
+            return entry
+        lock = self._import_locks.setdefault(agent_name, asyncio.Lock())
+        async with lock:
+            return await asyncio.to_thread(self.get, agent_name)
+
+    async def warm(self, agent_name: str) -> AgentEntry:
+        """
+        Load an agent and run its optional warmup() hook once.
+
+        A coroutine warmup() runs on the calling event loop, so clients bound to
+        the loop that will serve requests are the ones warmed. A blocking one
+        runs on a worker thread, like the import.
+        """
+        loop = asyncio.get_running_loop()
+        entry = await self.aget(agent_name)
+        if not entry.warmed:
+            warmup = getattr(entry.module, "warmup", None)
+            if asyncio.iscoroutinefunction(warmup):
+                await warmup()
+            elif warmup is not None:
+                await loop.run_in_executor(None, warmup)
+            entry.warmed = True
+        return entry
+
+    async def preload(self, agent_names: Optional[List[str]] = None, warm: bool = True) -> None:
+        """Import (and optionally warm) agents. Failures are logged, not raised."""
+        for agent_name in agent_names if agent_names is not None else self.names():
+            try:
+                if warm:
+                    await self.warm(agent_name)
+                else:
+                    await self.aget(agent_name)
+                print(f"Preloaded agent '{agent_name}'")
+            except Exception as e:
+                print(f"Warning: could not preload agent '{agent_name}': {e}")
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """Status of every known agent, for the /agents endpoint."""
+        return [
+            self._entries[name].describe() if name in self._entries else {"name": name, "loaded": False}
+            for name in self.names()
+        ]
+
+registry = AgentRegistry()
+
+def load_agent_module(agent_name):
+    """
+    Import agents/{agent_name}/agent.py and check it exposes chat_agent.
+
+    Raises:
+        ImportError: If the agent folder or module does not exist
+        AttributeError: If the module does not expose a 'chat_agent' function
+    """
+    return registry.get(agent_name).module
+
 def run_agent(agent_name, chat_history, query):
     """
-    Dynamically import and run the agent from agents/{agent_name}/agent.py.
+    Run the agent from agents/{agent_name}/agent.py.
     Expects each agent to expose a function: chat_agent(chat_history, query)
-    
+
     Args:
         agent_name: Name of the agent folder (e.g., "deepresearch_optimus_alpha")
         chat_history: List of message dicts with "role" and "content" keys, or None
         query: User query string
-        
+
     Returns:
         Tuple of (response, updated_chat_history)
     """
     try:
-        # Import the agent module
-        agent_path = f"agents.{agent_name}.agent"
-        agent_module = importlib.import_module(agent_path)
-        
-        # Check if the module has the chat_agent function
-        if not hasattr(agent_module, "chat_agent"):
-            raise AttributeError(f"Agent '{agent_name}' does not expose a 'chat_agent' function")
-        
+        entry = registry.get(agent_name)
+
         # Ensure chat_history is a list, even if None is passed
         history_to_pass = chat_history if chat_history is not None else []
-        
+
         # Call the agent's chat_agent function
-        return agent_module.chat_agent(history_to_pass, query)
-    
+        return entry.chat_agent(history_to_pass, query)
+
+    except ImportError as e:
+        raise e
+    except Exception as e:
+        print(f"Error running agent '{agent_name}': {e}")
+        raise e
+
+async def _call_agent(entry, chat_history, query):
+    if entry.achat_agent is not None:
+        return await entry.achat_agent(chat_history, query)
+
+    loop = asyncio.get_running_loop()
+    # Carry context (e.g. the LLM priority) into the worker thread
+    return await loop.run_in_executor(
+        get_agent_executor(),
+        functools.partial(contextvars.copy_context().run, entry.chat_agent, chat_history, query)
+    )
+
+async def arun_agent(agent_name, chat_history, query):
+    """
+    Async counterpart of run_agent, safe to await from the API event loop.
+
+    If the agent exposes a coroutine achat_agent(chat_history, query) it is
+    awaited directly. Otherwise the blocking chat_agent is run on the shared
+    agent executor so the event loop stays responsive.
+
+    Args:
+        agent_name: Name of the agent folder (e.g., "deepresearch_optimus_alpha")
+        chat_history: List of message dicts with "role" and "content" keys, or None
+        query: User query string
+
+    Returns:
+        Tuple of (response, updated_chat_history)
+    """
+    try:
+        entry = await registry.aget(agent_name)
+
+        # Ensure chat_history is a list, even if None is passed
+        history_to_pass = chat_history if chat_history is not None else []
+
+        with metrics.track_agent_request(agent_name, "run"):
+            return await _call_agent(entry, history_to_pass, query)
+
     except ImportError as e:
-        print(f"Error: Could not import agent '{agent_name}'. Make sure the folder exists in agents/")
-        print(f"Available agents: {', '.join(os.listdir(os.path.join(os.path.dirname(__file__), 'agents')))}")
         raise e
     except Exception as e:
         print(f"Error running agent '{agent_name}': {e}")
         raise e
 
+async def abatch_agent(agent_name, requests, max_concurrency=16):
+    """
+    Run many independent requests against one agent with bounded concurrency.
+
+    If the agent exposes abatch_agent(requests, max_concurrency) it is used, so
+    the agent can send its LLM calls through the model's batch path. Otherwise
+    each request goes through arun_agent, at most max_concurrency at a time.
+
+    Args:
+        agent_name: Name of the agent folder (e.g., "chat_deepseek_v3")
+        requests: List of (chat_history, query) tuples; chat_history may be None
+        max_concurrency: Maximum number of requests in flight
+
+    Returns:
+        List with one entry per request, in order: a (response, updated_chat_history)
+        tuple, or the exception that request failed with
+    """
+    entry = await registry.aget(agent_name)
+
+    # Ensure chat_history is a list, even if None is passed
+    requests = [(chat_history if chat_history is not None else [], query) for chat_history, query in requests]
+
+    # Batch work yields LLM capacity to interactive requests
+    with metrics.track_agent_request(agent_name, "batch"), llm_priority(PRIORITY_BACKGROUND):
+        if entry.abatch_agent is not None:
+            return await entry.abatch_agent(requests, max_concurrency=max_concurrency)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(chat_history, query):
+            async with semaphore:
+                return await _call_agent(entry, chat_history, query)
+
+        return await asyncio.gather(*(run_one(h, q) for h, q in requests), return_exceptions=True)
+
+async def astream_agent(agent_name, chat_history, query):
+    """
+    Run an agent and yield its output as a stream of events.
+
+    Each event is a dict {"event": name, "data": dict}. The last event is always
+    {"event": "final", "data": {"response": ..., "history": ...}}.
+
+    Agents can opt in to streaming in two ways:
+    - expose an async generator astream_agent(chat_history, query) yielding events
+    - accept an on_event(event, data) keyword in chat_agent, called from the
+      worker thread to report progress
+
+    Any other agent yields only the final event.
+
+    Args:
+        agent_name: Name of the agent folder (e.g., "deepresearch_optimus_alpha")
+        chat_history: List of message dicts with "role" and "content" keys, or None
+        query: User query string
+    """
+    entry = await registry.aget(agent_name)
+
+    # Ensure chat_history is a list, even if None is passed
+    history_to_pass = chat_history if chat_history is not None else []
+
+    with metrics.track_agent_request(agent_name, "stream"):
+        if entry.astream_agent is not None:
+            async for event in entry.astream_agent(history_to_pass, query):
+                yield event
+            return
+
+        if not entry.accepts_on_event:
+            response, updated_history = await _call_agent(entry, history_to_pass, query)
+            yield {"event": "final", "data": {"response": response, "history": updated_history}}
+            return
+
+        # Bridge progress callbacks from the worker thread onto the event loop
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def on_event(event, data):
+            # Threads cannot be interrupted, so a cancelled run stops at its next progress report
+            if cancelled.is_set():
+                raise AgentCancelled(f"Agent '{agent_name}' run was cancelled")
+            loop.call_soon_threadsafe(queue.put_nowait, {"event": event, "data": data})
+
+        future = loop.run_in_executor(
+            get_agent_executor(),
+            functools.partial(contextvars.copy_context().run, entry.chat_agent, history_to_pass, query, on_event=on_event)
+        )
+        try:
+            while not future.done():
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, future}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield getter.result()
+                else:
+                    getter.cancel()
+
+            # Events reported just before the run finished
+            while not queue.empty():
+                yield queue.get_nowait()
+
+            response, updated_history = future.result()
+        except Exception as e:
+            print(f"Error running agent '{agent_name}': {e}")
+            raise e
+        finally:
+            # The consumer went away (cancelled job, closed stream) before the run finished
+            if not future.done():
+                cancelled.set()
+                # Retrieve the AgentCancelled the worker thread will end with
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        yield {"event": "final", "data": {"response": response, "history": updated_history}}
+
 if __name__ == "__main__":
     print("Available agents:")
-    agents_dir = os.path.join(os.path.dirname(__file__), "agents")
-    agents = [d for d in os.listdir(agents_dir) 
-              if os.path.isdir(os.path.join(agents_dir, d)) and not d.startswith('__')]
+    agents = registry.names()
     for i, agent in enumerate(agents, 1):
         print(f"{i}. {agent}")
-    
+
     agent_name = input("\nEnter agent name or number: ")
-    
+
     # Convert number to agent name if needed
     if agent_name.isdigit() and 1 <= int(agent_name) <= len(agents):
         agent_name = agents[int(agent_name) - 1]
-    
+
     query = input("Enter your query: ")
-    
+
     print(f"\nRunning {agent_name} agent...\n")
     result, _ = run_agent(agent_name, [], query) # Pass empty list for initial history
-    
+
     print("\nAgent response:\n")
-    print(result)
\ No newline at end of file
+    print(result)
@@ -3,6 +3,7 @@ Simple LangGraph agent using DeepSeek-V3-0324 model with in-conversation memory.
 """
 import os
 import sys
+import asyncio
 from typing import Dict, List, Tuple, Any, Optional, TypedDict, Annotated
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
 from langgraph.graph import END, StateGraph
@@ -13,6 +14,10 @@ from dotenv import load_dotenv
 # Add the parent directory to sys.path to make imports work
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
+from agents.chat_deepseek_v3.context import ContextBuilder
+from llm_governor import GovernedModel, report_rate_limit
+from metrics import llm_metrics_callback
+
 # Load environment variables
 load_dotenv()
 
@@ -23,19 +28,42 @@ DEEPINFRA_API_KEY = os.getenv("DEEPINFRA_API_TOKEN")
 if not DEEPINFRA_API_KEY:
     raise ValueError("DEEPINFRA_API_TOKEN environment variable is not set. Please set it in the .env file.")
 
+# Prompt budget: older turns beyond it are folded into a rolling summary
+context_builder = ContextBuilder(
+    max_prompt_tokens=int(os.getenv("CHAT_CONTEXT_MAX_TOKENS", "8000")),
+    min_recent_messages=int(os.getenv("CHAT_CONTEXT_MIN_RECENT_MESSAGES", "4")),
+)
+
 # Define the state
 class AgentState(TypedDict):
     """State for the agent."""
     messages: Annotated[List[BaseMessage], add_messages]
 
-# Initialize the Chat model
-llm = ChatDeepInfra(
-    model="deepseek-ai/DeepSeek-V3-0324",
-    deepinfra_api_token=DEEPINFRA_API_KEY,
-    model_kwargs={
-        "temperature": 0.7,
-        "max_tokens": 1000
-    }
+MODEL = "deepseek-ai/DeepSeek-V3-0324"
+MAX_TOKENS = 1000
+
+class GovernedChatDeepInfra(ChatDeepInfra):
+    """ChatDeepInfra that reports 429s to the LLM governor (it calls DeepInfra with requests/aiohttp, not httpx)."""
+
+    def _handle_status(self, code: int, text: Any) -> None:
+        if code == 429:
+            report_rate_limit()
+        super()._handle_status(code, text)
+
+# Initialize the Chat model; every call, including summaries and batches, takes a "deepinfra" governor slot
+llm = GovernedModel(
+    GovernedChatDeepInfra(
+        model=MODEL,
+        deepinfra_api_token=DEEPINFRA_API_KEY,
+        model_kwargs={
+            "temperature": 0.7,
+            "max_tokens": MAX_TOKENS
+        },
+        callbacks=[llm_metrics_callback],
+    ),
+    "deepinfra",
+    MODEL,
+    max_tokens=MAX_TOKENS,
 )
 
 # Define the agent nodes
@@ -63,14 +91,8 @@ def build_agent_graph():
     # Set the entry point
     workflow.set_entry_point("chat")
 
-def chat_agent(chat_history, query):
-    """
-    Entry point for the meta agent.
-    chat_history: list of {"role": "user"/"assistant"/"system", "content": ...}
-    query: user input string
-    Returns: (result, updated_chat_history)
-    """
-    # Convert chat_history (list of dicts) to list of BaseMessage
+def _to_messages(chat_history, query):
+    """Convert chat_history (list of dicts) plus the new query to a list of BaseMessage."""
     messages = []
     for msg in chat_history:
         if msg["role"] == "user":
@@ -82,7 +104,21 @@ def chat_agent(chat_history, query):
     
     # Add the new user query
     messages.append(HumanMessage(content=query))
+    return messages
+
+def _to_history(messages):
+    """Convert messages back to list of dicts for meta agent compatibility."""
+    updated_history = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            updated_history.append({"role": "user", "content": msg.content})
+        elif isinstance(msg, AIMessage):
+            updated_history.append({"role": "assistant", "content": msg.content})
+        elif isinstance(msg, SystemMessage):
+            updated_history.append({"role": "system", "content": msg.content})
+    return updated_history
 
+def _print_request(messages):
     # --- DEBUGGING ---
     print("\n--- Messages sent to LLM ---")
     for msg in messages:
@@ -90,26 +126,109 @@ def chat_agent(chat_history, query):
     print("---------------------------\n")
     # --- END DEBUGGING ---
 
-    # Get response from LLM
-    response = llm.invoke(messages)
-    
+def _print_response(response):
     # --- DEBUGGING ---
     print("\n--- Response received from LLM ---")
     print(f"{type(response).__name__}: {response.content}")
     print("--------------------------------\n")
     # --- END DEBUGGING ---
 
+def chat_agent(chat_history, query):
+    """
+    Entry point for the meta agent.
+    chat_history: list of {"role": "user"/"assistant"/"system", "content": ...}
+    query: user input string
+    Returns: (result, updated_chat_history)
+    """
+    messages = _to_messages(chat_history, query)
+    prompt = context_builder.build(messages, llm)
+    _print_request(prompt)
+
+    # Get response from LLM
+    response = llm.invoke(prompt)
+    _print_response(response)
+
     # Add the response to the messages
     messages.append(response)
 
-    # Convert messages back to list of dicts for meta agent compatibility
-    updated_history = []
-    for msg in messages:
-        if isinstance(msg, HumanMessage):
-            updated_history.append({"role": "user", "content": msg.content})
-        elif isinstance(msg, AIMessage):
-            updated_history.append({"role": "assistant", "content": msg.content})
-        elif isinstance(msg, SystemMessage):
-            updated_history.append({"role": "system", "content": msg.content})
+    return response.content, _to_history(messages)
+
+async def achat_agent(chat_history, query):
+    """
+    Async entry point for the meta agent, awaited directly by the API.
+    Same contract as chat_agent, but does not block the event loop.
+    """
+    messages = _to_messages(chat_history, query)
+    prompt = await context_builder.abuild(messages, llm)
+    _print_request(prompt)
+
+    # Get response from LLM
+    response = await llm.ainvoke(prompt)
+    _print_response(response)
 
-    return response.content, updated_history
+    # Add the response to the messages
+    messages.append(response)
+
+    return response.content, _to_history(messages)
+
+async def astream_agent(chat_history, query):
+    """
+    Streaming entry point for the meta agent.
+    Yields {"event": "token", "data": {"content": ...}} for each chunk from the LLM,
+    then {"event": "final", "data": {"response": ..., "history": ...}}.
+    """
+    messages = _to_messages(chat_history, query)
+    prompt = await context_builder.abuild(messages, llm)
+    _print_request(prompt)
+
+    # Stream response from LLM
+    response = None
+    async for chunk in llm.astream(prompt):
+        response = chunk if response is None else response + chunk
+        if chunk.content:
+            yield {"event": "token", "data": {"content": chunk.content}}
+
+    response = AIMessage(content=response.content if response is not None else "")
+    _print_response(response)
+
+    # Add the response to the messages
+    messages.append(response)
+
+    yield {"event": "final", "data": {"response": response.content, "history": _to_history(messages)}}
+
+async def abatch_agent(requests, max_concurrency=16):
+    """
+    Batch entry point for independent requests (evaluations, back-fills).
+    requests: list of (chat_history, query)
+    Sends all prompts through llm.abatch with at most max_concurrency calls in flight.
+    Returns one (result, updated_chat_history) or Exception per request, in order.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def build(chat_history, query):
+        messages = _to_messages(chat_history, query)
+        # Long histories may need a summary call before the prompt fits the budget
+        async with semaphore:
+            return messages, await context_builder.abuild(messages, llm)
+
+    built = await asyncio.gather(*(build(h, q) for h, q in requests), return_exceptions=True)
+    ready = [i for i, item in enumerate(built) if not isinstance(item, BaseException)]
+    print(f"Batch: sending {len(ready)} prompts to the LLM ({len(requests) - len(ready)} failed to build)")
+
+    # Get responses from LLM
+    responses = await llm.abatch(
+        [built[i][1] for i in ready],
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+
+    results = list(built)
+    for i, response in zip(ready, responses):
+        if isinstance(response, BaseException):
+            results[i] = response
+            continue
+        messages = built[i][0]
+        # Add the response to the messages
+        messages.append(response)
+        results[i] = (response.content, _to_history(messages))
+    return results
@@ -0,0 +1,205 @@
+"""
+Token-budgeted prompt construction for the chat agent.
+
+System messages and the most recent turns are sent verbatim. Older turns are
+folded into a rolling summary, so the prompt stays within a fixed token budget
+however long the conversation gets. When the recent turns alone are over the
+budget, the oldest of them are truncated (the newest message last).
+
+Summaries are cached by a hash of the folded prefix. When more turns need
+folding, the summary of the longest cached prefix is extended with just the
+newly folded turns instead of being recomputed from scratch.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from token_counter import count_message_tokens, count_tokens, truncate_to_tokens
+
+SUMMARY_PREFIX = "Summary of the earlier part of this conversation:\n"
+
+TRUNCATION_MARKER = "... [truncated]"
+
+summarizer_instructions = """You maintain a running summary of a conversation between a user and an AI assistant.
+
+Update the existing summary with the new messages. Keep facts about the user (name, preferences, goals), decisions made, open questions and any details the assistant may need to refer back to. Drop pleasantries and repetition.
+
+Write the summary in plain prose, at most {max_words} words. Return only the summary."""
+
+summarizer_inputs = """<Existing summary>
+{summary}
+</Existing summary>
+
+<New messages>
+{transcript}
+</New messages>"""
+
+def _transcript(messages: List[BaseMessage]) -> str:
+    lines = []
+    for msg in messages:
+        role = "User" if isinstance(msg, HumanMessage) else "Assistant"
+        lines.append(f"{role}: {msg.content}")
+    return "\n\n".join(lines)
+
+class ContextBuilder:
+    """
+    Builds the message list sent to the LLM under a token budget.
+
+    Args:
+        max_prompt_tokens: Budget for the whole prompt (system, summary and turns)
+        min_recent_messages: Messages at the end of the conversation never folded into the summary (at least 1)
+        summary_max_tokens: Space reserved in the budget for the rolling summary
+        cache_size: Number of summaries kept in the cache
+    """
+
+    def __init__(self, max_prompt_tokens: int = 8000, min_recent_messages: int = 4,
+                 summary_max_tokens: int = 600, cache_size: int = 1024):
+        if min_recent_messages < 1:
+            raise ValueError("min_recent_messages must be at least 1, so the new query is never folded")
+        self.max_prompt_tokens = max_prompt_tokens
+        self.min_recent_messages = min_recent_messages
+        self.summary_max_tokens = summary_max_tokens
+        self.cache_size = cache_size
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Summary cache ---
+
+    @staticmethod
+    def _prefix_hashes(turns: List[BaseMessage]) -> List[str]:
+        """hashes[k] identifies turns[:k] (hashes[0] is the empty prefix)."""
+        hashes = [""]
+        digest = hashlib.sha256()
+        for msg in turns:
+            digest.update(type(msg).__name__.encode())
+            digest.update(b"\0")
+            digest.update(str(msg.content).encode("utf-8"))
+            digest.update(b"\0")
+            hashes.append(digest.copy().hexdigest())
+        return hashes
+
+    def _cached_summary(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+            return summary
+
+    def _store_summary(self, key: str, summary: str) -> None:
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    # --- Planning ---
+
+    def _plan(self, messages: List[BaseMessage]) -> Optional[Tuple[List[BaseMessage], List[BaseMessage], List[str], int, int]]:
+        """
+        Decide how many leading turns to fold.
+
+        Returns None if the messages already fit the budget, otherwise
+        (system, turns, prefix_hashes, fold_until, cached_until): turns[:fold_until]
+        are summarized, reusing the cached summary of turns[:cached_until]
+        (fold_until 0: no summary, the turns are only truncated).
+        """
+        if count_message_tokens(messages) <= self.max_prompt_tokens:
+            return None
+
+        system = [m for m in messages if isinstance(m, SystemMessage)]
+        turns = [m for m in messages if not isinstance(m, SystemMessage)]
+        available = self.max_prompt_tokens - count_message_tokens(system) - self.summary_max_tokens
+        max_fold = max(0, len(turns) - self.min_recent_messages)
+        hashes = self._prefix_hashes(turns)
+
+        # Token count of turns[k:] for every k
+        suffix_tokens = [0] * (len(turns) + 1)
+        for k in range(len(turns) - 1, -1, -1):
+            suffix_tokens[k] = suffix_tokens[k + 1] + count_message_tokens([turns[k]])
+
+        # Longest prefix that already has a summary
+        cached_until = 0
+        for k in range(max_fold, 0, -1):
+            if self._cached_summary(hashes[k]) is not None:
+                cached_until = k
+                break
+
+        # Reuse the cached fold point while the remaining turns still fit
+        if cached_until and suffix_tokens[cached_until] <= available:
+            return system, turns, hashes, cached_until, cached_until
+
+        # Otherwise fold until the remaining turns use half the space, leaving
+        # room for the next turns before another summary update is needed
+        fold_until = max_fold
+        for k in range(cached_until, max_fold + 1):
+            if suffix_tokens[k] <= available // 2:
+                fold_until = k
+                break
+
+        # Start the verbatim part on a user message so no answer loses its question
+        while fold_until > cached_until and not isinstance(turns[fold_until], HumanMessage):
+            fold_until -= 1
+        if fold_until <= cached_until:
+            # Nothing new can be folded; fall back to the cached summary, if any
+            return system, turns, hashes, cached_until, cached_until
+        return system, turns, hashes, fold_until, cached_until
+
+    def _summary_messages(self, previous: str, new_turns: List[BaseMessage]) -> List[BaseMessage]:
+        max_words = max(50, int(self.summary_max_tokens * 0.75))
+        return [
+            SystemMessage(content=summarizer_instructions.format(max_words=max_words)),
+            HumanMessage(content=summarizer_inputs.format(summary=previous or "(none)", transcript=_transcript(new_turns))),
+        ]
+
+    @staticmethod
+    def _truncate(recent: List[BaseMessage], available: int) -> List[BaseMessage]:
+        """Cut the oldest messages until recent fits in available tokens; the newest is cut last."""
+        recent = list(recent)
+        excess = count_message_tokens(recent) - available
+        for i, msg in enumerate(recent):
+            if excess <= 0:
+                break
+            content = str(msg.content)
+            content_tokens = count_tokens(content)
+            keep = content_tokens - excess - count_tokens(TRUNCATION_MARKER)
+            truncated = truncate_to_tokens(content, keep) + TRUNCATION_MARKER if keep > 0 else ""
+            recent[i] = msg.model_copy(update={"content": truncated})
+            excess -= content_tokens - count_tokens(truncated)
+        if excess > 0:
+            raise ValueError("The system messages leave no room for the conversation within max_prompt_tokens")
+        return recent
+
+    def _assemble(self, system, summary, recent) -> List[BaseMessage]:
+        head = system + ([SystemMessage(content=SUMMARY_PREFIX + summary)] if summary else [])
+        return head + self._truncate(recent, self.max_prompt_tokens - count_message_tokens(head))
+
+    # --- Public API ---
+
+    def build(self, messages: List[BaseMessage], llm) -> List[BaseMessage]:
+        """Return the messages to send, summarizing older turns with llm.invoke if needed."""
+        plan = self._plan(messages)
+        if plan is None:
+            return messages
+        system, turns, hashes, fold_until, cached_until = plan
+        summary = self._cached_summary(hashes[cached_until]) or ""
+        if fold_until > cached_until:
+            response = llm.invoke(self._summary_messages(summary, turns[cached_until:fold_until]))
+            summary = response.content
+            self._store_summary(hashes[fold_until], summary)
+        return self._assemble(system, summary, turns[fold_until:])
+
+    async def abuild(self, messages: List[BaseMessage], llm) -> List[BaseMessage]:
+        """Async counterpart of build, summarizing with llm.ainvoke."""
+        plan = self._plan(messages)
+        if plan is None:
+            return messages
+        system, turns, hashes, fold_until, cached_until = plan
+        summary = self._cached_summary(hashes[cached_until]) or ""
+        if fold_until > cached_until:
+            response = await llm.ainvoke(self._summary_messages(summary, turns[cached_until:fold_until]))
+            summary = response.content
+            self._store_summary(hashes[fold_until], summary)
+        return self._assemble(system, summary, turns[fold_until:])
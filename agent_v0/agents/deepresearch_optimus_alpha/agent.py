@@ -1,8 +1,12 @@
 import os
 import sys
-import json
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import BadRequestError, DefaultHttpxClient, OpenAI
 
 # Add the parent directory to sys.path to make imports work
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -11,7 +15,19 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 from agents.deepresearch_optimus_alpha.config import Configuration
 from agents.deepresearch_optimus_alpha.state import Section, Sections, SearchQuery, Queries, Feedback
 from agents.deepresearch_optimus_alpha.prompts import *
-from agents.deepresearch_optimus_alpha.utils import get_config_value, get_search_params, format_sections, smart_search
+from agents.deepresearch_optimus_alpha.utils import (get_config_value, get_search_params, format_sections, smart_search,
+                                                     search_results, SourcePool)
+from prompt_assembly import assemble_messages, conversation_turns
+from llm_cache import cache_key, get_llm_cache, should_cache
+from llm_governor import HTTPX_EVENT_HOOKS, estimate_tokens, get_governor
+from llm_retry import call_with_retries
+from report_cache import get_report_cache
+from structured_output import (StructuredOutputError, JSONStreamParser, json_schema_response_format, parse_json,
+                               validate)
+from run_checkpoints import get_run_checkpoints, run_key
+from metrics import (LLM_STRUCTURED_OUTPUT_FAILURES, RESEARCH_EARLY_STOPS, RESEARCH_RESUMES, RESEARCH_STEPS_RESUMED,
+                     record_llm_usage, track_llm_call)
+from token_counter import cached_prompt_tokens, context_budget, measure_prompt, track_token_usage
 
 load_dotenv()
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
@@ -21,200 +37,435 @@ if not OPENROUTER_API_KEY:
 client = OpenAI(
     base_url="https://openrouter.ai/api/v1",
     api_key=OPENROUTER_API_KEY,
+    # Report 429s to the LLM governor
+    http_client=DefaultHttpxClient(event_hooks=HTTPX_EVENT_HOOKS),
 )
 
-def call_llm(messages, model="openrouter/optimus-alpha", extra_headers=None):
-    completion = client.chat.completions.create(
-        extra_headers=extra_headers or {},
-        extra_body={},
-        model=model,
-        messages=messages
-    )
-    return completion.choices[0].message.content
-
-def parse_sections_from_llm_output(sections_text):
+def warmup():
+    """Open a pooled connection to OpenRouter so the first request skips TCP/TLS setup."""
     try:
-        # Find JSON content in the response
-        start = sections_text.find('{')
-        end = sections_text.rfind('}') + 1
-        if start == -1 or end == 0:
-            # If no JSON found, try to parse as a list of sections
-            lines = sections_text.strip().split('\n')
-            sections = []
-            for line in lines:
-                if line.strip():
-                    sections.append({
-                        "name": line.strip(),
-                        "description": "Auto-generated section",
-                        "research": True,
-                        "content": ""
-                    })
-            return sections
-        
-        json_str = sections_text[start:end]
-        data = json.loads(json_str)
-        return data.get("sections", [])
+        client.with_options(timeout=10, max_retries=0).models.list()
     except Exception as e:
-        print(f"Failed to parse sections from LLM output: {e}")
-        # Return a default section if parsing fails
-        return [{
-            "name": "Research Report",
-            "description": "Generated research on the topic",
-            "research": True,
-            "content": ""
-        }]
-
-def generate_report_plan(topic, config, memory=None):
-    system_instructions_query = report_planner_query_writer_instructions.format(
+        print(f"Warning: OpenRouter warm-up failed: {e}")
+
+# Models that rejected a JSON-schema response_format; their prompts ask for JSON anyway
+_json_schema_unsupported = set()
+
+class StreamInterrupted(Exception):
+    """A streamed reply failed after part of it was delivered. Not retried, since the part was already used."""
+
+def call_llm(messages, model="openrouter/optimus-alpha", extra_headers=None, temperature=None, force_cache=None,
+             step="llm", max_prompt_tokens=None, response_format=None, on_delta=None, parse=None):
+    """
+    One chat completion, through the LLM cache, the governor and retries.
+
+    response_format: e.g. a JSON-schema format; dropped for models that reject it
+    on_delta: called with each piece of the reply as it streams in
+    parse: applied to the reply before it is cached and returned; replies it rejects are not cached
+    """
+    measure_prompt(step, messages, max_prompt_tokens)
+    if model in _json_schema_unsupported:
+        response_format = None
+    params = {"temperature": temperature}
+    cache = get_llm_cache() if should_cache(temperature, force_cache) else None
+    key = cache_key(model, messages, params, response_format) if cache is not None else None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            if on_delta is not None:
+                on_delta(cached)
+            return parse(cached) if parse is not None else cached
+    governor = get_governor("openrouter", model)
+
+    def attempt(timeout):
+        # Each attempt takes its own governor slot, so backoff sleeps do not hold one. The call is timed from
+        # admission, as in v1; time queued for the slot is llm_governor_wait_seconds
+        with (governor.slot(estimate_tokens(messages)) if governor else nullcontext()) as slot, track_llm_call(model):
+            request = dict(
+                extra_headers=extra_headers or {},
+                # Ask OpenRouter for detailed usage, including prompt tokens served from the provider's cache
+                extra_body={"usage": {"include": True}},
+                model=model,
+                messages=messages,
+                **{k: v for k, v in params.items() if v is not None}
+            )
+            if response_format is not None:
+                request["response_format"] = response_format
+            completions = client.with_options(timeout=timeout, max_retries=0).chat.completions
+            if on_delta is None:
+                completion = completions.create(**request)
+                content, usage = completion.choices[0].message.content, completion.usage
+            else:
+                content, usage = _stream_completion(completions, request, on_delta)
+            if slot is not None and usage is not None:
+                slot.record_tokens(usage.total_tokens)
+        return content, usage
+
+    try:
+        content, usage = call_with_retries(attempt, "openrouter", model)
+    except BadRequestError:
+        if response_format is None:
+            raise
+        # JSON-schema mode is not available for every model; try once more without it
+        response_format = None
+        content, usage = call_with_retries(attempt, "openrouter", model)
+        print(f"Warning: {model} rejected the JSON-schema response format; relying on the prompt instead")
+        _json_schema_unsupported.add(model)
+    if usage is not None:
+        record_llm_usage(model, usage.prompt_tokens, usage.completion_tokens, cached_prompt_tokens(usage))
+    result = parse(content) if parse is not None else content
+    if cache is not None and content:
+        cache.set(key, content, model=model)
+    return result
+
+def _stream_completion(completions, request, on_delta):
+    """Stream a completion into on_delta; returns the whole content and the usage."""
+    parts, usage = [], None
+    with completions.create(stream=True, stream_options={"include_usage": True}, **request) as stream:
+        chunks = iter(stream)
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            except Exception as e:
+                if parts:
+                    raise StreamInterrupted(f"Reply stream failed after {sum(map(len, parts))} characters: {e}") from e
+                raise
+            if chunk.usage is not None:
+                usage = chunk.usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+    return "".join(parts), usage
+
+# Replies that are not valid JSON of the requested schema are asked for once more
+STRUCTURED_OUTPUT_ATTEMPTS = 2
+
+def parse_sections_from_llm_output(sections_text):
+    """Sections of a complete report plan reply; raises StructuredOutputError if it is not a valid plan."""
+    return validate(Sections, parse_json(sections_text))["sections"]
+
+# The grader sees the same prompt as the writer, but its request also carries the written section
+GRADER_RESERVE_TOKENS = 800
+
+def _step_messages(task, shared=None, conversation=None):
+    """
+    Messages for one pipeline step: the user's conversation, the artifact the step
+    works from (shared) and its task. Steps never see each other's prompts.
+    """
+    return assemble_messages(research_system_prompt, task, shared=shared, history=conversation)
+
+def _planner_messages(topic, config, source_str, conversation=None):
+    task = "Step: report_plan\n\n" + report_planner_inputs.format(
+        topic=topic,
+        report_organization=config.report_structure,
+        feedback=""
+    )
+    return _step_messages(task, source_material_block.format(context=source_str), conversation)
+
+def generate_report_plan(topic, config, conversation=None, on_section=None):
+    """
+    Plan the report's sections.
+
+    on_section: optional callback(index, section) called as soon as each section
+    has streamed in, before the rest of the plan has been generated
+    """
+    task = "Step: report_queries\n\n" + report_planner_query_inputs.format(
         topic=topic,
         report_organization=config.report_structure,
         number_of_queries=config.number_of_queries
     )
-    query_messages = memory[:] if memory else []
-    query_messages += [
-        {"role": "system", "content": system_instructions_query},
-        {"role": "user", "content": "Generate search queries that will help with planning the sections of the report."}
-    ]
-    queries_text = call_llm(query_messages)
+    query_messages = _step_messages(task, conversation=conversation)
+    # Queries, plans and grades are asked for at temperature 0, so repeated and resumed runs hit the LLM cache
+    queries_text = call_llm(query_messages, step="report_queries", max_prompt_tokens=config.max_prompt_tokens,
+                            temperature=0)
     queries = [q.strip() for q in queries_text.split("\n") if q.strip()]
     
-    source_str = smart_search(queries)
+    # Size the sources to what the planner prompt leaves of the budget
+    source_budget = context_budget(config.max_prompt_tokens, _planner_messages(topic, config, "", conversation))
+    source_str = smart_search(queries, max_tokens=source_budget)
     
-    system_instructions_sections = report_planner_instructions.format(
-        topic=topic,
-        report_organization=config.report_structure,
-        context=source_str,
-        feedback=""
-    )
-    planner_message = "Generate the sections of the report. Your response must include a 'sections' field containing a list of sections. Each section must have: name, description, research, and content fields."
-    section_messages = memory[:] if memory else []
-    section_messages += [
-        {"role": "system", "content": system_instructions_sections},
-        {"role": "user", "content": planner_message}
-    ]
-    sections_text = call_llm(section_messages)
-    sections = parse_sections_from_llm_output(sections_text)
-    return sections, memory
-
-def generate_section_queries(topic, section, config, memory=None):
-    system_instructions = query_writer_instructions.format(
+    section_messages = _planner_messages(topic, config, source_str, conversation)
+    sections = []
+
+    def on_delta(text):
+        for item in parser.feed(text):
+            sections.append(validate(Section, item))
+            if on_section is not None:
+                on_section(len(sections) - 1, sections[-1])
+
+    for attempt in range(STRUCTURED_OUTPUT_ATTEMPTS):
+        parser = JSONStreamParser(("sections",))
+        try:
+            call_llm(section_messages, step="report_plan", max_prompt_tokens=config.max_prompt_tokens, temperature=0,
+                     response_format=json_schema_response_format(Sections), on_delta=on_delta,
+                     parse=parse_sections_from_llm_output)
+            return sections
+        except StructuredOutputError as e:
+            LLM_STRUCTURED_OUTPUT_FAILURES.inc(step="report_plan")
+            if sections:
+                # Research has already started on these; keep the plan they belong to
+                print(f"Warning: report plan reply broke off after {len(sections)} sections, using those: {e}")
+                return sections
+            print(f"Warning: report plan reply is not a valid plan (attempt {attempt + 1}): {e}")
+    raise StructuredOutputError(f"No valid report plan after {STRUCTURED_OUTPUT_ATTEMPTS} attempts")
+
+def generate_section_queries(topic, section, config, conversation=None):
+    task = "Step: section_queries\n\n" + query_writer_inputs.format(
         topic=topic,
         section_topic=section["description"],
         number_of_queries=config.number_of_queries
     )
-    messages = memory[:] if memory else []
-    messages += [
-        {"role": "system", "content": system_instructions},
-        {"role": "user", "content": "Generate search queries on the provided topic."}
-    ]
-    queries_text = call_llm(messages)
-    return [q.strip() for q in queries_text.split("\n") if q.strip()], messages
-
-def write_section(topic, section, source_str, memory=None):
-    section_writer_inputs_formatted = section_writer_inputs.format(
+    messages = _step_messages(task, conversation=conversation)
+    queries_text = call_llm(messages, step="section_queries", max_prompt_tokens=config.max_prompt_tokens,
+                            temperature=0)
+    return [q.strip() for q in queries_text.split("\n") if q.strip()]
+
+def _section_writer_messages(topic, section, source_str, conversation=None):
+    task = "Step: write_section\n\n" + section_writer_inputs.format(
         topic=topic,
         section_name=section["name"],
         section_topic=section["description"],
-        context=source_str,
         section_content=section.get("content", "")
     )
-    messages = memory[:] if memory else []
-    messages += [
-        {"role": "system", "content": section_writer_instructions},
-        {"role": "user", "content": section_writer_inputs_formatted}
-    ]
-    content = call_llm(messages)
-    return content, messages
-
-def grade_section(topic, section, config, memory=None):
-    section_grader_instructions_formatted = section_grader_instructions.format(
+    # The writer and the grader share the sources as a cacheable prefix
+    return _step_messages(task, source_material_block.format(context=source_str), conversation)
+
+def write_section(topic, section, source_str, conversation=None, config=None):
+    config = config or Configuration()
+    messages = _section_writer_messages(topic, section, source_str, conversation)
+    return call_llm(messages, step="write_section", max_prompt_tokens=config.max_prompt_tokens)
+
+def _parse_feedback(text):
+    return validate(Feedback, parse_json(text))
+
+def grade_section(topic, section, config, conversation=None, source_str=None):
+    task = "Step: grade_section\n\n" + section_grader_inputs.format(
         topic=topic,
         section_topic=section["description"],
         section=section["content"],
         number_of_follow_up_queries=config.number_of_queries
     )
-    section_grader_message = (
-        "Grade the report and consider follow-up questions for missing information. "
-        "If the grade is 'pass', return empty strings for all follow-up queries. "
-        "If the grade is 'fail', provide specific search queries to gather missing information."
-    )
-    messages = memory[:] if memory else []
-    messages += [
-        {"role": "system", "content": section_grader_instructions_formatted},
-        {"role": "user", "content": section_grader_message}
-    ]
-    try:
-        output = call_llm(messages)
-        # Try to extract JSON
-        start = output.find('{')
-        end = output.rfind('}') + 1
-        if start >= 0 and end > 0:
-            feedback = json.loads(output[start:end])
-        else:
-            # If no JSON found, default to pass
-            feedback = {"grade": "pass", "follow_up_queries": []}
-    except Exception as e:
-        print(f"Failed to parse grading feedback: {e}")
-        feedback = {"grade": "pass", "follow_up_queries": []}
-    return feedback, messages
+    shared = source_material_block.format(context=source_str) if source_str is not None else None
+    messages = _step_messages(task, shared, conversation)
+    for attempt in range(STRUCTURED_OUTPUT_ATTEMPTS):
+        try:
+            feedback = call_llm(messages, step="grade_section", max_prompt_tokens=config.max_prompt_tokens,
+                                temperature=0, response_format=json_schema_response_format(Feedback), parse=_parse_feedback)
+            return feedback
+        except StructuredOutputError as e:
+            LLM_STRUCTURED_OUTPUT_FAILURES.inc(step="grade_section")
+            print(f"Warning: grade for '{section['name']}' is not valid feedback (attempt {attempt + 1}): {e}")
+    # Keep the section as written rather than failing the whole report
+    print(f"Warning: accepting '{section['name']}' ungraded")
+    return {"grade": "pass", "follow_up_queries": []}
 
-def write_final_section(topic, section, completed_report_sections, memory=None):
-    system_instructions = final_section_writer_instructions.format(
+def write_final_section(topic, section, completed_report_sections, conversation=None, config=None):
+    config = config or Configuration()
+    task = "Step: write_final_section\n\n" + final_section_writer_inputs.format(
         topic=topic,
         section_name=section["name"],
-        section_topic=section["description"],
-        context=completed_report_sections
+        section_topic=section["description"]
     )
-    messages = memory[:] if memory else []
-    messages += [
-        {"role": "system", "content": system_instructions},
-        {"role": "user", "content": "Generate a report section based on the provided sources."}
-    ]
-    content = call_llm(messages)
-    return content, messages
-
-def chat_agent(chat_history, query):
-    """Entry point for the meta agent"""
-    config = Configuration()
-    memory = chat_history.copy() if chat_history else []
-    memory.append({"role": "user", "content": query})
-    
-    # Run the research workflow
-    sections, memory = generate_report_plan(query, config, memory)
-    completed_sections = []
+    # Every final section is written from the same report content
+    messages = _step_messages(task, report_content_block.format(context=completed_report_sections), conversation)
+    return call_llm(messages, step="write_final_section", max_prompt_tokens=config.max_prompt_tokens)
+
+class SectionStopped(Exception):
+    """Raised in a section's worker when the run it belongs to has failed."""
+
+def _research_section(topic, section, config, conversation, emit):
+    """
+    Search, write and grade one section until it passes or max_search_depth is reached.
+
+    Only the first iteration asks for search queries; later ones search the
+    grader's follow-up queries. Sources accumulate across iterations, and the
+    loop stops early once a search adds no new sources, since a rewrite would
+    see the same material.
+    """
+    pool = SourcePool()
+    queries = generate_section_queries(topic, section, config, conversation)
     
-    # Process research-required sections
-    for section in sections:
-        if section.get("research", False):
-            search_iterations = 0
-            max_depth = config.max_search_depth
-            
-            while search_iterations < max_depth:
-                queries, memory = generate_section_queries(query, section, config, memory)
-                sources = smart_search(queries)
-                content, memory = write_section(query, section, sources, memory)
-                section["content"] = content
-                feedback, memory = grade_section(query, section, config, memory)
-                
-                if feedback.get("grade") == "pass":
-                    break
-                else:
-                    queries = [q["search_query"] if isinstance(q, dict) and "search_query" in q else q 
-                              for q in feedback.get("follow_up_queries", [])]
-                search_iterations += 1
-            completed_sections.append(section)
+    for search_iterations in range(config.max_search_depth):
+        queries = pool.new_queries(queries)
+        emit("search_started", {"section": section["name"], "iteration": search_iterations, "queries": queries})
+        new_sources = pool.add(search_results(queries)) if queries else 0
+        # Sized to what the writer prompt, including the section's current content, leaves
+        source_budget = context_budget(config.max_prompt_tokens - GRADER_RESERVE_TOKENS,
+                                       _section_writer_messages(topic, section, "", conversation))
+        sources = pool.format(source_budget)
+        emit("search_finished", {"section": section["name"], "iteration": search_iterations,
+                                 "source_chars": len(sources), "new_sources": new_sources})
+        if search_iterations > 0 and not new_sources:
+            RESEARCH_EARLY_STOPS.inc(agent="deepresearch_optimus_alpha")
+            break
+        section["content"] = write_section(topic, section, sources, conversation, config)
+        emit("section_written", {"section": section["name"], "content": section["content"]})
+        # The writer and grader prompts share the conversation and the sources as a cached prefix
+        feedback = grade_section(topic, section, config, conversation, sources)
+        
+        if feedback.get("grade") == "pass":
+            emit("section_graded", {"section": section["name"], "grade": "pass", "follow_up_queries": []})
+            break
+        queries = [q["search_query"] if isinstance(q, dict) else q for q in feedback.get("follow_up_queries", [])]
+        queries = [q for q in queries if q]
+        emit("section_graded", {"section": section["name"], "grade": feedback.get("grade", "fail"), "follow_up_queries": queries})
+
+def _section_summary(section):
+    return {
+        "name": section.get("name", ""),
+        "description": section.get("description", ""),
+        "research": section.get("research", False),
+    }
+
+REPORT_OFFER_PREFIX = "I already have a recent report on a similar topic"
+
+def _offered_topic(chat_history, query):
+    """Topic of the cached-report offer this query answers ("cached" or "fresh"), or None."""
+    if query.strip().lower() not in ("cached", "fresh") or not chat_history or len(chat_history) < 2:
+        return None
+    offer, asked = chat_history[-1], chat_history[-2]
+    if offer.get("role") != "assistant" or not offer.get("content", "").startswith(REPORT_OFFER_PREFIX):
+        return None
+    return asked.get("content")
+
+def _report_offer(match, topic):
+    hours = (time.time() - match["created_at"]) / 3600
+    age = f"{hours:.0f} hours ago" if hours >= 1 else "less than an hour ago"
+    return (f'{REPORT_OFFER_PREFIX} ("{match["topic"]}", written {age}). '
+            f'Reply "cached" to get it, or "fresh" to research "{topic}" again.')
+
+def chat_agent(chat_history, query, on_event=None):
+    """
+    Entry point for the meta agent.
+
+    on_event: optional callback(event, data) reporting pipeline progress
+    (report_cache_hit, run_resumed, section_planned, plan_ready, search_started,
+    search_finished, section_written, section_graded) and finally the run's token_usage.
+    A section's research starts as soon as it is planned, so its events can
+    come before plan_ready.
+    """
+    emit = on_event or (lambda event, data: None)
+    with track_token_usage() as usage:
+        report, history = _run_chat_agent(chat_history, query, emit)
+    emit("token_usage", usage.as_dict())
+    return report, history
+
+def _run_chat_agent(chat_history, query, emit):
+    config = Configuration()
+    # Saved for the next turn: the user and assistant turns only
+    history = conversation_turns(chat_history) + [{"role": "user", "content": query}]
+    checkpoints = get_run_checkpoints()
+    checkpoint_key = run_key(chat_history or [], query)
+
+    # Serve a fresh report on a near-duplicate topic instead of researching it again. Only a
+    # conversation's first message is a topic on its own; a follow-up depends on the turns before it.
+    report_cache = get_report_cache()
+    offered_topic = _offered_topic(chat_history, query) if report_cache is not None else None
+    standalone = report_cache is not None and (offered_topic is not None or not conversation_turns(chat_history))
+    use_report_cache = standalone
+    if offered_topic is not None:
+        use_report_cache = query.strip().lower() == "cached"
+        query = offered_topic
+    if use_report_cache:
+        match = report_cache.lookup(query)
+        if match is not None:
+            emit("report_cache_hit", {"topic": match["topic"], "similarity": match["similarity"],
+                                      "created_at": match["created_at"]})
+            if offered_topic is None and os.getenv("REPORT_CACHE_MODE", "offer").lower() == "offer":
+                response = _report_offer(match, query)
+            else:
+                response = match["report"]
+            history.append({"role": "assistant", "content": response})
+            return response, history
     
-    # Process non-research sections
-    completed_content = format_sections(completed_sections)
-    for section in sections:
-        if not section.get("research", False):
-            content, memory = write_final_section(query, section, completed_content, memory)
-            section["content"] = content
-            completed_sections.append(section)
+    # What every step sees of the conversation, bounded so long conversations do not crowd out sources
+    conversation = conversation_turns(history, config.max_history_tokens)
+    lock = threading.Lock()
+    done = set()
+    plan_complete = False
+
+    def save_checkpoint():
+        # Sections researched while the plan is still streaming are saved with the complete plan
+        if checkpoints is not None and plan_complete:
+            checkpoints.save(checkpoint_key, {"sections": sections, "done": sorted(done)})
+
+    # Sections run on worker threads: research sections as soon as the plan has streamed them, at most
+    # max_concurrent_sections at a time, and then the final sections. Sections are independent of each
+    # other and joined in plan order, so the report does not depend on timing.
+    workers = ThreadPoolExecutor(max_workers=max(1, int(config.max_concurrent_sections)),
+                                 thread_name_prefix="section")
+    stopped = threading.Event()
+    branches = []
+
+    def section_emit(event, data):
+        if stopped.is_set():
+            raise SectionStopped()
+        emit(event, data)
+
+    def research(index, section):
+        _research_section(query, section, config, conversation, section_emit)
+        with lock:
+            done.add(index)
+            save_checkpoint()
+
+    def write_final(index, section, completed_content):
+        section["content"] = write_final_section(query, section, completed_content, conversation, config)
+        section_emit("section_written", {"section": section["name"], "content": section["content"]})
+        with lock:
+            done.add(index)
+            save_checkpoint()
+
+    def start_research(index, section):
+        if section.get("research", False) and index not in done:
+            branches.append(workers.submit(contextvars.copy_context().run, research, index, section))
+
+    try:
+        # Resume after the last completed step of an earlier attempt of this run
+        state = checkpoints.load(checkpoint_key) if checkpoints is not None else None
+        if state is not None:
+            sections, done = state["sections"], set(state["done"])
+            plan_complete = True
+            RESEARCH_RESUMES.inc(agent="deepresearch_optimus_alpha")
+            RESEARCH_STEPS_RESUMED.inc(1 + len(done), agent="deepresearch_optimus_alpha")
+            emit("run_resumed", {"completed_sections": [sections[i]["name"] for i in sorted(done)]})
+            for index, section in enumerate(sections):
+                start_research(index, section)
+        else:
+            def on_section(index, section):
+                emit("section_planned", {"index": index, "section": _section_summary(section)})
+                start_research(index, section)
+
+            # Run the research workflow
+            sections = generate_report_plan(query, config, conversation, on_section=on_section)
+            with lock:
+                plan_complete = True
+                save_checkpoint()
+        emit("plan_ready", {"sections": [_section_summary(s) for s in sections]})
+        for branch in branches:
+            branch.result()
+
+        # Process non-research sections, all from the same research results
+        completed_content = format_sections([s for s in sections if s.get("research", False)])
+        branches = [workers.submit(contextvars.copy_context().run, write_final, index, section, completed_content)
+                    for index, section in enumerate(sections)
+                    if not section.get("research", False) and index not in done]
+        for branch in branches:
+            branch.result()
+    finally:
+        stopped.set()
+        workers.shutdown(wait=False, cancel_futures=True)
     
     # Generate final report
     report = "\n\n".join([s.get("content", "") for s in sections])
+    if checkpoints is not None:
+        checkpoints.delete(checkpoint_key)
     
+    if standalone and report:
+        report_cache.put(query, report)
+
     # Update chat history
-    memory.append({"role": "assistant", "content": report})
-    return report, memory
+    history.append({"role": "assistant", "content": report})
+    return report, history
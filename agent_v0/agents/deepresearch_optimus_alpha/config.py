@@ -37,6 +37,9 @@ class Configuration:
     writer_model: str = "openrouter/optimus-alpha" # Use optimus-alpha as model
     search_api: SearchAPI = SearchAPI.DUCKDUCKGO # Default to DuckDuckGo for simplicity
     search_api_config: Optional[Dict[str, Any]] = None 
+    max_prompt_tokens: int = 16000 # Per-call prompt budget; the lowest-value sources are trimmed to fit
+    max_history_tokens: int = 4000 # Conversation turns sent with each step; the oldest are dropped past this
+    max_concurrent_sections: int = int(os.getenv("MAX_CONCURRENT_SECTIONS", "4")) # Sections researched (or written) at once
 
     @classmethod
     def from_dict(
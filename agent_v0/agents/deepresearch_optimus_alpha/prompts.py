@@ -1,15 +1,7 @@
-report_planner_query_writer_instructions = """You are performing research for a report. 
-
-<Report topic>
-{topic}
-</Report topic>
-
-<Report organization>
-{report_organization}
-</Report organization>
+report_planner_query_writer_instructions = """You are performing research for a report. The report topic, the report organization and the number of queries are given with the request.
 
 <Task>
-Your goal is to generate {number_of_queries} web search queries that will help gather information for planning the report sections. 
+Your goal is to generate the requested number of web search queries that will help gather information for planning the report sections. 
 
 The queries should:
 
@@ -24,22 +16,7 @@ Call the Queries tool
 </Format>
 """
 
-report_planner_instructions = """I want a plan for a report that is concise and focused.
-
-<Report topic>
-The topic of the report is:
-{topic}
-</Report topic>
-
-<Report organization>
-The report should follow this organization: 
-{report_organization}
-</Report organization>
-
-<Context>
-Here is context to use to plan the sections of the report: 
-{context}
-</Context>
+report_planner_instructions = """I want a plan for a report that is concise and focused. The report topic and the organization the report should follow are given with the request, and the source material is context to use to plan the sections of the report.
 
 <Task>
 Generate a list of sections for the report. Your plan should be tight and focused with NO overlapping sections or unnecessary filler. 
@@ -63,31 +40,18 @@ Integration guidelines:
 - Ensure each section has a distinct purpose with no content overlap
 - Combine related concepts rather than separating them
 
-Before submitting, review your structure to ensure it has no redundant sections and follows a logical flow.
+Before submitting, review your structure to ensure it has no redundant sections and follows a logical flow. If the request includes feedback on the report structure from review, address it.
 </Task>
 
-<Feedback>
-Here is feedback on the report structure from review (if any):
-{feedback}
-</Feedback>
-
 <Format>
 Call the Sections tool 
 </Format>
 """
 
-query_writer_instructions = """You are an expert technical writer crafting targeted web search queries that will gather comprehensive information for writing a technical report section.
-
-<Report topic>
-{topic}
-</Report topic>
-
-<Section topic>
-{section_topic}
-</Section topic>
+query_writer_instructions = """You are an expert technical writer crafting targeted web search queries that will gather comprehensive information for writing a technical report section. The report topic, the section topic and the number of queries are given with the request.
 
 <Task>
-Your goal is to generate {number_of_queries} search queries that will help gather comprehensive information above the section topic. 
+Your goal is to generate the requested number of search queries that will help gather comprehensive information above the section topic. 
 
 The queries should:
 
@@ -137,46 +101,13 @@ section_writer_instructions = """Write one section of a research report.
 </Final Check>
 """
 
-section_writer_inputs = """ 
-<Report topic>
-{topic}
-</Report topic>
-
-<Section name>
-{section_name}
-</Section name>
-
-<Section topic>
-{section_topic}
-</Section topic>
-
-<Existing section content (if populated)>
-{section_content}
-</Existing section content>
-
-<Source material>
-{context}
-</Source material>
-"""
-
-section_grader_instructions = """Review a report section relative to the specified topic:
 
-<Report topic>
-{topic}
-</Report topic>
-
-<section topic>
-{section_topic}
-</section topic>
-
-<section content>
-{section}
-</section content>
+section_grader_instructions = """Review a report section relative to the specified topic. The report topic, the section topic, the section content and the number of follow-up queries are given with the request, together with the source material the section was written from.
 
 <task>
 Evaluate whether the section content adequately addresses the section topic.
 
-If the section content does not adequately address the section topic, generate {number_of_follow_up_queries} follow-up search queries to gather missing information.
+If the section content does not adequately address the section topic, generate the requested number of follow-up search queries to gather missing information.
 </task>
 
 <format>
@@ -191,23 +122,7 @@ follow_up_queries: List[SearchQuery] = Field(
 </format>
 """
 
-final_section_writer_instructions = """You are an expert technical writer crafting a section that synthesizes information from the rest of the report.
-
-<Report topic>
-{topic}
-</Report topic>
-
-<Section name>
-{section_name}
-</Section name>
-
-<Section topic> 
-{section_topic}
-</Section topic>
-
-<Available report content>
-{context}
-</Available report content>
+final_section_writer_instructions = """You are an expert technical writer crafting a section that synthesizes information from the rest of the report. The report topic, the section name and the section topic are given with the request, together with the available report content.
 
 <Task>
 1. Section-Specific Approach:
@@ -249,4 +164,135 @@ For Conclusion/Summary:
 - For conclusion: 100-150 word limit, ## for section title, only ONE structural element at most, no sources section
 - Markdown format
 - Do not include word count or any preamble in your response
-</Quality Checks>"""
\ No newline at end of file
+</Quality Checks>"""
+
+# --- Prompt assembly ---
+#
+# Providers cache prompts by prefix, so every research call is laid out from
+# the most to the least stable part (see prompt_assembly.py):
+#   1. research_system_prompt: the instructions of every step, byte-identical in all calls
+#   2. the conversation history
+#   3. a shared block (source material, or the report written so far) used by several calls
+#   4. the step and its inputs
+
+research_system_prompt = """You are a research assistant writing a report in several steps. Each request names one step and gives its inputs; follow only the instructions of that step.
+
+<Step report_queries>
+""" + report_planner_query_writer_instructions + """</Step report_queries>
+
+<Step report_plan>
+""" + report_planner_instructions + """</Step report_plan>
+
+<Step section_queries>
+""" + query_writer_instructions + """</Step section_queries>
+
+<Step write_section>
+""" + section_writer_instructions + """</Step write_section>
+
+<Step grade_section>
+""" + section_grader_instructions + """</Step grade_section>
+
+<Step write_final_section>
+""" + final_section_writer_instructions + """
+</Step write_final_section>
+"""
+
+source_material_block = """<Source material>
+{context}
+</Source material>"""
+
+report_content_block = """<Available report content>
+{context}
+</Available report content>"""
+
+report_planner_query_inputs = """<Report topic>
+{topic}
+</Report topic>
+
+<Report organization>
+{report_organization}
+</Report organization>
+
+<Number of queries>
+{number_of_queries}
+</Number of queries>
+
+Generate search queries that will help with planning the sections of the report."""
+
+report_planner_inputs = """<Report topic>
+{topic}
+</Report topic>
+
+<Report organization>
+{report_organization}
+</Report organization>
+
+<Feedback>
+{feedback}
+</Feedback>
+
+Generate the sections of the report. Your response must include a 'sections' field containing a list of sections. Each section must have: name, description, research, and content fields."""
+
+query_writer_inputs = """<Report topic>
+{topic}
+</Report topic>
+
+<Section topic>
+{section_topic}
+</Section topic>
+
+<Number of queries>
+{number_of_queries}
+</Number of queries>
+
+Generate search queries on the provided topic."""
+
+section_writer_inputs = """<Report topic>
+{topic}
+</Report topic>
+
+<Section name>
+{section_name}
+</Section name>
+
+<Section topic>
+{section_topic}
+</Section topic>
+
+<Existing section content (if populated)>
+{section_content}
+</Existing section content>
+
+Write the section from the source material above."""
+
+section_grader_inputs = """<Report topic>
+{topic}
+</Report topic>
+
+<section topic>
+{section_topic}
+</section topic>
+
+<section content>
+{section}
+</section content>
+
+<Number of follow-up queries>
+{number_of_follow_up_queries}
+</Number of follow-up queries>
+
+Grade the report and consider follow-up questions for missing information. If the grade is 'pass', return empty strings for all follow-up queries. If the grade is 'fail', provide specific search queries to gather missing information."""
+
+final_section_writer_inputs = """<Report topic>
+{topic}
+</Report topic>
+
+<Section name>
+{section_name}
+</Section name>
+
+<Section topic>
+{section_topic}
+</Section topic>
+
+Generate a report section based on the available report content above."""
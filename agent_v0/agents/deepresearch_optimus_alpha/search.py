@@ -0,0 +1,168 @@
+"""
+Async search client for deepresearch_optimus_alpha.
+
+The research loop runs on worker threads, and used to search one query after
+another: a blocking requests.post per Tavily query with a new connection each
+time, or one DDGS walking its queries in turn. A search took the sum of its
+queries' latencies, and one slow query held up the whole section.
+
+SearchClient runs every search on one background event loop shared by the
+process:
+
+- Tavily requests go through one pooled httpx.AsyncClient, so connections stay
+  open across queries, sections and runs
+- the queries of a batch are sent concurrently, with at most the backend's
+  concurrency limit in flight across the process
+- every query has its own timeout; a query that runs out of time becomes an
+  error result, and the batch returns the other queries' results without
+  waiting for it
+- with SEARCH_CACHE set, queries answered recently are served from the
+  shared search cache (search_cache.py) and only the rest are sent
+
+DuckDuckGo has no async API, so its queries run on a small thread pool, with
+one DDGS session per thread.
+
+Settings:
+    SEARCH_CONCURRENCY: JSON object of queries in flight per backend,
+        default {"tavily": 8, "duckduckgo": 2}
+    SEARCH_QUERY_TIMEOUT: seconds one query may take, including its wait for
+        a concurrency slot (default 10)
+"""
+import os
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from metrics import SEARCH_QUERY_TIMEOUTS, record_search_results
+from search_cache import get_search_cache
+
+try:
+    from duckduckgo_search import DDGS
+    DUCKDUCKGO_AVAILABLE = True
+except ImportError:
+    DUCKDUCKGO_AVAILABLE = False
+
+TAVILY_URL = "https://api.tavily.com/search"
+
+DEFAULT_CONCURRENCY = {"tavily": 8, "duckduckgo": 2}
+
+ERROR_TITLES = {"tavily": "[Tavily Error]", "duckduckgo": "[DuckDuckGo Error]"}
+
+def _concurrency_from_env() -> Dict[str, int]:
+    limits = dict(DEFAULT_CONCURRENCY)
+    limits.update(json.loads(os.getenv("SEARCH_CONCURRENCY", "") or "{}"))
+    return {backend: max(1, int(limit)) for backend, limit in limits.items()}
+
+class SearchClient:
+    """
+    Concurrent searches on a background event loop.
+
+    Args:
+        concurrency: queries in flight per backend (default from SEARCH_CONCURRENCY)
+        query_timeout: seconds per query (default from SEARCH_QUERY_TIMEOUT)
+        transport: httpx transport for the pooled client (e.g. a mock in benchmarks)
+    """
+
+    def __init__(self, concurrency: Optional[Dict[str, int]] = None, query_timeout: Optional[float] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.concurrency = concurrency or _concurrency_from_env()
+        self.query_timeout = float(query_timeout or os.getenv("SEARCH_QUERY_TIMEOUT", "10"))
+        self._transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._ddgs_threads = ThreadPoolExecutor(max_workers=self.concurrency.get("duckduckgo", 2),
+                                                thread_name_prefix="duckduckgo")
+        self._ddgs_local = threading.local()
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="search-loop", daemon=True).start()
+
+    def search(self, backend: str, queries: List[str], max_results: int = 5) -> List[Dict[str, Any]]:
+        """Run a batch of queries and wait for it; results are dicts with query, title, url, content and rank."""
+        return asyncio.run_coroutine_threadsafe(self._search(backend, queries, max_results), self._loop).result()
+
+    async def asearch(self, backend: str, queries: List[str], max_results: int = 5) -> List[Dict[str, Any]]:
+        """search() for callers on another event loop."""
+        future = asyncio.run_coroutine_threadsafe(self._search(backend, queries, max_results), self._loop)
+        return await asyncio.wrap_future(future)
+
+    async def _search(self, backend: str, queries: List[str], max_results: int) -> List[Dict[str, Any]]:
+        query_backend = {"tavily": self._tavily_query, "duckduckgo": self._duckduckgo_query}[backend]
+        limit = self._limits.setdefault(backend, asyncio.Semaphore(self.concurrency.get(backend, 4)))
+
+        async def run(query):
+            async with limit:
+                return await query_backend(query, max_results)
+
+        async def one(query):
+            try:
+                return await asyncio.wait_for(run(query), self.query_timeout)
+            except asyncio.TimeoutError:
+                SEARCH_QUERY_TIMEOUTS.inc(backend=backend)
+                return [self._error(backend, query, f"Timed out after {self.query_timeout:g}s")]
+            except Exception as e:
+                return [self._error(backend, query, f"Error: {e}")]
+
+        async def run_all(batch):
+            return await asyncio.gather(*(one(query) for query in batch))
+
+        cache = get_search_cache()
+        if cache is None:
+            batches = await run_all(queries)
+        else:
+            batches = await cache.fetch(backend, queries, {"max_results": max_results}, run_all,
+                                        negative=lambda results: not any(res["url"] for res in results))
+            # A cached result may have been found for another spelling of the query
+            batches = [[{**res, "query": query} for res in batch] for query, batch in zip(queries, batches)]
+        results = [res for batch in batches for res in batch]
+        errors = sum(1 for res in results if not res["url"])
+        record_search_results(backend, results=len(results) - errors, errors=errors)
+        return results
+
+    @staticmethod
+    def _error(backend: str, query: str, message: str) -> Dict[str, Any]:
+        return {"query": query, "title": ERROR_TITLES.get(backend, "[Search Error]"), "url": "", "content": message}
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            limit = self.concurrency.get("tavily", 8)
+            self._http = httpx.AsyncClient(
+                transport=self._transport,
+                limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+                timeout=self.query_timeout,
+            )
+        return self._http
+
+    async def _tavily_query(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        response = await self._client().post(TAVILY_URL, json={
+            "api_key": os.getenv("TAVILY_API_KEY"), "query": query, "max_results": max_results, "include_answer": False})
+        response.raise_for_status()
+        return [
+            {"query": query, "rank": rank, "title": res.get("title", ""), "url": res.get("url", ""),
+             "content": res.get("content", "")}
+            for rank, res in enumerate(response.json().get("results", []))
+        ]
+
+    def _ddgs(self):
+        ddgs = getattr(self._ddgs_local, "ddgs", None)
+        if ddgs is None:
+            ddgs = self._ddgs_local.ddgs = DDGS(timeout=int(self.query_timeout))
+        return ddgs
+
+    async def _duckduckgo_query(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        results = await self._loop.run_in_executor(
+            self._ddgs_threads, lambda: self._ddgs().text(query, max_results=max_results))
+        return [
+            {"query": query, "rank": rank, "title": res.get("title", ""), "url": res.get("href", ""),
+             "content": res.get("body", "")}
+            for rank, res in enumerate(results or [])
+        ]
+
+@lru_cache(maxsize=None)
+def get_search_client() -> SearchClient:
+    """The process-wide search client."""
+    return SearchClient()
@@ -13,6 +13,7 @@ class Section(BaseModel):
         description="Whether to perform web research for this section of the report."
     )
     content: str = Field(
+        "",
         description="The content of the section."
     )   
 
@@ -1,6 +1,11 @@
 import os
+from urllib.parse import urlsplit, urlunsplit
 from typing import Optional, Dict, Any, List
 
+from agents.deepresearch_optimus_alpha.search import DUCKDUCKGO_AVAILABLE, get_search_client
+from metrics import track_search
+from token_counter import count_tokens, truncate_to_tokens
+
 def get_config_value(value):
     return value if isinstance(value, str) else value.value
 
@@ -39,87 +44,110 @@ Content:
 """
     return formatted_str
 
-# --- Search logic as before ---
-
-try:
-    import requests
-    TAVILY_AVAILABLE = True
-except ImportError:
-    TAVILY_AVAILABLE = False
-
-try:
-    from duckduckgo_search import DDGS
-    from duckduckgo_search.exceptions import DuckDuckGoSearchException
-    DUCKDUCKGO_AVAILABLE = True
-except ImportError:
-    DUCKDUCKGO_AVAILABLE = False
-
-def tavily_search(queries: List[str], max_results: int = 5) -> str:
-    api_key = os.getenv("TAVILY_API_KEY")
-    if not api_key:
-        return "[Tavily API key not found. Please add TAVILY_API_KEY to your .env file.]"
-    results = []
-    for query in queries:
-        try:
-            response = requests.post(
-                "https://api.tavily.com/search",
-                json={"api_key": api_key, "query": query, "max_results": max_results, "include_answer": False},
-                timeout=15
-            )
-            response.raise_for_status()
-            data = response.json()
-            for res in data.get("results", []):
-                results.append({
-                    "query": query,
-                    "title": res.get("title", ""),
-                    "url": res.get("url", ""),
-                    "content": res.get("content", "")
-                })
-        except Exception as e:
-            results.append({
-                "query": query,
-                "title": "[Tavily Error]",
-                "url": "",
-                "content": f"Error: {e}"
-            })
-    formatted = ""
-    for i, res in enumerate(results, 1):
-        formatted += f"{'='*80}\n"
-        formatted += f"Query: {res['query']}\nTitle: {res['title']}\nURL: {res['url']}\nContent: {res['content']}\n"
-        formatted += f"{'='*80}\n\n"
+def format_search_results(results: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> str:
+    """
+    Format search results (dicts with query, title, url, content and rank) as one string.
+
+    With max_tokens, the lowest-value results are dropped first until the string
+    fits: errors, then the lowest-ranked results of each query.
+    """
+    blocks = [
+        f"{'='*80}\n"
+        f"Query: {res['query']}\nTitle: {res['title']}\nURL: {res['url']}\nContent: {res['content']}\n"
+        f"{'='*80}\n\n"
+        for res in results
+    ]
+    if max_tokens is None:
+        return "".join(blocks)
+    total = sum(count_tokens(block) for block in blocks)
+    lowest_first = sorted(range(len(results)), key=lambda i: (bool(results[i]["url"]), -results[i].get("rank", 0)))
+    omitted = 0
+    for i in lowest_first[:-1]:
+        if total <= max_tokens:
+            break
+        total -= count_tokens(blocks[i])
+        blocks[i] = None
+        omitted += 1
+    kept = [block for block in blocks if block is not None]
+    if total > max_tokens and kept:
+        # A single result still over budget
+        kept[0] = truncate_to_tokens(kept[0], max_tokens) + "... [truncated]"
+    formatted = "".join(kept)
+    if omitted:
+        formatted += f"[{omitted} lower-ranked results omitted to fit the context budget]\n"
     return formatted
 
-def duckduckgo_search(queries: List[str], max_results: int = 5) -> str:
+# --- Search backends (see search.py) ---
+
+def tavily_search(queries: List[str], max_results: int = 5) -> List[Dict[str, Any]]:
+    if not os.getenv("TAVILY_API_KEY"):
+        return [{"query": "", "title": "[Tavily Error]", "url": "",
+                 "content": "[Tavily API key not found. Please add TAVILY_API_KEY to your .env file.]"}]
+    return get_search_client().search("tavily", queries, max_results)
+
+def duckduckgo_search(queries: List[str], max_results: int = 5) -> List[Dict[str, Any]]:
     if not DUCKDUCKGO_AVAILABLE:
-        return "[duckduckgo_search package not installed.]"
-    ddgs = DDGS()
-    results = []
-    for query in queries:
-        try:
-            search_results = ddgs.text(query, max_results=max_results)
-            for res in search_results:
-                results.append({
-                    "query": query,
-                    "title": res.get("title", ""),
-                    "url": res.get("href", ""),
-                    "content": res.get("body", "")
-                })
-        except DuckDuckGoSearchException as e:
-            results.append({
-                "query": query,
-                "title": "[DuckDuckGo Rate Limited]",
-                "url": "",
-                "content": f"Rate limit or error: {e}"
-            })
-    formatted = ""
-    for i, res in enumerate(results, 1):
-        formatted += f"{'='*80}\n"
-        formatted += f"Query: {res['query']}\nTitle: {res['title']}\nURL: {res['url']}\nContent: {res['content']}\n"
-        formatted += f"{'='*80}\n\n"
-    return formatted
+        return [{"query": "", "title": "[DuckDuckGo Error]", "url": "", "content": "[duckduckgo_search package not installed.]"}]
+    return get_search_client().search("duckduckgo", queries, max_results)
 
-def smart_search(queries: List[str], max_results: int = 5) -> str:
+def search_results(queries: List[str], max_results: int = 5) -> List[Dict[str, Any]]:
+    """Search with Tavily if configured, else DuckDuckGo; results are dicts with query, title, url, content and rank."""
     if os.getenv("TAVILY_API_KEY"):
-        return tavily_search(queries, max_results)
+        with track_search("tavily"):
+            return tavily_search(queries, max_results)
     else:
-        return duckduckgo_search(queries, max_results)
\ No newline at end of file
+        with track_search("duckduckgo"):
+            return duckduckgo_search(queries, max_results)
+
+def smart_search(queries: List[str], max_results: int = 5, max_tokens: Optional[int] = None) -> str:
+    """search_results formatted as one string; max_tokens bounds the formatted results."""
+    return format_search_results(search_results(queries, max_results), max_tokens)
+
+def _source_key(result: Dict[str, Any]) -> tuple:
+    url = result.get("url", "").strip()
+    if not url:
+        return ("content", " ".join(result.get("content", "").split()))
+    # Scheme and host are case-insensitive, and fragments and trailing slashes name the same page
+    parts = urlsplit(url)
+    path = parts.path.rstrip("/")
+    return ("url", urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, "")))
+
+class SourcePool:
+    """
+    Sources gathered for one section across search iterations.
+
+    Results are keyed by normalized URL, so a page returned again by another
+    query is not added (or sent to the writer) twice while distinct pages
+    with empty or identical snippets are all kept. Results without a URL,
+    such as backend errors, are keyed by their content instead.
+    """
+
+    def __init__(self):
+        self.results: List[Dict[str, Any]] = []
+        self.queries: set = set()
+        self._seen: set = set()
+
+    def new_queries(self, queries: List[str]) -> List[str]:
+        """The queries that have not been searched yet."""
+        fresh = []
+        for query in queries:
+            key = " ".join(query.lower().split())
+            if key and key not in self.queries:
+                self.queries.add(key)
+                fresh.append(query)
+        return fresh
+
+    def add(self, results: List[Dict[str, Any]]) -> int:
+        """Keep the new results; returns how many there were."""
+        added = 0
+        for res in results:
+            key = _source_key(res)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            self.results.append(res)
+            added += 1
+        return added
+
+    def format(self, max_tokens: Optional[int] = None) -> str:
+        return format_search_results(self.results, max_tokens)
@@ -0,0 +1,140 @@
+"""
+Meta agent entry points for the v1 research graph.
+
+The graph is driven with astream in "tasks" mode so node starts and results can
+be reported as progress events while the report is being written. The human
+feedback interrupt on the report plan is auto-approved, since API callers
+cannot answer it mid-request.
+"""
+import os
+import sys
+import uuid
+import asyncio
+
+# Add the parent directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.types import Command
+
+from agents.deepresearch_optimus_alpha_v1.configuration import Configuration
+from agents.deepresearch_optimus_alpha_v1.graph import builder, init_chat_model
+from token_counter import track_token_usage
+
+# The plan interrupt needs a checkpointer to resume; threads are deleted after each run
+checkpointer = MemorySaver(serde=JsonPlusSerializer(allowed_msgpack_modules=[
+    ("agents.deepresearch_optimus_alpha_v1.state", "Section"),
+    ("agents.deepresearch_optimus_alpha_v1.state", "SearchQuery"),
+]))
+graph = builder.compile(checkpointer=checkpointer)
+
+async def warmup():
+    """
+    Open a pooled connection to OpenRouter so the first request skips TCP/TLS setup.
+
+    Graph nodes call through the async HTTP client cached for the running event
+    loop, so this runs on the loop that serves requests and warms that client.
+    """
+    configurable = Configuration()
+    try:
+        model = init_chat_model(model=configurable.writer_model, model_provider=configurable.writer_provider)
+        await model.root_async_client.with_options(timeout=10, max_retries=0).models.list()
+    except Exception as e:
+        print(f"Warning: OpenRouter warm-up failed: {e}")
+
+def _section_summary(section):
+    return {"name": section.name, "description": section.description, "research": section.research}
+
+def _progress_events(name, payload, section_name):
+    """Map a finished graph task to the progress events it reports."""
+    if not isinstance(payload, dict):
+        return []
+    if name == "generate_report_plan" and payload.get("sections"):
+        return [{"event": "plan_ready", "data": {"sections": [_section_summary(s) for s in payload["sections"]]}}]
+    if name == "search_web":
+        return [{"event": "search_finished", "data": {
+            "section": section_name,
+            "iteration": payload.get("search_iterations"),
+            "source_chars": len(payload.get("source_str") or ""),
+        }}]
+    if name == "write_section":
+        # Either the section is published (grade pass or max depth) or follow-up queries are returned
+        complete = bool(payload.get("completed_sections"))
+        section = payload["completed_sections"][0] if complete else payload.get("section")
+        if section is None:
+            return []
+        follow_up_queries = [] if complete else [q.search_query for q in payload.get("search_queries", [])]
+        return [
+            {"event": "section_written", "data": {"section": section.name, "content": section.content}},
+            {"event": "section_graded", "data": {"section": section.name, "complete": complete, "follow_up_queries": follow_up_queries}},
+        ]
+    if name == "write_final_sections" and payload.get("completed_sections"):
+        section = payload["completed_sections"][0]
+        return [{"event": "section_written", "data": {"section": section.name, "content": section.content}}]
+    return []
+
+async def astream_agent(chat_history, query):
+    """
+    Streaming entry point for the meta agent.
+    Yields progress events (plan_ready, search_started, search_finished,
+    section_written, section_graded), the run's token_usage, then {"event": "final", ...}.
+    """
+    config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+    graph_input = {"topic": query}
+    report = ""
+    section_by_task = {}
+
+    with track_token_usage() as usage:
+        try:
+            while graph_input is not None:
+                resume = None
+                async for _, _, chunk in graph.astream(graph_input, config, stream_mode=["tasks"], subgraphs=True):
+                    name = chunk.get("name")
+
+                    # Task started
+                    if "input" in chunk:
+                        task_input = chunk["input"] if isinstance(chunk["input"], dict) else {}
+                        section = task_input.get("section")
+                        if section is not None:
+                            section_by_task[chunk["id"]] = section.name
+                        if name == "search_web":
+                            yield {"event": "search_started", "data": {
+                                "section": section.name if section is not None else None,
+                                "iteration": task_input.get("search_iterations", 0),
+                                "queries": [q.search_query for q in task_input.get("search_queries", [])],
+                            }}
+                        continue
+
+                    # Task finished
+                    if chunk.get("interrupts"):
+                        # Approve the report plan
+                        resume = Command(resume=True)
+                        continue
+                    payload = chunk.get("result")
+                    if name == "compile_final_report" and isinstance(payload, dict):
+                        report = payload.get("final_report", "")
+                    for event in _progress_events(name, payload, section_by_task.get(chunk.get("id"))):
+                        yield event
+                graph_input = resume
+        finally:
+            await checkpointer.adelete_thread(config["configurable"]["thread_id"])
+
+    yield {"event": "token_usage", "data": usage.as_dict()}
+
+    history = (chat_history.copy() if chat_history else []) + [
+        {"role": "user", "content": query},
+        {"role": "assistant", "content": report},
+    ]
+    yield {"event": "final", "data": {"response": report, "history": history}}
+
+async def achat_agent(chat_history, query):
+    """Async entry point for the meta agent. Returns (report, updated_chat_history)."""
+    async for event in astream_agent(chat_history, query):
+        if event["event"] == "final":
+            return event["data"]["response"], event["data"]["history"]
+    raise RuntimeError("Research graph finished without a final report")
+
+def chat_agent(chat_history, query):
+    """Entry point for the meta agent. Returns (report, updated_chat_history)."""
+    return asyncio.run(achat_agent(chat_history, query))
@@ -41,6 +41,10 @@ class Configuration:
     writer_model: str = "openrouter/optimus-alpha" # Use optimus-alpha as model
     search_api: SearchAPI = SearchAPI.DUCKDUCKGO # Default to DuckDuckGo for consistency
     search_api_config: Optional[Dict[str, Any]] = None 
+    max_prompt_tokens: int = 16000 # Per-call prompt budget; the lowest-value sources are trimmed to fit
+    max_tokens_per_source: int = 4000 # Token limit of each source's raw content
+    hedge_model: Optional[str] = None # Secondary model raced against slow planner/writer calls; hedging is off when unset
+    hedge_provider: str = "openrouter" # Provider of the secondary model
 
     @classmethod
     def from_runnable_config(
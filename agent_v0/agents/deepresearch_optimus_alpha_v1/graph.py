@@ -1,26 +1,101 @@
 from typing import Literal
 
 import os
+import json
+import asyncio
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
 from typing import Optional
+import openai
 from langchain_openai import ChatOpenAI
 from pydantic import Field, SecretStr
 
 load_dotenv()
 
-def init_chat_model(model: str, model_provider: str, **kwargs):
-    """
-    Custom init_chat_model for OpenRouter/Optimus-Alpha.
-    Ignores model_provider and always returns a ChatOpenAI instance configured for OpenRouter.
-    """
+# OpenAI-compatible endpoint the chat models talk to
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Event loops whose chat models are kept at the same time (usually just the API's)
+MAX_CACHED_EVENT_LOOPS = 4
+
+# event loop (or None outside one) -> {"http_async_client": ..., "models": {key: model}}
+_chat_model_cache: "OrderedDict" = OrderedDict()
+_chat_model_cache_lock = threading.RLock()
+_http_client = None
+
+def _build_chat_model(model: str, model_provider: str, **kwargs):
+    """Build a new ChatOpenAI configured for OpenRouter (model_provider is ignored)."""
     openai_api_key = os.environ.get("OPENROUTER_API_KEY")
+    # Deterministic models read and fill the shared LLM response cache
+    cache = langchain_cache(kwargs.get("temperature"))
+    if cache is not None:
+        kwargs.setdefault("cache", cache)
     # Use the correct base_url for OpenRouter
     return ChatOpenAI(
-        base_url="https://openrouter.ai/api/v1",
+        base_url=OPENROUTER_BASE_URL,
         openai_api_key=openai_api_key,
         model_name=model,
+        callbacks=[llm_metrics_callback],
         **kwargs
     )
+
+def _cached_models():
+    """Model cache of the running event loop; async connections cannot be shared across loops."""
+    global _http_client
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if _http_client is None:
+        _http_client = openai.DefaultHttpxClient(event_hooks=HTTPX_EVENT_HOOKS)
+    bucket = _chat_model_cache.get(loop)
+    if bucket is None:
+        bucket = _chat_model_cache[loop] = {
+            "http_async_client": openai.DefaultAsyncHttpxClient(event_hooks=ASYNC_HTTPX_EVENT_HOOKS) if loop is not None else None,
+            "models": {},
+        }
+        while len(_chat_model_cache) > MAX_CACHED_EVENT_LOOPS:
+            _chat_model_cache.popitem(last=False)
+    _chat_model_cache.move_to_end(loop)
+    return bucket
+
+def _get_chat_model(model: str, model_provider: str, schema=None, **kwargs):
+    key = (model, model_provider, json.dumps(kwargs, sort_keys=True, default=repr), schema)
+    with _chat_model_cache_lock:
+        bucket = _cached_models()
+        cached = bucket["models"].get(key)
+        if cached is None:
+            if schema is None:
+                # Every model shares the process-wide connection pools
+                cached = _build_chat_model(model, model_provider, http_client=_http_client,
+                                           http_async_client=bucket["http_async_client"], **kwargs)
+            else:
+                cached = _get_chat_model(model, model_provider, **kwargs).runnable.with_structured_output(schema)
+            # Calls queue for the provider's rate limits and concurrency
+            cached = GovernedModel(cached, model_provider, model, max_tokens=kwargs.get("max_tokens"))
+            bucket["models"][key] = cached
+        return cached
+
+def init_chat_model(model: str, model_provider: str, **kwargs):
+    """
+    Custom init_chat_model for OpenRouter/Optimus-Alpha.
+    Ignores model_provider and always returns a ChatOpenAI instance configured for OpenRouter.
+    Instances are cached per (model, provider, kwargs) and share HTTP connection pools,
+    so node runs reuse open connections instead of building new clients. Calls go
+    through the process-wide LLM governor of the provider and model.
+    """
+    return _get_chat_model(model, model_provider, **kwargs)
+
+def init_structured_model(model: str, model_provider: str, schema, **kwargs):
+    """Cached init_chat_model(...).with_structured_output(schema)."""
+    return _get_chat_model(model, model_provider, schema=schema, **kwargs)
+
+def clear_chat_model_cache():
+    """Drop all cached chat models (e.g. after changing API keys)."""
+    with _chat_model_cache_lock:
+        _chat_model_cache.clear()
+
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
 
@@ -50,6 +125,11 @@ from agents.deepresearch_optimus_alpha_v1.prompts import (
 )
 
 from agents.deepresearch_optimus_alpha_v1.configuration import Configuration
+from hedging import hedged_ainvoke
+from llm_governor import ASYNC_HTTPX_EVENT_HOOKS, HTTPX_EVENT_HOOKS, GovernedModel
+from llm_cache import langchain_cache
+from metrics import llm_metrics_callback, timed_node
+from token_counter import context_budget, measure_prompt
 from agents.deepresearch_optimus_alpha_v1.utils import (
     format_sections,
     get_config_value,
@@ -57,6 +137,43 @@ from agents.deepresearch_optimus_alpha_v1.utils import (
     select_and_execute_search
 )
 
+## Prompts --
+
+def _planner_messages(topic, report_structure, source_str, feedback, planner_message):
+    """Report planner prompt; built without sources first to size the source budget."""
+    system_instructions_sections = report_planner_instructions.format(topic=topic, report_organization=report_structure, context=source_str, feedback=feedback)
+    return [SystemMessage(content=system_instructions_sections), HumanMessage(content=planner_message)]
+
+def _section_writer_messages(topic, section, source_str):
+    """Section writer prompt; built without sources first to size the source budget."""
+    section_writer_inputs_formatted = section_writer_inputs.format(topic=topic, 
+                                                             section_name=section.name, 
+                                                             section_topic=section.description, 
+                                                             context=source_str, 
+                                                             section_content=section.content)
+    return [SystemMessage(content=section_writer_instructions), HumanMessage(content=section_writer_inputs_formatted)]
+
+def _node_models(configurable, model, model_provider, schema=None, **kwargs):
+    """
+    (primary, secondary) models for one node call. The secondary is None unless
+    hedge_model is configured; then both stream, so hedged_ainvoke sees first tokens.
+    """
+    def build(model, model_provider, **kwargs):
+        if schema is None:
+            return init_chat_model(model=model, model_provider=model_provider, **kwargs)
+        return init_structured_model(model=model, model_provider=model_provider, schema=schema, **kwargs)
+
+    # Queries, plans and grades are asked for at temperature 0, so repeated and resumed runs hit the LLM
+    # cache; extended thinking only runs at the provider default
+    deterministic = {"temperature": 0} if schema is not None and "thinking" not in kwargs else {}
+    kwargs = {**deterministic, **kwargs}
+    if not configurable.hedge_model:
+        return build(model, model_provider, **kwargs), None
+    primary = build(model, model_provider, streaming=True, stream_usage=True, **kwargs)
+    secondary = build(get_config_value(configurable.hedge_model), get_config_value(configurable.hedge_provider),
+                      streaming=True, stream_usage=True, **deterministic)
+    return primary, secondary
+
 ## Nodes -- 
 
 async def generate_report_plan(state: ReportState, config: RunnableConfig):
@@ -95,50 +212,49 @@ async def generate_report_plan(state: ReportState, config: RunnableConfig):
     # Set writer model (model used for query writing)
     writer_provider = get_config_value(configurable.writer_provider)
     writer_model_name = get_config_value(configurable.writer_model)
-    writer_model = init_chat_model(model=writer_model_name, model_provider=writer_provider) 
-    structured_llm = writer_model.with_structured_output(Queries)
+    structured_llm, hedge_llm = _node_models(configurable, writer_model_name, writer_provider, schema=Queries)
 
     # Format system instructions
     system_instructions_query = report_planner_query_writer_instructions.format(topic=topic, report_organization=report_structure, number_of_queries=number_of_queries)
 
     # Generate queries  
-    results = structured_llm.invoke([SystemMessage(content=system_instructions_query),
-                                     HumanMessage(content="Generate search queries that will help with planning the sections of the report.")])
+    query_messages = [SystemMessage(content=system_instructions_query),
+                      HumanMessage(content="Generate search queries that will help with planning the sections of the report.")]
+    measure_prompt("report_queries", query_messages, configurable.max_prompt_tokens)
+    results = await hedged_ainvoke("report_queries", structured_llm, hedge_llm, query_messages)
 
     # Web search
     query_list = [query.search_query for query in results.queries]
 
-    # Search the web with parameters
-    source_str = await select_and_execute_search(search_api, query_list, params_to_pass)
+    # Planner prompt without sources, to size the source budget
+    planner_message = """Generate the sections of the report. Your response must include a 'sections' field containing a list of sections. 
+                        Each section must have: name, description, plan, research, and content fields."""
+    planner_messages = _planner_messages(topic, report_structure, "", feedback, planner_message)
 
-    # Format system instructions
-    system_instructions_sections = report_planner_instructions.format(topic=topic, report_organization=report_structure, context=source_str, feedback=feedback)
+    # Search the web with parameters
+    source_str = await select_and_execute_search(search_api, query_list, params_to_pass,
+                                                 max_tokens=context_budget(configurable.max_prompt_tokens, planner_messages),
+                                                 max_tokens_per_source=int(configurable.max_tokens_per_source))
 
     # Set the planner
     planner_provider = get_config_value(configurable.planner_provider)
     planner_model = get_config_value(configurable.planner_model)
 
-    # Report planner instructions
-    planner_message = """Generate the sections of the report. Your response must include a 'sections' field containing a list of sections. 
-                        Each section must have: name, description, plan, research, and content fields."""
-
     # Run the planner
     if planner_model == "claude-3-7-sonnet-latest":
         # Allocate a thinking budget for claude-3-7-sonnet-latest as the planner model
-        planner_llm = init_chat_model(model=planner_model, 
-                                      model_provider=planner_provider, 
-                                      max_tokens=20_000, 
-                                      thinking={"type": "enabled", "budget_tokens": 16_000})
+        structured_llm, hedge_llm = _node_models(configurable, planner_model, planner_provider, schema=Sections,
+                                                 max_tokens=20_000, 
+                                                 thinking={"type": "enabled", "budget_tokens": 16_000})
 
     else:
         # With other models, thinking tokens are not specifically allocated
-        planner_llm = init_chat_model(model=planner_model, 
-                                      model_provider=planner_provider)
+        structured_llm, hedge_llm = _node_models(configurable, planner_model, planner_provider, schema=Sections)
     
     # Generate the report sections
-    structured_llm = planner_llm.with_structured_output(Sections)
-    report_sections = structured_llm.invoke([SystemMessage(content=system_instructions_sections),
-                                             HumanMessage(content=planner_message)])
+    planner_messages = _planner_messages(topic, report_structure, source_str, feedback, planner_message)
+    measure_prompt("report_plan", planner_messages, configurable.max_prompt_tokens)
+    report_sections = await hedged_ainvoke("report_plan", structured_llm, hedge_llm, planner_messages)
 
     # Get sections
     sections = report_sections.sections
@@ -197,7 +313,7 @@ def human_feedback(state: ReportState, config: RunnableConfig) -> Command[Litera
     else:
         raise TypeError(f"Interrupt value of type {type(feedback)} is not supported.")
     
-def generate_queries(state: SectionState, config: RunnableConfig):
+async def generate_queries(state: SectionState, config: RunnableConfig):
     """Generate search queries for researching a specific section.
     
     This node uses an LLM to generate targeted search queries based on the 
@@ -222,8 +338,7 @@ def generate_queries(state: SectionState, config: RunnableConfig):
     # Generate queries 
     writer_provider = get_config_value(configurable.writer_provider)
     writer_model_name = get_config_value(configurable.writer_model)
-    writer_model = init_chat_model(model=writer_model_name, model_provider=writer_provider) 
-    structured_llm = writer_model.with_structured_output(Queries)
+    structured_llm, hedge_llm = _node_models(configurable, writer_model_name, writer_provider, schema=Queries)
 
     # Format system instructions
     system_instructions = query_writer_instructions.format(topic=topic, 
@@ -231,8 +346,10 @@ def generate_queries(state: SectionState, config: RunnableConfig):
                                                            number_of_queries=number_of_queries)
 
     # Generate queries  
-    queries = structured_llm.invoke([SystemMessage(content=system_instructions),
-                                     HumanMessage(content="Generate search queries on the provided topic.")])
+    messages = [SystemMessage(content=system_instructions),
+                HumanMessage(content="Generate search queries on the provided topic.")]
+    measure_prompt("section_queries", messages, configurable.max_prompt_tokens)
+    queries = await hedged_ainvoke("section_queries", structured_llm, hedge_llm, messages)
 
     return {"search_queries": queries.queries}
 
@@ -253,6 +370,8 @@ async def search_web(state: SectionState, config: RunnableConfig):
     """
 
     # Get state
+    topic = state["topic"]
+    section = state["section"]
     search_queries = state["search_queries"]
 
     # Get configuration
@@ -264,12 +383,17 @@ async def search_web(state: SectionState, config: RunnableConfig):
     # Web search
     query_list = [query.search_query for query in search_queries]
 
+    # Size the sources to what the section writer prompt leaves of the budget
+    writer_messages = _section_writer_messages(topic, section, "")
+    max_tokens = context_budget(configurable.max_prompt_tokens, writer_messages)
+
     # Search the web with parameters
-    source_str = await select_and_execute_search(search_api, query_list, params_to_pass)
+    source_str = await select_and_execute_search(search_api, query_list, params_to_pass, max_tokens=max_tokens,
+                                                 max_tokens_per_source=int(configurable.max_tokens_per_source))
 
     return {"source_str": source_str, "search_iterations": state["search_iterations"] + 1}
 
-def write_section(state: SectionState, config: RunnableConfig) -> Command[Literal[END, "search_web"]]:
+async def write_section(state: SectionState, config: RunnableConfig) -> Command[Literal[END, "search_web"]]:
     """Write a section of the report and evaluate if more research is needed.
     
     This node:
@@ -295,20 +419,14 @@ def write_section(state: SectionState, config: RunnableConfig) -> Command[Litera
     # Get configuration
     configurable = Configuration.from_runnable_config(config)
 
-    # Format system instructions
-    section_writer_inputs_formatted = section_writer_inputs.format(topic=topic, 
-                                                             section_name=section.name, 
-                                                             section_topic=section.description, 
-                                                             context=source_str, 
-                                                             section_content=section.content)
-
     # Generate section  
     writer_provider = get_config_value(configurable.writer_provider)
     writer_model_name = get_config_value(configurable.writer_model)
-    writer_model = init_chat_model(model=writer_model_name, model_provider=writer_provider) 
+    writer_model, hedge_model = _node_models(configurable, writer_model_name, writer_provider)
 
-    section_content = writer_model.invoke([SystemMessage(content=section_writer_instructions),
-                                           HumanMessage(content=section_writer_inputs_formatted)])
+    writer_messages = _section_writer_messages(topic, section, source_str)
+    measure_prompt("write_section", writer_messages, configurable.max_prompt_tokens)
+    section_content = await hedged_ainvoke("write_section", writer_model, hedge_model, writer_messages)
     
     # Write content to the section object  
     section.content = section_content.content
@@ -329,16 +447,16 @@ def write_section(state: SectionState, config: RunnableConfig) -> Command[Litera
 
     if planner_model == "claude-3-7-sonnet-latest":
         # Allocate a thinking budget for claude-3-7-sonnet-latest as the planner model
-        reflection_model = init_chat_model(model=planner_model, 
-                                           model_provider=planner_provider, 
-                                           max_tokens=20_000, 
-                                           thinking={"type": "enabled", "budget_tokens": 16_000}).with_structured_output(Feedback)
+        reflection_model, hedge_model = _node_models(configurable, planner_model, planner_provider, schema=Feedback,
+                                                     max_tokens=20_000, 
+                                                     thinking={"type": "enabled", "budget_tokens": 16_000})
     else:
-        reflection_model = init_chat_model(model=planner_model, 
-                                           model_provider=planner_provider).with_structured_output(Feedback)
+        reflection_model, hedge_model = _node_models(configurable, planner_model, planner_provider, schema=Feedback)
     # Generate feedback
-    feedback = reflection_model.invoke([SystemMessage(content=section_grader_instructions_formatted),
-                                        HumanMessage(content=section_grader_message)])
+    grader_messages = [SystemMessage(content=section_grader_instructions_formatted),
+                       HumanMessage(content=section_grader_message)]
+    measure_prompt("grade_section", grader_messages, configurable.max_prompt_tokens)
+    feedback = await hedged_ainvoke("grade_section", reflection_model, hedge_model, grader_messages)
 
     # If the section is passing or the max search depth is reached, publish the section to completed sections 
     if feedback.grade == "pass" or state["search_iterations"] >= configurable.max_search_depth:
@@ -355,7 +473,7 @@ def write_section(state: SectionState, config: RunnableConfig) -> Command[Litera
         goto="search_web"
         )
     
-def write_final_sections(state: SectionState, config: RunnableConfig):
+async def write_final_sections(state: SectionState, config: RunnableConfig):
     """Write sections that don't require research using completed sections as context.
     
     This node handles sections like conclusions or summaries that build on
@@ -383,10 +501,12 @@ def write_final_sections(state: SectionState, config: RunnableConfig):
     # Generate section  
     writer_provider = get_config_value(configurable.writer_provider)
     writer_model_name = get_config_value(configurable.writer_model)
-    writer_model = init_chat_model(model=writer_model_name, model_provider=writer_provider) 
+    writer_model, hedge_model = _node_models(configurable, writer_model_name, writer_provider)
     
-    section_content = writer_model.invoke([SystemMessage(content=system_instructions),
-                                           HumanMessage(content="Generate a report section based on the provided sources.")])
+    messages = [SystemMessage(content=system_instructions),
+                HumanMessage(content="Generate a report section based on the provided sources.")]
+    measure_prompt("write_final_section", messages, configurable.max_prompt_tokens)
+    section_content = await hedged_ainvoke("write_final_section", writer_model, hedge_model, messages)
     
     # Write content to section 
     section.content = section_content.content
@@ -467,9 +587,9 @@ def initiate_final_section_writing(state: ReportState):
 
 # Add nodes 
 section_builder = StateGraph(SectionState, output=SectionOutputState)
-section_builder.add_node("generate_queries", generate_queries)
-section_builder.add_node("search_web", search_web)
-section_builder.add_node("write_section", write_section)
+section_builder.add_node("generate_queries", timed_node("section", "generate_queries", generate_queries))
+section_builder.add_node("search_web", timed_node("section", "search_web", search_web))
+section_builder.add_node("write_section", timed_node("section", "write_section", write_section))
 
 # Add edges
 section_builder.add_edge(START, "generate_queries")
@@ -480,12 +600,12 @@ section_builder.add_edge("search_web", "write_section")
 
 # Add nodes
 builder = StateGraph(ReportState, input=ReportStateInput, output=ReportStateOutput, config_schema=Configuration)
-builder.add_node("generate_report_plan", generate_report_plan)
+builder.add_node("generate_report_plan", timed_node("report", "generate_report_plan", generate_report_plan))
 builder.add_node("human_feedback", human_feedback)
 builder.add_node("build_section_with_web_research", section_builder.compile())
-builder.add_node("gather_completed_sections", gather_completed_sections)
-builder.add_node("write_final_sections", write_final_sections)
-builder.add_node("compile_final_report", compile_final_report)
+builder.add_node("gather_completed_sections", timed_node("report", "gather_completed_sections", gather_completed_sections))
+builder.add_node("write_final_sections", timed_node("report", "write_final_sections", write_final_sections))
+builder.add_node("compile_final_report", timed_node("report", "compile_final_report", compile_final_report))
 
 # Add edges
 builder.add_edge(START, "generate_report_plan")
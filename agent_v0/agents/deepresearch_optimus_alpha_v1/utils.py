@@ -20,6 +20,9 @@ from langchain_community.utilities.pubmed import PubMedAPIWrapper
 from langsmith import traceable
 
 from agents.deepresearch_optimus_alpha_v1.state import Section
+from metrics import record_search_results, track_search
+from search_cache import get_search_cache
+from token_counter import count_tokens, truncate_to_tokens
 
 
 def get_config_value(value):
@@ -59,10 +62,30 @@ def get_search_params(search_api: str, search_api_config: Optional[Dict[str, Any
     # Filter the config to only include accepted parameters
     return {k: v for k, v in search_api_config.items() if k in accepted_params}
 
-def deduplicate_and_format_sources(search_response, max_tokens_per_source, include_raw_content=True):
+def _format_source(source, max_tokens_per_source, include_raw_content=True):
+    """Format one search result as a source block."""
+    text = f"{'='*80}\n"  # Clear section separator
+    text += f"Source: {source['title']}\n"
+    text += f"{'-'*80}\n"  # Subsection separator
+    text += f"URL: {source['url']}\n===\n"
+    text += f"Most relevant content from source: {source['content']}\n===\n"
+    if include_raw_content:
+        # Handle None raw_content
+        raw_content = source.get('raw_content', '')
+        if raw_content is None:
+            raw_content = ''
+            print(f"Warning: No raw_content found for source {source['url']}")
+        truncated = truncate_to_tokens(raw_content, max_tokens_per_source)
+        if len(truncated) < len(raw_content):
+            raw_content = truncated + "... [truncated]"
+        text += f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}\n\n"
+    text += f"{'='*80}\n\n" # End section separator
+    return text
+
+def deduplicate_and_format_sources(search_response, max_tokens_per_source, include_raw_content=True, max_tokens=None):
     """
     Takes a list of search responses and formats them into a readable string.
-    Limits the raw_content to approximately max_tokens_per_source tokens.
+    Limits the raw_content to max_tokens_per_source tokens.
  
     Args:
         search_responses: List of search response dicts, each containing:
@@ -75,39 +98,56 @@ def deduplicate_and_format_sources(search_response, max_tokens_per_source, inclu
                 - raw_content: str|None
         max_tokens_per_source: int
         include_raw_content: bool
+        max_tokens: Optional budget for the whole string. The lowest-value sources
+            (lowest score, then lowest rank in their query) lose their raw content
+            first, then are dropped entirely.
             
     Returns:
         str: Formatted string with deduplicated sources
     """
-     # Collect all results
+    # Collect all results with their value: search score, then rank within the query
     sources_list = []
     for response in search_response:
-        sources_list.extend(response['results'])
+        for rank, source in enumerate(response['results']):
+            sources_list.append((source, (source.get('score') or 0, -rank)))
     
-    # Deduplicate by URL
-    unique_sources = {source['url']: source for source in sources_list}
+    # Deduplicate by URL, keeping the most valuable copy
+    unique_sources = {}
+    for source, value in sources_list:
+        if source['url'] not in unique_sources or value > unique_sources[source['url']][1]:
+            unique_sources[source['url']] = (source, value)
+    sources = [source for source, _ in unique_sources.values()]
+    values = [value for _, value in unique_sources.values()]
+
+    header = "Content from sources:\n"
+    blocks = [_format_source(source, max_tokens_per_source, include_raw_content) for source in sources]
 
-    # Format output
-    formatted_text = "Content from sources:\n"
-    for i, source in enumerate(unique_sources.values(), 1):
-        formatted_text += f"{'='*80}\n"  # Clear section separator
-        formatted_text += f"Source: {source['title']}\n"
-        formatted_text += f"{'-'*80}\n"  # Subsection separator
-        formatted_text += f"URL: {source['url']}\n===\n"
-        formatted_text += f"Most relevant content from source: {source['content']}\n===\n"
+    omitted = 0
+    if max_tokens is not None:
+        total = count_tokens(header) + sum(count_tokens(block) for block in blocks)
+        lowest_first = sorted(range(len(sources)), key=lambda i: values[i])
+        # Drop raw content of the lowest-value sources first, then the sources themselves
         if include_raw_content:
-            # Using rough estimate of 4 characters per token
-            char_limit = max_tokens_per_source * 4
-            # Handle None raw_content
-            raw_content = source.get('raw_content', '')
-            if raw_content is None:
-                raw_content = ''
-                print(f"Warning: No raw_content found for source {source['url']}")
-            if len(raw_content) > char_limit:
-                raw_content = raw_content[:char_limit] + "... [truncated]"
-            formatted_text += f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}\n\n"
-        formatted_text += f"{'='*80}\n\n" # End section separator
-                
+            for i in lowest_first:
+                if total <= max_tokens:
+                    break
+                summary = _format_source(sources[i], max_tokens_per_source, include_raw_content=False)
+                total += count_tokens(summary) - count_tokens(blocks[i])
+                blocks[i] = summary
+        for i in lowest_first[:-1]:
+            if total <= max_tokens:
+                break
+            total -= count_tokens(blocks[i])
+            blocks[i] = None
+            omitted += 1
+        remaining = [i for i, block in enumerate(blocks) if block is not None]
+        if total > max_tokens and remaining:
+            # A single source still over budget
+            blocks[remaining[0]] = truncate_to_tokens(blocks[remaining[0]], max_tokens - count_tokens(header)) + "... [truncated]"
+
+    formatted_text = header + "".join(block for block in blocks if block is not None)
+    if omitted:
+        formatted_text += f"[{omitted} lower-ranked sources omitted to fit the context budget]"
     return formatted_text.strip()
 
 def format_sections(sections: list[Section]) -> str:
@@ -1128,13 +1168,16 @@ async def google_search_async(search_queries: Union[str, List[str]], max_results
 
 
 
-async def select_and_execute_search(search_api: str, query_list: list[str], params_to_pass: dict) -> str:
+async def select_and_execute_search(search_api: str, query_list: list[str], params_to_pass: dict,
+                                    max_tokens: Optional[int] = None, max_tokens_per_source: int = 4000) -> str:
     """Select and execute the appropriate search API.
     
     Args:
         search_api: Name of the search API to use
         query_list: List of search queries to execute
         params_to_pass: Parameters to pass to the search API
+        max_tokens: Optional token budget for the formatted sources
+        max_tokens_per_source: Token limit of each source's raw content
         
     Returns:
         Formatted string containing search results
@@ -1142,29 +1185,43 @@ async def select_and_execute_search(search_api: str, query_list: list[str], para
     Raises:
         ValueError: If an unsupported search API is specified
     """
-    if search_api == "tavily":
-        search_results = await tavily_search_async(query_list, **params_to_pass)
-        return deduplicate_and_format_sources(search_results, max_tokens_per_source=4000, include_raw_content=False)
-    elif search_api == "perplexity":
-        search_results = perplexity_search(query_list, **params_to_pass)
-        return deduplicate_and_format_sources(search_results, max_tokens_per_source=4000)
-    elif search_api == "exa":
-        search_results = await exa_search(query_list, **params_to_pass)
-        return deduplicate_and_format_sources(search_results, max_tokens_per_source=4000)
-    elif search_api == "arxiv":
-        search_results = await arxiv_search_async(query_list, **params_to_pass)
-        return deduplicate_and_format_sources(search_results, max_tokens_per_source=4000)
-    elif search_api == "pubmed":
-        search_results = await pubmed_search_async(query_list, **params_to_pass)
-        return deduplicate_and_format_sources(search_results, max_tokens_per_source=4000)
-    elif search_api == "linkup":
-        search_results = await linkup_search(query_list, **params_to_pass)
-        return deduplicate_and_format_sources(search_results, max_tokens_per_source=4000)
-    elif search_api == "duckduckgo":
-        search_results = await duckduckgo_search(query_list)
-        return deduplicate_and_format_sources(search_results, max_tokens_per_source=4000)
-    elif search_api == "googlesearch":
-        search_results = await google_search_async(query_list, **params_to_pass)
-        return deduplicate_and_format_sources(search_results, max_tokens_per_source=4000)
-    else:
-        raise ValueError(f"Unsupported search API: {search_api}")
+    async def search(queries):
+        if search_api == "tavily":
+            return await tavily_search_async(queries, **params_to_pass)
+        elif search_api == "perplexity":
+            # perplexity_search uses blocking requests; keep it off the event loop
+            return await asyncio.to_thread(perplexity_search, queries, **params_to_pass)
+        elif search_api == "exa":
+            return await exa_search(queries, **params_to_pass)
+        elif search_api == "arxiv":
+            return await arxiv_search_async(queries, **params_to_pass)
+        elif search_api == "pubmed":
+            return await pubmed_search_async(queries, **params_to_pass)
+        elif search_api == "linkup":
+            return await linkup_search(queries, **params_to_pass)
+        elif search_api == "duckduckgo":
+            return await duckduckgo_search(queries)
+        elif search_api == "googlesearch":
+            return await google_search_async(queries, **params_to_pass)
+        else:
+            raise ValueError(f"Unsupported search API: {search_api}")
+
+    with track_search(search_api):
+        cache = get_search_cache()
+        if cache is None:
+            search_results = await search(query_list)
+        else:
+            # One response per query; failed and empty ones are kept for the negative TTL
+            search_results = await cache.fetch(
+                search_api, query_list, params_to_pass, search,
+                negative=lambda response: bool(response.get("error")) or not response.get("results"))
+
+    # Backends report failed queries as responses with an "error" key instead of raising
+    record_search_results(
+        search_api,
+        results=sum(len(response.get("results", [])) for response in search_results),
+        errors=sum(1 for response in search_results if response.get("error")),
+    )
+    # Tavily is called without raw content
+    return deduplicate_and_format_sources(search_results, max_tokens_per_source=max_tokens_per_source,
+                                          include_raw_content=search_api != "tavily", max_tokens=max_tokens)
@@ -2,14 +2,22 @@
 FastAPI application to serve the LangGraph agent.
 """
 import os
+import json
+import asyncio
 import secrets
+from contextlib import AsyncExitStack, asynccontextmanager
 from typing import Dict, List, Optional
 from fastapi import FastAPI, HTTPException, Depends, Header, Security
 from fastapi.security.api_key import APIKeyHeader, APIKey
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
-from agent import run_agent
+from agent import abatch_agent, arun_agent, astream_agent, registry, shutdown_agent_executor
+from llm_governor import PRIORITY_INTERACTIVE, llm_priority
+from conversation_store import ConversationConflict, ConversationLocks, create_conversation_store
+from jobs import JobManager, JobQueueFull
+import metrics
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -32,8 +40,24 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
         return api_key_header
     raise HTTPException(status_code=403, detail="Could not validate API key")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown hooks."""
+    # Import and warm agents before serving, so the first request is not slower than the rest
+    preload = os.getenv("PRELOAD_AGENTS", "all").strip()
+    if preload:
+        agent_names = None if preload == "all" else [n.strip() for n in preload.split(",") if n.strip()]
+        # On the serving loop, so agents warm the async clients their requests will use
+        await registry.preload(agent_names)
+    jobs.start()
+    yield
+    await jobs.stop()
+    # Release the worker threads used by sync-only agents
+    shutdown_agent_executor(wait=False)
+    conversations.close()
+
 # Initialize FastAPI app
-app = FastAPI(title="LangGraph Agent API", description="API for a simple LangGraph agent with DeepSeek-V3-0324 model")
+app = FastAPI(title="LangGraph Agent API", description="API for a simple LangGraph agent with DeepSeek-V3-0324 model", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -54,9 +78,34 @@ class ChatResponse(BaseModel):
     response: str
     conversation_id: str
 
-# In-memory conversation storage
-# In a production environment, this should be replaced with a database
-conversations: Dict[str, List[BaseMessage]] = {}
+class BatchChatRequest(BaseModel):
+    requests: List[ChatRequest]
+    max_concurrency: Optional[int] = None  # Capped at CHAT_BATCH_CONCURRENCY
+
+class BatchChatResult(BaseModel):
+    response: Optional[str] = None
+    conversation_id: Optional[str] = None
+    error: Optional[str] = None
+    status_code: int = 200
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatResult]
+
+# Conversation storage (bounded in-memory LRU, or SQLite with a hot in-memory tier)
+conversations = create_conversation_store()
+
+# Turns on the same conversation run one at a time in this process; across
+# worker processes, saves are checked against the conversation version
+conversation_locks = ConversationLocks()
+
+# Background agent runs, decoupled from request lifetime
+jobs = JobManager(
+    conversations,
+    conversation_locks,
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_queued=int(os.getenv("JOB_QUEUE_MAX", "100")),
+    ttl_seconds=float(os.getenv("JOB_TTL_SECONDS", "3600")),
+)
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest, api_key: APIKey = Depends(get_api_key)):
@@ -65,46 +114,267 @@ async def chat(request: ChatRequest, api_key: APIKey = Depends(get_api_key)):
     """
     agent_name = request.agent_name
     message = request.message
-    conversation_id = request.conversation_id
+    # Create new conversation ID if needed
+    conversation_id = request.conversation_id or os.urandom(8).hex()
+
+    async with conversation_locks.get(conversation_id):
+        # Get or create conversation history
+        # Store I/O runs on a thread: SQLite reads and BEGIN IMMEDIATE retries must not stall other streams
+        chat_history, version = await asyncio.to_thread(conversations.get_with_version, conversation_id)
+
+        # Generate response using the specified agent
+        try:
+            with llm_priority(PRIORITY_INTERACTIVE):
+                response, updated_history = await arun_agent(agent_name, chat_history, message)
+        except ImportError as e:
+            raise HTTPException(status_code=404, detail=f"Agent '{agent_name}' not found or could not be imported.")
+        except AttributeError as e:
+            raise HTTPException(status_code=500, detail=f"Agent '{agent_name}' is missing the required 'chat_agent' function.")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
+
+        # Update conversation history
+        try:
+            await asyncio.to_thread(conversations.save_history, conversation_id, chat_history, updated_history,
+                                    expected_version=version)
+        except ConversationConflict as e:
+            raise HTTPException(status_code=409, detail=f"Conversation {conversation_id} was modified concurrently: {e}")
+
+    return ChatResponse(
+        response=response,
+        conversation_id=conversation_id
+    )
+
+# Limits for /chat/batch: items per request, and requests in flight per agent
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "1000"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "16"))
+
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(request: BatchChatRequest, api_key: APIKey = Depends(get_api_key)):
+    """
+    Run many independent chat requests in one call.
+
+    Requests are grouped by agent and run with bounded concurrency, through the
+    agent's batch path when it has one. Results come back in request order; a
+    failing item reports its own error and status code instead of failing the batch.
+    """
+    items = request.requests
+    if len(items) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch has {len(items)} requests, the limit is {CHAT_BATCH_MAX_ITEMS}")
+    max_concurrency = max(1, min(request.max_concurrency or CHAT_BATCH_CONCURRENCY, CHAT_BATCH_CONCURRENCY))
+
+    results: List[Optional[BatchChatResult]] = [None] * len(items)
+    by_agent: Dict[str, List[int]] = {}
+    seen = set()
+    for index, item in enumerate(items):
+        if item.conversation_id is not None:
+            # Two turns on one conversation would both start from the same history
+            if item.conversation_id in seen:
+                results[index] = BatchChatResult(conversation_id=item.conversation_id, error=f"Conversation {item.conversation_id} appears more than once in the batch", status_code=409)
+                continue
+            seen.add(item.conversation_id)
+        by_agent.setdefault(item.agent_name, []).append(index)
 
-    # Get or create conversation history
-    chat_history = None
-    if conversation_id and conversation_id in conversations:
-        chat_history = conversations[conversation_id]
+    async def run_group(agent_name: str, indexes: List[int]):
+        try:
+            await registry.aget(agent_name)
+        except ImportError as e:
+            for i in indexes:
+                results[i] = BatchChatResult(error=f"Agent '{agent_name}' not found or could not be imported.", status_code=404)
+            return
+        except AttributeError as e:
+            for i in indexes:
+                results[i] = BatchChatResult(error=f"Agent '{agent_name}' is missing the required 'chat_agent' function.", status_code=500)
+            return
 
-    # Generate response using the specified agent
+        # Create new conversation IDs if needed
+        conversation_ids = [items[i].conversation_id or os.urandom(8).hex() for i in indexes]
+        async with AsyncExitStack() as locks:
+            # Existing conversations take the same locks as /chat, in sorted order so that
+            # concurrent batches cannot deadlock each other
+            for conversation_id in sorted(items[i].conversation_id for i in indexes if items[i].conversation_id is not None):
+                await locks.enter_async_context(conversation_locks.get(conversation_id))
+
+            loaded = await asyncio.to_thread(lambda: [conversations.get_with_version(conversation_id)
+                                                      for conversation_id in conversation_ids])
+            try:
+                outcomes = await abatch_agent(
+                    agent_name,
+                    [(chat_history, items[i].message) for (chat_history, _), i in zip(loaded, indexes)],
+                    max_concurrency=max_concurrency,
+                )
+            except Exception as e:
+                outcomes = [e] * len(indexes)
+
+            for i, conversation_id, (chat_history, version), outcome in zip(indexes, conversation_ids, loaded, outcomes):
+                if isinstance(outcome, BaseException):
+                    results[i] = BatchChatResult(conversation_id=conversation_id, error=f"Error generating response: {str(outcome)}", status_code=500)
+                    continue
+                response, updated_history = outcome
+                # Update conversation history
+                try:
+                    await asyncio.to_thread(conversations.save_history, conversation_id, chat_history, updated_history,
+                                            expected_version=version)
+                except ConversationConflict as e:
+                    results[i] = BatchChatResult(conversation_id=conversation_id, error=f"Conversation {conversation_id} was modified concurrently: {e}", status_code=409)
+                    continue
+                results[i] = BatchChatResult(response=response, conversation_id=conversation_id)
+
+    await asyncio.gather(*(run_group(agent_name, indexes) for agent_name, indexes in by_agent.items()))
+    return BatchChatResponse(results=results)
+
+# Seconds of silence after which a keep-alive comment is sent on SSE streams,
+# so proxies do not drop connections while a research step is running
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+def format_sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, api_key: APIKey = Depends(get_api_key)):
+    """
+    Streaming chat endpoint using Server-Sent Events.
+
+    Emits a "start" event with the conversation ID, then the agent's events
+    ("token" for chat agents; "section_planned", "plan_ready", "search_started",
+    "search_finished", "section_written", "section_graded", "run_resumed" for research
+    agents), and finally a
+    "final" event with the full response. Failures are reported as an "error" event.
+    """
+    agent_name = request.agent_name
+    message = request.message
+    conversation_id = request.conversation_id or os.urandom(8).hex()
+
+    # Fail fast, before the stream starts, if the agent does not exist
     try:
-        response, updated_history = run_agent(agent_name, chat_history, message)
+        await registry.aget(agent_name)
     except ImportError as e:
         raise HTTPException(status_code=404, detail=f"Agent '{agent_name}' not found or could not be imported.")
     except AttributeError as e:
         raise HTTPException(status_code=500, detail=f"Agent '{agent_name}' is missing the required 'chat_agent' function.")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
-    # Create new conversation ID if needed
-    if not conversation_id:
-        conversation_id = os.urandom(8).hex()
+    async def event_stream():
+        yield format_sse("start", {"conversation_id": conversation_id, "agent_name": agent_name})
 
-    # Update conversation history
-    conversations[conversation_id] = updated_history
+        # Hold the conversation for the whole run so the next turn sees this one
+        async with conversation_locks.get(conversation_id):
+            chat_history, version = await asyncio.to_thread(conversations.get_with_version, conversation_id)
 
-    return ChatResponse(
-        response=response,
-        conversation_id=conversation_id
+            # Pump agent events through a queue so heartbeats can be sent while waiting
+            queue = asyncio.Queue()
+
+            async def pump():
+                try:
+                    with llm_priority(PRIORITY_INTERACTIVE):
+                        async for event in astream_agent(agent_name, chat_history, message):
+                            await queue.put(event)
+                except Exception as e:
+                    await queue.put({"event": "error", "data": {"detail": f"Error generating response: {str(e)}"}})
+                finally:
+                    await queue.put(None)
+
+            producer = asyncio.create_task(pump())
+            try:
+                while True:
+                    try:
+                        event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+                        continue
+                    if event is None:
+                        break
+                    if event["event"] == "final":
+                        # Update conversation history
+                        try:
+                            await asyncio.to_thread(conversations.save_history, conversation_id, chat_history,
+                                                    event["data"]["history"], expected_version=version)
+                        except ConversationConflict as e:
+                            yield format_sse("error", {"detail": f"Conversation {conversation_id} was modified concurrently: {e}"})
+                            break
+                        yield format_sse("final", {"response": event["data"]["response"], "conversation_id": conversation_id})
+                    else:
+                        yield format_sse(event["event"], event["data"])
+            finally:
+                producer.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
+@app.post("/jobs", status_code=202)
+async def create_job(request: ChatRequest, api_key: APIKey = Depends(get_api_key)):
+    """
+    Enqueue an agent run and return its job ID immediately.
+    Poll GET /jobs/{job_id} for progress and GET /jobs/{job_id}/result for the answer.
+    """
+    agent_name = request.agent_name
+    try:
+        await registry.aget(agent_name)
+    except ImportError as e:
+        raise HTTPException(status_code=404, detail=f"Agent '{agent_name}' not found or could not be imported.")
+    except AttributeError as e:
+        raise HTTPException(status_code=500, detail=f"Agent '{agent_name}' is missing the required 'chat_agent' function.")
+
+    try:
+        job = jobs.submit(agent_name, request.message, request.conversation_id)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    return {"job_id": job.id, "status": job.status, "conversation_id": job.conversation_id}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, api_key: APIKey = Depends(get_api_key)):
+    """Status, progress events and partial sections of a job."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.describe()
+
+@app.get("/jobs/{job_id}/result", response_model=ChatResponse)
+async def get_job_result(job_id: str, api_key: APIKey = Depends(get_api_key)):
+    """Final response of a succeeded job."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job.status != "succeeded":
+        detail = f"Job {job_id} is {job.status}"
+        if job.error:
+            detail += f": {job.error}"
+        raise HTTPException(status_code=409, detail=detail)
+    return ChatResponse(response=job.response, conversation_id=job.conversation_id)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, api_key: APIKey = Depends(get_api_key)):
+    """Cancel a queued or running job, stopping its in-flight LLM and search calls."""
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    # A running job reports "cancelling" until its task has unwound
+    return {"job_id": job.id, "status": job.status if job.finished else "cancelling"}
+
 @app.delete("/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str, api_key: APIKey = Depends(get_api_key)):
     """
     Delete a conversation by ID.
     """
-    if conversation_id in conversations:
-        del conversations[conversation_id]
+    if await asyncio.to_thread(conversations.delete, conversation_id):
         return {"status": "success", "message": f"Conversation {conversation_id} deleted"}
     else:
         raise HTTPException(status_code=404, detail=f"Conversation {conversation_id} not found")
 
+@app.get("/agents")
+async def list_agents(api_key: APIKey = Depends(get_api_key)):
+    """List the available agents and whether they are loaded and warmed up."""
+    return {"agents": registry.describe()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics for this worker process (text exposition format)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -0,0 +1,71 @@
+"""
+Benchmark: prompt tokens per turn for chat_deepseek_v3, with and without the context builder.
+
+Drives a long conversation through chat_agent with a stub LLM (no API calls)
+and prints the prompt size sent on each turn. Without a budget the prompt
+grows with every turn; with the context builder it flattens out once older
+turns start being folded into the rolling summary.
+
+Usage:
+    python benchmarks/chat_context_tokens.py [--turns 40] [--budget 4000]
+"""
+import os
+import sys
+import argparse
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DEEPINFRA_API_TOKEN", "benchmark-token")
+
+from langchain_core.messages import AIMessage, SystemMessage
+
+import agents.chat_deepseek_v3.agent as chat
+from agents.chat_deepseek_v3.context import ContextBuilder
+from token_counter import count_message_tokens
+
+class StubLLM:
+    """Records prompt sizes; answers chat turns with a fixed-size reply."""
+
+    def __init__(self, reply_words):
+        self.reply = " ".join(["lorem"] * reply_words)
+        self.prompt_tokens = []
+        self.summary_calls = 0
+
+    def invoke(self, messages):
+        if isinstance(messages[0], SystemMessage) and "running summary" in messages[0].content:
+            self.summary_calls += 1
+            return AIMessage(content=" ".join(["summary"] * 300))
+        self.prompt_tokens.append(count_message_tokens(messages))
+        return AIMessage(content=self.reply)
+
+def run(turns, builder, reply_words):
+    stub = StubLLM(reply_words)
+    chat.llm = stub
+    chat.context_builder = builder
+    history = []
+    for turn in range(turns):
+        _, history = chat.chat_agent(history, f"Question number {turn}: tell me more about topic {turn}.")
+    return stub
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--budget", type=int, default=4000, help="Prompt token budget")
+    parser.add_argument("--reply-words", type=int, default=250, help="Words per assistant reply")
+    args = parser.parse_args()
+
+    # Silence the agent's debug prints
+    chat._print_request = chat._print_response = lambda *a: None
+
+    unbounded = run(args.turns, ContextBuilder(max_prompt_tokens=10**9), args.reply_words)
+    budgeted = run(args.turns, ContextBuilder(max_prompt_tokens=args.budget), args.reply_words)
+
+    print(f"{'turn':>5} {'unbounded':>10} {'budgeted':>10}")
+    for turn, (full, bounded) in enumerate(zip(unbounded.prompt_tokens, budgeted.prompt_tokens), 1):
+        print(f"{turn:>5} {full:>10} {bounded:>10}")
+    print(f"\nTotal prompt tokens: unbounded={sum(unbounded.prompt_tokens)} budgeted={sum(budgeted.prompt_tokens)}")
+    print(f"Summary updates (extra LLM calls) with budget: {budgeted.summary_calls}")
+
+if __name__ == "__main__":
+    main()
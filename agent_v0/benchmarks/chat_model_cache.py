@@ -0,0 +1,196 @@
+"""
+Benchmark: chat model construction and connection reuse in the v1 research graph.
+
+Runs the sequence of LLM calls one v1 report makes (planner queries and plan,
+then queries, writer and grader for each section in parallel, then the final
+sections) against a local fake OpenAI-compatible server, after one warm-up
+report. The server counts the connections it accepts and delays the first
+response on each new connection by --connect-ms to stand in for the TCP + TLS
+handshake with OpenRouter.
+
+Modes:
+    fresh       a new ChatOpenAI per node call, as the graph used to do
+    fresh-pool  same, but every model also gets its own HTTP connection pool
+                (what langchain-openai versions without shared default clients do)
+    cached      graph.init_chat_model / init_structured_model with the model cache
+
+Usage:
+    python benchmarks/chat_model_cache.py [--reports 5] [--sections 5] [--connect-ms 150]
+"""
+import os
+import sys
+import gc
+import json
+import time
+import asyncio
+import argparse
+import tracemalloc
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark-key")
+
+STRUCTURED_RESPONSES = {
+    "Queries": {"queries": [{"search_query": "benchmark query"}]},
+    "Sections": {"sections": []},  # filled in per run with --sections
+    "Feedback": {"grade": "pass", "follow_up_queries": []},
+}
+
+class FakeOpenAIServer:
+    """Minimal HTTP/1.1 keep-alive server answering /chat/completions."""
+
+    def __init__(self, connect_ms, response_ms):
+        self.connect_ms = connect_ms
+        self.response_ms = response_ms
+        self.connections = 0
+        self.requests = 0
+
+    def completion(self, body):
+        message = {"role": "assistant", "content": "Section text. " * 20}
+        tools = body.get("tools")
+        response_format = body.get("response_format") or {}
+        if tools:
+            name = tools[0]["function"]["name"]
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": "call_0", "type": "function",
+                "function": {"name": name, "arguments": json.dumps(STRUCTURED_RESPONSES[name])},
+            }]}
+        elif response_format.get("type") == "json_schema":
+            name = response_format["json_schema"]["name"]
+            message = {"role": "assistant", "content": json.dumps(STRUCTURED_RESPONSES[name])}
+        return {
+            "id": "chatcmpl-0", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+        }
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        first = True
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = dict(
+                    line.split(": ", 1) for line in head.decode().split("\r\n")[1:] if ": " in line
+                )
+                length = int(next((v for k, v in headers.items() if k.lower() == "content-length"), "0"))
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                self.requests += 1
+                # Handshake cost is paid once per connection
+                delay = self.response_ms + (self.connect_ms if first else 0)
+                first = False
+                await asyncio.sleep(delay / 1000)
+                payload = json.dumps(self.completion(body)).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+def model_factory(mode):
+    import openai
+    from agents.deepresearch_optimus_alpha_v1 import graph
+
+    def get(model, schema=None):
+        if mode == "cached":
+            if schema is None:
+                return graph.init_chat_model(model=model, model_provider="openai")
+            return graph.init_structured_model(model=model, model_provider="openai", schema=schema)
+        kwargs = {}
+        if mode == "fresh-pool":
+            kwargs = {"http_client": openai.DefaultHttpxClient(), "http_async_client": openai.DefaultAsyncHttpxClient()}
+        llm = graph._build_chat_model(model, "openai", **kwargs)
+        return llm if schema is None else llm.with_structured_output(schema)
+
+    return get
+
+async def run_report(get_model, sections):
+    from langchain_core.messages import HumanMessage
+    from agents.deepresearch_optimus_alpha_v1.state import Queries, Sections, Feedback
+
+    prompt = [HumanMessage(content="benchmark")]
+    writer, planner = "writer-model", "planner-model"
+
+    # generate_report_plan
+    await get_model(writer, Queries).ainvoke(prompt)
+    await get_model(planner, Sections).ainvoke(prompt)
+
+    # build_section_with_web_research, fanned out with Send
+    async def section():
+        await get_model(writer, Queries).ainvoke(prompt)
+        await get_model(writer).ainvoke(prompt)
+        await get_model(planner, Feedback).ainvoke(prompt)
+
+    await asyncio.gather(*(section() for _ in range(sections)))
+
+    # write_final_sections
+    await asyncio.gather(*(get_model(writer).ainvoke(prompt) for _ in range(2)))
+
+async def run_mode(mode, args, port):
+    from agents.deepresearch_optimus_alpha_v1 import graph
+
+    graph.clear_chat_model_cache()
+    server = FakeOpenAIServer(args.connect_ms, args.response_ms)
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", port)
+    get_model = model_factory(mode)
+
+    # One unmeasured report first, so imports and schema conversions are not counted
+    await run_report(get_model, args.sections)
+    server.connections = server.requests = 0
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(args.reports):
+        await run_report(get_model, args.sections)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    listener.close()
+    await listener.wait_closed()
+    return {
+        "mode": mode,
+        "seconds_per_report": elapsed / args.reports,
+        "connections_per_report": server.connections / args.reports,
+        "requests_per_report": server.requests / args.reports,
+        "retained_kib": retained / 1024,
+        "peak_kib": peak / 1024,
+    }
+
+async def main_async(args):
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+
+    from agents.deepresearch_optimus_alpha_v1 import graph
+    graph.OPENROUTER_BASE_URL = os.environ["OPENROUTER_BASE_URL"]
+    STRUCTURED_RESPONSES["Sections"] = {"sections": [
+        {"name": f"Section {i}", "description": "d", "research": True, "content": ""} for i in range(args.sections)
+    ]}
+
+    print(f"{args.reports} reports x {args.sections} sections, connect {args.connect_ms:.0f}ms, response {args.response_ms:.0f}ms")
+    print(f"{'mode':<11} {'s/report':>9} {'conns/report':>13} {'calls/report':>13} {'retained KiB':>13} {'peak KiB':>9}")
+    for mode in args.modes.split(","):
+        row = await run_mode(mode, args, port)
+        print(f"{row['mode']:<11} {row['seconds_per_report']:>9.3f} {row['connections_per_report']:>13.1f} "
+              f"{row['requests_per_report']:>13.1f} {row['retained_kib']:>13.0f} {row['peak_kib']:>9.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=5)
+    parser.add_argument("--sections", type=int, default=5)
+    parser.add_argument("--connect-ms", type=float, default=150.0, help="Simulated handshake time per new connection")
+    parser.add_argument("--response-ms", type=float, default=20.0, help="Simulated model latency per call")
+    parser.add_argument("--modes", default="fresh,fresh-pool,cached")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Soak benchmark for the conversation store.
+
+Simulates many conversations, each receiving a few user/assistant turns, and
+prints the Python heap size as the run progresses. With a bounded store the
+heap should level off once the caps are reached instead of growing with the
+number of conversations.
+
+Usage:
+    python benchmarks/conversation_store_soak.py [--conversations 100000] [--backend memory|sqlite]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_store import InMemoryConversationStore, SQLiteConversationStore, TieredConversationStore
+
+def build_store(backend, max_conversations, max_bytes, db_path):
+    hot = InMemoryConversationStore(max_conversations=max_conversations, max_bytes=max_bytes, ttl_seconds=3600)
+    if backend == "memory":
+        return hot
+    return TieredConversationStore(hot, SQLiteConversationStore(db_path))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=100_000)
+    parser.add_argument("--turns", type=int, default=3, help="Turns per conversation")
+    parser.add_argument("--message-bytes", type=int, default=2_000, help="Size of each assistant message")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--max-conversations", type=int, default=5_000)
+    parser.add_argument("--max-bytes", type=int, default=32 * 1024 * 1024)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "soak.db")
+    store = build_store(args.backend, args.max_conversations, args.max_bytes, db_path)
+    reply = "x" * args.message_bytes
+    rng = random.Random(0)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    report_every = max(1, args.conversations // 10)
+    for i in range(args.conversations):
+        conversation_id = f"conv-{i}"
+        history = None
+        for turn in range(args.turns):
+            updated = (history or []) + [
+                {"role": "user", "content": f"question {turn} in {conversation_id}"},
+                {"role": "assistant", "content": reply},
+            ]
+            store.save_history(conversation_id, history, updated)
+            history = store.get(conversation_id)
+        # Revisit an older conversation now and then, as returning users do
+        if i and rng.random() < 0.1:
+            store.get(f"conv-{rng.randrange(i)}")
+        if (i + 1) % report_every == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            hot = store if args.backend == "memory" else store.hot
+            print(f"{i + 1:>8} conversations  heap={current / 2**20:8.1f} MiB  "
+                  f"hot tier={len(hot):>6} conversations / {hot.size_bytes / 2**20:6.1f} MiB  "
+                  f"elapsed={time.perf_counter() - start:6.1f}s")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: /health latency while /chat requests are running a slow, blocking agent.
+
+Registers a stub sync-only agent that sleeps (standing in for a deep research
+run making blocking LLM/search calls), fires concurrent /chat requests at it and
+samples /health latency in the meantime. Everything runs in-process through
+httpx's ASGI transport, no network or API keys needed.
+
+Usage:
+    python benchmarks/health_latency.py [--chats 32] [--agent-seconds 2.0] [--inline]
+
+--inline runs the agent directly on the event loop (the old behaviour) for comparison.
+"""
+import os
+import sys
+import time
+import types
+import asyncio
+import argparse
+import statistics
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("API_KEY", "benchmark-key")
+
+import httpx
+import agent
+import api
+
+STUB_AGENT = "bench_blocking_stub"
+
+def register_stub_agent(agent_seconds):
+    """Register a fake agent module with a blocking chat_agent."""
+    def chat_agent(chat_history, query):
+        time.sleep(agent_seconds)
+        return f"echo: {query}", chat_history + [
+            {"role": "user", "content": query},
+            {"role": "assistant", "content": f"echo: {query}"},
+        ]
+
+    module = types.ModuleType(f"agents.{STUB_AGENT}.agent")
+    module.chat_agent = chat_agent
+    agent.registry.register(STUB_AGENT, module)
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def sample_health(client, stop, samples, lags, interval=0.02):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/health")
+        samples.append((time.perf_counter() - start) * 1000)
+        # A blocked event loop shows up as a sleep that overshoots its interval
+        slept = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - slept - interval) * 1000)
+
+async def run(chats, agent_seconds, inline):
+    register_stub_agent(agent_seconds)
+
+    if inline:
+        # Simulate the old behaviour: call the blocking agent on the event loop
+        async def blocking_arun_agent(agent_name, chat_history, query):
+            return agent.run_agent(agent_name, chat_history, query)
+        api.arun_agent = blocking_arun_agent
+
+    transport = httpx.ASGITransport(app=api.app)
+    headers = {"X-API-Key": os.environ["API_KEY"]}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers, timeout=None) as client:
+        # Idle baseline
+        idle, idle_lags = [], []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_health(client, stop, idle, idle_lags))
+        await asyncio.sleep(0.5)
+        stop.set()
+        await sampler
+
+        # Under load
+        loaded, loaded_lags = [], []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_health(client, stop, loaded, loaded_lags))
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/chat", json={"agent_name": STUB_AGENT, "message": f"request {i}"})
+            for i in range(chats)
+        ])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+
+    ok = sum(1 for r in responses if r.status_code == 200)
+    mode = "inline (blocking)" if inline else f"executor ({agent.AGENT_WORKER_THREADS} threads)"
+    print(f"Mode:                {mode}")
+    print(f"Concurrent chats:    {chats} x {agent_seconds:.1f}s agent, {ok} ok, wall {elapsed:.2f}s")
+    for label, samples, lags in (("idle", idle, idle_lags), ("under load", loaded, loaded_lags)):
+        print(f"/health {label:<11} n={len(samples):<4} p50={statistics.median(samples):8.2f}ms "
+              f"p99={percentile(samples, 99):8.2f}ms max loop lag={max(lags):8.2f}ms")
+
+    agent.shutdown_agent_executor()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=32, help="Number of concurrent /chat requests")
+    parser.add_argument("--agent-seconds", type=float, default=2.0, help="Blocking time of each agent run")
+    parser.add_argument("--inline", action="store_true", help="Run agents on the event loop (old behaviour)")
+    args = parser.parse_args()
+    asyncio.run(run(args.chats, args.agent_seconds, args.inline))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark: LLM calls against a rate-limited provider, with and without the governor.
+
+A fake provider accepts --provider-concurrency calls at a time and
+--provider-rpm calls per minute. Anything over that gets a 429 with a
+Retry-After header, and the caller retries with exponential backoff like the
+OpenAI client does. Background callers (a batch) and interactive callers
+(chat requests) run at the same time.
+
+Without the governor every caller hits the provider directly. With it, calls
+take a slot from llm_governor.Governor first (background calls at
+PRIORITY_BACKGROUND), so the governor learns the provider's concurrency from
+the 429s and keeps interactive calls at the front of the queue.
+
+Reports completed calls per second, 429s, and p50/p95 latency per priority.
+
+Usage:
+    python benchmarks/llm_governor.py [--calls 400] [--interactive 40] [--provider-concurrency 8]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_governor import Governor, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, llm_priority
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__("429 Too Many Requests")
+        self.retry_after = retry_after
+
+class FakeProvider:
+    """Rejects calls over its concurrency or requests-per-minute limit."""
+
+    def __init__(self, args):
+        self.args = args
+        self.in_flight = 0
+        self.rejected = 0
+        self.started = []
+
+    async def call(self):
+        args = self.args
+        now = time.perf_counter()
+        self.started = [t for t in self.started if now - t < 60]
+        if self.in_flight >= args.provider_concurrency or len(self.started) >= args.provider_rpm:
+            self.rejected += 1
+            await asyncio.sleep(0.01)
+            raise RateLimited(args.retry_after_ms / 1000)
+        self.in_flight += 1
+        self.started.append(now)
+        try:
+            await asyncio.sleep(random.lognormvariate(0, 0.3) * args.llm_ms / 1000)
+        finally:
+            self.in_flight -= 1
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def call_with_retries(provider, governor):
+    # Backoff of the OpenAI client: 0.5s doubling up to 8s, honouring Retry-After
+    for attempt in range(12):
+        try:
+            if governor is None:
+                return await provider.call()
+            async with governor.aslot(1000) as slot:
+                try:
+                    return await provider.call()
+                except RateLimited as e:
+                    slot.record_rate_limit(e.retry_after)
+                    raise
+        except RateLimited as e:
+            await asyncio.sleep(max(e.retry_after, min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.75, 1.0)))
+    raise RuntimeError("gave up after 12 attempts")
+
+async def run(args, governed):
+    provider = FakeProvider(args)
+    governor = Governor("fake", "model", initial_concurrency=args.initial_concurrency) if governed else None
+    latencies = {PRIORITY_BACKGROUND: [], PRIORITY_INTERACTIVE: []}
+
+    async def call(priority, delay):
+        await asyncio.sleep(delay)
+        with llm_priority(priority):
+            start = time.perf_counter()
+            await call_with_retries(provider, governor)
+            latencies[priority].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    background = [call(PRIORITY_BACKGROUND, 0) for _ in range(args.calls)]
+    # Chat requests arrive while the batch is running
+    spread = args.calls * args.llm_ms / 1000 / args.provider_concurrency
+    interactive = [call(PRIORITY_INTERACTIVE, random.uniform(0, spread)) for _ in range(args.interactive)]
+    await asyncio.gather(*background, *interactive)
+    elapsed = time.perf_counter() - start
+    return elapsed, provider.rejected, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400, help="Background calls, all submitted at once")
+    parser.add_argument("--interactive", type=int, default=40, help="Interactive calls arriving during the batch")
+    parser.add_argument("--llm-ms", type=float, default=200.0, help="Median provider latency")
+    parser.add_argument("--provider-concurrency", type=int, default=8)
+    parser.add_argument("--provider-rpm", type=int, default=100000)
+    parser.add_argument("--retry-after-ms", type=float, default=500.0)
+    parser.add_argument("--initial-concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"{args.calls} background + {args.interactive} interactive calls, provider allows "
+          f"{args.provider_concurrency} concurrent / {args.provider_rpm} rpm, latency {args.llm_ms:.0f}ms")
+    print(f"{'mode':<10} {'calls/s':>8} {'429s':>6} {'bg p50 s':>9} {'bg p95 s':>9} {'chat p50 s':>11} {'chat p95 s':>11}")
+    for governed in (False, True):
+        elapsed, rejected, latencies = asyncio.run(run(args, governed))
+        background, interactive = latencies[PRIORITY_BACKGROUND], latencies[PRIORITY_INTERACTIVE]
+        throughput = (len(background) + len(interactive)) / elapsed
+        print(f"{'governed' if governed else 'direct':<10} {throughput:>8.1f} {rejected:>6} "
+              f"{percentile(background, 50):>9.2f} {percentile(background, 95):>9.2f} "
+              f"{percentile(interactive, 50):>11.2f} {percentile(interactive, 95):>11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: tail latency of LLM calls with and without hedging.
+
+Runs calls through hedging.hedged_ainvoke against fake models whose time to
+first token is log-normal, with an occasional stall (--stall-rate, --stall-ms)
+like a slow OpenRouter upstream. The secondary model has the same distribution,
+drawn independently. A warm-up phase fills the p95 latency window first.
+
+Reports p50/p95/p99/max latency per call and the extra requests hedging sent.
+With hedging, a stalled call costs about the p95 delay plus one normal call.
+
+Usage:
+    python benchmarks/llm_hedging.py [--calls 2000] [--concurrency 32] [--stall-rate 0.03]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+
+import hedging
+from metrics import LLM_HEDGES
+
+class FakeStreamingModel:
+    """Reports its start, sleeps until its first token and reports it, then sleeps for the rest of the answer."""
+
+    def __init__(self, args, requests):
+        self.args = args
+        self.requests = requests
+
+    def first_token_seconds(self):
+        args = self.args
+        if random.random() < args.stall_rate:
+            return args.stall_ms / 1000
+        return random.lognormvariate(0, args.sigma) * args.first_token_ms / 1000
+
+    async def ainvoke(self, messages, config=None):
+        self.requests.append(1)
+        callbacks = (config or {}).get("callbacks", [])
+        for callback in callbacks:
+            callback.on_chat_model_start({}, [messages])
+        await asyncio.sleep(self.first_token_seconds())
+        for callback in callbacks:
+            callback.on_llm_new_token("token")
+        await asyncio.sleep(self.args.generation_ms / 1000)
+        return AIMessage(content="answer")
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def run(args, hedge):
+    hedging.reset_policies()
+    requests = []
+    primary = FakeStreamingModel(args, requests)
+    secondary = FakeStreamingModel(args, requests) if hedge else None
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def call(measure):
+        async with semaphore:
+            start = time.perf_counter()
+            await hedging.hedged_ainvoke("benchmark", primary, secondary, [])
+            if measure:
+                latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(call(False) for _ in range(args.warmup)))
+    requests.clear()
+    await asyncio.gather(*(call(True) for _ in range(args.calls)))
+    return latencies, len(requests)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200, help="Calls run first to fill the latency window")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--first-token-ms", type=float, default=400.0, help="Median time to first token")
+    parser.add_argument("--sigma", type=float, default=0.4, help="Log-normal spread of the time to first token")
+    parser.add_argument("--generation-ms", type=float, default=300.0, help="Time from first token to the full answer")
+    parser.add_argument("--stall-rate", type=float, default=0.03, help="Share of calls that stall before the first token")
+    parser.add_argument("--stall-ms", type=float, default=10000.0)
+    args = parser.parse_args()
+
+    # Short default delay so the warm-up is not dominated by stalls
+    os.environ.setdefault("LLM_HEDGE_DEFAULT_DELAY", str(args.first_token_ms * 4 / 1000))
+    os.environ.setdefault("LLM_HEDGE_MIN_DELAY", "0.05")
+
+    print(f"{args.calls} calls, concurrency {args.concurrency}, first token median {args.first_token_ms:.0f}ms, "
+          f"stalls {args.stall_rate:.1%} x {args.stall_ms:.0f}ms")
+    print(f"{'mode':<8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7} {'extra requests':>15}")
+    for hedge in (False, True):
+        latencies, requests = asyncio.run(run(args, hedge))
+        extra = requests / args.calls - 1
+        print(f"{'hedged' if hedge else 'plain':<8} {percentile(latencies, 50):>7.2f} {percentile(latencies, 95):>7.2f} "
+              f"{percentile(latencies, 99):>7.2f} {max(latencies):>7.2f} {extra:>14.1%}")
+    delay = hedging.get_policy("benchmark").delay()
+    outcomes = {key[1]: int(value) for key, value in LLM_HEDGES._values.items() if key[0] == "benchmark"}
+    print(f"hedge delay {delay:.2f}s, outcomes (incl. warm-up): {outcomes}")
+
+if __name__ == "__main__":
+    main()
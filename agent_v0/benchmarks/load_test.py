@@ -0,0 +1,313 @@
+"""
+Offline load test for api.py.
+
+Starts the API with uvicorn in a child process, with stub agents standing in
+for DeepInfra, OpenRouter and the search backends. The stubs sleep for
+latencies drawn from log-normal distributions (set by median and p95), so the
+numbers reflect the serving path: HTTP handling, agent dispatch, the worker
+pool, conversation storage and streaming.
+
+The driver runs closed-loop clients at each step of a concurrency curve and
+reports requests per second, p50/p95/p99 latency, the server's event-loop lag
+and its resident memory. No network access or API keys are needed.
+
+Stub agents:
+    load_stub_chat      async chat agent, one LLM call, streams tokens
+    load_stub_sync      blocking chat agent, one LLM call (runs on the worker pool)
+    load_stub_research  blocking research agent: plan, then search + write per section,
+                        reporting progress events
+
+Usage:
+    python benchmarks/load_test.py [--agent load_stub_chat] [--endpoint chat|stream|batch]
+                                   [--concurrency 1,8,32,128] [--duration 10]
+"""
+import os
+import sys
+import json
+import math
+import time
+import types
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+API_KEY = "load-test-key"
+STATS_PATH = "/__load_test/stats"
+
+# --- Latency model ---
+
+class LogNormal:
+    """Latency distribution given its median and 95th percentile, in milliseconds."""
+
+    def __init__(self, median_ms, p95_ms):
+        self.mu = math.log(max(median_ms, 0.001) / 1000)
+        self.sigma = math.log(max(p95_ms, median_ms) / max(median_ms, 0.001)) / 1.645
+
+    def sample(self):
+        return random.lognormvariate(self.mu, self.sigma)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def rss_bytes():
+    """Resident memory of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+# --- Server side ---
+
+def build_stub_agents(llm, search, sections, tokens):
+    """Fake agent modules with the same entry points as the real agents."""
+
+    def answer(chat_history, query, response):
+        return response, chat_history + [
+            {"role": "user", "content": query},
+            {"role": "assistant", "content": response},
+        ]
+
+    # Async chat agent, like chat_deepseek_v3
+    chat = types.ModuleType("agents.load_stub_chat.agent")
+
+    def chat_agent(chat_history, query):
+        time.sleep(llm.sample())
+        return answer(chat_history, query, f"echo: {query}")
+
+    async def achat_agent(chat_history, query):
+        await asyncio.sleep(llm.sample())
+        return answer(chat_history, query, f"echo: {query}")
+
+    async def astream_agent(chat_history, query):
+        delay = llm.sample() / tokens
+        for i in range(tokens):
+            await asyncio.sleep(delay)
+            yield {"event": "token", "data": {"content": f"tok{i} "}}
+        response, history = answer(chat_history, query, f"echo: {query}")
+        yield {"event": "final", "data": {"response": response, "history": history}}
+
+    chat.chat_agent, chat.achat_agent, chat.astream_agent = chat_agent, achat_agent, astream_agent
+
+    # Blocking chat agent, run on the agent worker pool
+    sync = types.ModuleType("agents.load_stub_sync.agent")
+    sync.chat_agent = chat_agent
+
+    # Blocking research agent with progress events, like deepresearch_optimus_alpha
+    research = types.ModuleType("agents.load_stub_research.agent")
+
+    def research_agent(chat_history, query, on_event=None):
+        emit = on_event or (lambda event, data: None)
+        time.sleep(llm.sample())
+        names = [f"Section {i + 1}" for i in range(sections)]
+        emit("plan_ready", {"sections": [{"name": name} for name in names]})
+        for name in names:
+            emit("search_started", {"section": name, "iteration": 1, "queries": [query]})
+            time.sleep(search.sample())
+            emit("search_finished", {"section": name, "iteration": 1, "source_chars": 4000})
+            time.sleep(llm.sample())
+            emit("section_written", {"section": name, "content": "..."})
+        return answer(chat_history, query, f"report on: {query}")
+
+    research.chat_agent = research_agent
+    return {"load_stub_chat": chat, "load_stub_sync": sync, "load_stub_research": research}
+
+async def monitor_loop_lag(lags, interval=0.01):
+    # A blocked event loop shows up as a sleep that overshoots its interval
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - start - interval) * 1000)
+
+def serve(args):
+    os.environ["API_KEY"] = API_KEY
+    os.environ.setdefault("PRELOAD_AGENTS", "")
+
+    import uvicorn
+    import agent
+    import api
+
+    stubs = build_stub_agents(
+        LogNormal(args.llm_median_ms, args.llm_p95_ms),
+        LogNormal(args.search_median_ms, args.search_p95_ms),
+        args.sections,
+        args.tokens,
+    )
+    for name, module in stubs.items():
+        agent.registry.register(name, module)
+
+    lags = []
+
+    async def stats(reset: bool = False):
+        result = {
+            "loop_lag_p99_ms": percentile(lags, 99),
+            "loop_lag_max_ms": max(lags, default=0.0),
+            "rss_bytes": rss_bytes(),
+        }
+        if reset:
+            lags.clear()
+        return result
+
+    api.app.add_api_route(STATS_PATH, stats, methods=["GET"])
+
+    async def main():
+        monitor = asyncio.create_task(monitor_loop_lag(lags))
+        server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=args.port, log_level="warning"))
+        try:
+            await server.serve()
+        finally:
+            monitor.cancel()
+
+    asyncio.run(main())
+
+# --- Driver side ---
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def wait_for_server(client, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+async def send(client, args, worker, turn):
+    """One request; returns True if it succeeded."""
+    # Each client keeps a conversation for a few turns so history storage is exercised
+    conversation_id = f"load-{worker}-{turn // args.turns_per_conversation}"
+    body = {"agent_name": args.agent, "message": f"question {turn}", "conversation_id": conversation_id}
+    if args.endpoint == "chat":
+        response = await client.post("/chat", json=body)
+        return response.status_code == 200
+    if args.endpoint == "stream":
+        ok = False
+        async with client.stream("POST", "/chat/stream", json=body) as response:
+            async for line in response.aiter_lines():
+                if line == "event: final":
+                    ok = True
+                elif line == "event: error":
+                    ok = False
+        return response.status_code == 200 and ok
+    batch = {"requests": [
+        {"agent_name": args.agent, "message": f"question {turn}.{i}"} for i in range(args.batch_size)
+    ]}
+    response = await client.post("/chat/batch", json=batch)
+    return response.status_code == 200 and all(r["status_code"] == 200 for r in response.json()["results"])
+
+async def run_step(client, args, concurrency):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(index):
+        nonlocal errors
+        turn = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = await send(client, args, index, turn)
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+            turn += 1
+
+    await client.get(STATS_PATH, params={"reset": True})
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stats = (await client.get(STATS_PATH)).json()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        **stats,
+    }
+
+async def drive(args, port):
+    import httpx
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    limits = httpx.Limits(max_connections=max(levels) + 4, max_keepalive_connections=max(levels) + 4)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", headers={"X-API-Key": API_KEY},
+                                 timeout=None, limits=limits) as client:
+        await wait_for_server(client, args.process)
+        print(f"agent={args.agent} endpoint={args.endpoint} duration={args.duration:.0f}s per step "
+              f"llm median/p95={args.llm_median_ms:.0f}/{args.llm_p95_ms:.0f}ms "
+              f"search median/p95={args.search_median_ms:.0f}/{args.search_p95_ms:.0f}ms")
+        print(f"{'conc':>5} {'reqs':>7} {'errs':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'lag p99':>8} {'lag max':>8} {'rss MiB':>8}")
+        results = []
+        for concurrency in levels:
+            row = await run_step(client, args, concurrency)
+            results.append(row)
+            print(f"{row['concurrency']:>5} {row['requests']:>7} {row['errors']:>5} {row['rps']:>8.1f} "
+                  f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} "
+                  f"{row['loop_lag_p99_ms']:>8.1f} {row['loop_lag_max_ms']:>8.1f} {row['rss_bytes'] / 2**20:>8.1f}")
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agent", default="load_stub_chat",
+                        choices=["load_stub_chat", "load_stub_sync", "load_stub_research"])
+    parser.add_argument("--endpoint", default="chat", choices=["chat", "stream", "batch"])
+    parser.add_argument("--concurrency", default="1,8,32,128", help="Comma-separated concurrency curve")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency step")
+    parser.add_argument("--llm-median-ms", type=float, default=300.0)
+    parser.add_argument("--llm-p95-ms", type=float, default=1200.0)
+    parser.add_argument("--search-median-ms", type=float, default=400.0)
+    parser.add_argument("--search-p95-ms", type=float, default=1500.0)
+    parser.add_argument("--sections", type=int, default=3, help="Sections per load_stub_research report")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens streamed per load_stub_chat answer")
+    parser.add_argument("--batch-size", type=int, default=16, help="Items per /chat/batch request")
+    parser.add_argument("--turns-per-conversation", type=int, default=4)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    port = free_port()
+    server_args = [a for a in sys.argv[1:] if not a.startswith("--json")]
+    args.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), *server_args, "--serve", "--port", str(port)])
+    try:
+        results = asyncio.run(drive(args, port))
+    finally:
+        args.process.terminate()
+        args.process.wait(timeout=30)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
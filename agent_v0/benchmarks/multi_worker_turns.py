@@ -0,0 +1,128 @@
+"""
+Multi-worker load test for the shared conversation store.
+
+Starts 1, 2, 4... worker processes that each play the role of an API worker:
+they run many concurrent chat turns against a small set of shared
+conversations in one SQLite database, so turns on the same conversation race
+across processes. Every turn reads the history with its version, spends some
+CPU time (request handling, prompt building) and waits on a simulated agent,
+then saves with compare-and-swap on the version, exactly like /chat does.
+
+After each run the database is checked for lost turns, and turns per second
+are reported per worker count. Throughput should grow close to linearly with
+the number of workers until the machine runs out of cores.
+
+Usage:
+    python benchmarks/multi_worker_turns.py [--workers 1,2,4] [--turns 400] [--conversations 20]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_store import (ConversationLocks, InMemoryConversationStore, SQLiteConversationStore,
+                                TieredConversationStore)
+
+def burn_cpu(ms):
+    end = time.perf_counter() + ms / 1000
+    while time.perf_counter() < end:
+        pass
+
+async def run_turn(store, locks, conversation_id, worker, turn, args):
+    async with locks.get(conversation_id):
+        history, version = store.get_with_version(conversation_id)
+        history = history or []
+        burn_cpu(args.cpu_ms)
+        await asyncio.sleep(random.uniform(0.5, 1.5) * args.agent_ms / 1000)
+        updated = history + [
+            {"role": "user", "content": f"question {worker}-{turn}"},
+            {"role": "assistant", "content": f"answer {worker}-{turn}"},
+        ]
+        new_version = store.save_history(conversation_id, history, updated, expected_version=version)
+    # More than one version step means another worker saved first and this turn was rebased
+    return new_version - version > 1
+
+async def run_worker_async(worker, db_path, turns, args):
+    store = TieredConversationStore(InMemoryConversationStore(), SQLiteConversationStore(db_path))
+    locks = ConversationLocks()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    rng = random.Random(worker)
+
+    async def one(turn):
+        async with semaphore:
+            return await run_turn(store, locks, f"conv-{rng.randrange(args.conversations)}", worker, turn, args)
+
+    rebased = await asyncio.gather(*(one(turn) for turn in range(turns)))
+    store.close()
+    return sum(rebased)
+
+def run_worker(worker, db_path, turns, args, start_event, results):
+    start_event.wait()
+    results.put(asyncio.run(run_worker_async(worker, db_path, turns, args)))
+
+def check_database(db_path, expected_turns):
+    store = SQLiteConversationStore(db_path)
+    rows = store._conn.execute("SELECT conversation_id, role FROM messages ORDER BY id").fetchall()
+    versions = store._conn.execute("SELECT SUM(version) FROM conversations").fetchone()[0] or 0
+    store.close()
+    user = sum(1 for _, role in rows if role == "user")
+    assistant = sum(1 for _, role in rows if role == "assistant")
+    lost = expected_turns - user
+    return lost, user == assistant and versions == expected_turns
+
+def run(workers, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "conversations.db")
+        SQLiteConversationStore(db_path).close()
+        turns_per_worker = args.turns // workers
+        ctx = multiprocessing.get_context("spawn")
+        start_event = ctx.Event()
+        results = ctx.Queue()
+        processes = [
+            ctx.Process(target=run_worker, args=(w, db_path, turns_per_worker, args, start_event, results))
+            for w in range(workers)
+        ]
+        for p in processes:
+            p.start()
+        # Let interpreters start up before timing
+        time.sleep(1.0)
+        started = time.perf_counter()
+        start_event.set()
+        rebased = sum(results.get() for _ in processes)
+        elapsed = time.perf_counter() - started
+        for p in processes:
+            p.join()
+        total = turns_per_worker * workers
+        lost, consistent = check_database(db_path, total)
+    return total, elapsed, rebased, lost, consistent
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts to compare")
+    parser.add_argument("--turns", type=int, default=400, help="Total turns per run, split across workers")
+    parser.add_argument("--conversations", type=int, default=20, help="Shared conversations the turns land on")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent turns per worker")
+    parser.add_argument("--cpu-ms", type=float, default=20.0, help="CPU time per turn in the worker")
+    parser.add_argument("--agent-ms", type=float, default=20.0, help="Mean simulated agent latency per turn")
+    args = parser.parse_args()
+
+    print(f"{'workers':>7}  {'turns':>6}  {'seconds':>8}  {'turns/s':>8}  {'speedup':>7}  {'rebased':>7}  {'lost':>5}")
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        total, elapsed, rebased, lost, consistent = run(workers, args)
+        rate = total / elapsed
+        baseline = baseline or rate
+        print(f"{workers:>7}  {total:>6}  {elapsed:>8.2f}  {rate:>8.1f}  {rate / baseline:>6.2f}x  {rebased:>7}  {lost:>5}")
+        if lost or not consistent:
+            print("ERROR: turns were lost or versions do not match the stored turns")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
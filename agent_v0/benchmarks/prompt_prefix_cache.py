@@ -0,0 +1,197 @@
+"""
+Benchmark: how much of each v0 research prompt a provider prefix cache can reuse.
+
+Runs deepresearch_optimus_alpha's pipeline with a stub LLM and stub search (no
+API calls) and records every prompt. The same calls are also rebuilt the way
+the agent assembled them before (the v1 templates, which still format the
+topic and sources into the middle of the instructions, after the whole memory).
+
+Each prompt is checked against a simulated provider cache holding every prompt
+sent before it, OpenAI-style: the longest shared prefix counts once it reaches
+1024 tokens, in 128-token steps. Several runs on different topics go through
+the same cache, as they would on one API key.
+
+Reports per step and overall the prompt tokens, the hit ratio, and the
+uncached tokens, which the provider has to prefill.
+
+Usage:
+    python benchmarks/prompt_prefix_cache.py [--runs 3] [--sections 4] [--source-tokens 6000]
+"""
+import os
+import re
+import sys
+import json
+import random
+import argparse
+from collections import defaultdict
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark-key")
+os.environ.setdefault("REPORT_CACHE", "off")
+os.environ.setdefault("RUN_CHECKPOINTS", "off")
+os.environ.setdefault("LLM_CACHE", "off")
+# Sections in plan order, so every run records its calls in the same order
+os.environ.setdefault("MAX_CONCURRENT_SECTIONS", "1")
+
+import agents.deepresearch_optimus_alpha.agent as v0
+import agents.deepresearch_optimus_alpha_v1.prompts as legacy
+from token_counter import count_tokens
+
+WORDS = "model data system network result method analysis energy market policy study growth risk".split()
+
+def words(n, rng):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+def field(text, tag):
+    match = re.search(f"<{re.escape(tag)}[^>]*>\n(.*?)\n</", text, re.S)
+    return match.group(1) if match else ""
+
+class StubPipeline:
+    """Answers every step like the real models would, in shape and size, and records the prompts."""
+
+    def __init__(self, args, rng):
+        self.args = args
+        self.rng = rng
+        self.calls = []
+        self.grades = defaultdict(int)
+
+    def call_llm(self, messages, step="llm", on_delta=None, parse=None, **kwargs):
+        self.calls.append((step, messages))
+        reply = self.reply(step, messages)
+        if on_delta is not None:
+            on_delta(reply)
+        return parse(reply) if parse is not None else reply
+
+    def reply(self, step, messages):
+        if step == "report_plan":
+            sections = [{"name": "Introduction", "description": "Overview", "research": False, "content": ""}]
+            sections += [{"name": f"Topic {i}", "description": f"Aspect {i} of the topic", "research": True, "content": ""}
+                         for i in range(self.args.sections)]
+            sections.append({"name": "Conclusion", "description": "Summary", "research": False, "content": ""})
+            return json.dumps({"sections": sections})
+        if step == "grade_section":
+            section = field(messages[-1]["content"], "section topic")
+            self.grades[section] += 1
+            grade = "pass" if self.grades[section] >= self.args.iterations else "fail"
+            return json.dumps({"grade": grade, "follow_up_queries": [] if grade == "pass" else [{"search_query": "more"}]})
+        if step in ("write_section", "write_final_section"):
+            return words(200, self.rng)
+        return "\n".join(f"query {self.rng.random():.6f}" for _ in range(2))
+
+    def search(self, queries, max_tokens=None):
+        # Roughly one token per word; each search returns different sources
+        return f"Sources for {queries}:\n" + words(min(self.args.source_tokens, max_tokens or 10 ** 9), self.rng)
+
+    def search_results(self, queries, max_results=5):
+        return [{"query": ", ".join(queries), "rank": 0, "title": "Source", "url": f"https://example.com/{self.rng.random()}",
+                 "content": words(self.args.source_tokens, self.rng)}]
+
+def legacy_calls(calls, config, memory=None):
+    """
+    The same calls assembled as the agent did before: memory, then the formatted instructions.
+
+    memory: the stored conversation the run started from, ending with the user's query
+    """
+    memory, rebuilt = list(memory or []), []
+    for step, messages in calls:
+        task = messages[-1]["content"]
+        shared = messages[-2]["content"] if messages[-2]["content"].startswith(("<Source material>", "<Available")) else ""
+        topic = field(task, "Report topic")
+        if not memory:
+            # The user's query
+            memory = messages[1:2]
+        if step == "report_queries":
+            system = legacy.report_planner_query_writer_instructions.format(
+                topic=topic, report_organization=config.report_structure, number_of_queries=config.number_of_queries)
+            prompt = memory + [{"role": "system", "content": system},
+                               {"role": "user", "content": "Generate search queries that will help with planning the sections of the report."}]
+        elif step == "report_plan":
+            system = legacy.report_planner_instructions.format(
+                topic=topic, report_organization=config.report_structure, context=field(shared, "Source material"), feedback="")
+            prompt = memory + [{"role": "system", "content": system},
+                               {"role": "user", "content": "Generate the sections of the report."}]
+        elif step == "section_queries":
+            system = legacy.query_writer_instructions.format(
+                topic=topic, section_topic=field(task, "Section topic"), number_of_queries=config.number_of_queries)
+            prompt = memory = memory + [{"role": "system", "content": system},
+                                        {"role": "user", "content": "Generate search queries on the provided topic."}]
+        elif step == "write_section":
+            inputs = legacy.section_writer_inputs.format(
+                topic=topic, section_name=field(task, "Section name"), section_topic=field(task, "Section topic"),
+                context=field(shared, "Source material"), section_content=field(task, "Existing section content"))
+            prompt = memory = memory + [{"role": "system", "content": legacy.section_writer_instructions},
+                                        {"role": "user", "content": inputs}]
+        elif step == "grade_section":
+            system = legacy.section_grader_instructions.format(
+                topic=topic, section_topic=field(task, "section topic"), section=field(task, "section content"),
+                number_of_follow_up_queries=config.number_of_queries)
+            prompt = memory = memory + [{"role": "system", "content": system},
+                                        {"role": "user", "content": "Grade the report."}]
+        else:
+            system = legacy.final_section_writer_instructions.format(
+                topic=topic, section_name=field(task, "Section name"), section_topic=field(task, "Section topic"),
+                context=field(shared, "Available report content"))
+            prompt = memory = memory + [{"role": "system", "content": system},
+                                        {"role": "user", "content": "Generate a report section based on the provided sources."}]
+        rebuilt.append((step, prompt))
+    return rebuilt
+
+def serialize(messages):
+    return "".join(f"<|{m['role']}|>{m['content']}" for m in messages)
+
+def common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+def simulate_cache(calls):
+    """Per step: (prompt tokens, cached tokens) against every earlier prompt."""
+    seen, totals = [], defaultdict(lambda: [0, 0])
+    for step, messages in calls:
+        text = serialize(messages)
+        prefix = max((common_prefix(text, earlier) for earlier in seen), default=0)
+        prefix_tokens = count_tokens(text[:prefix])
+        cached = prefix_tokens // 128 * 128 if prefix_tokens >= 1024 else 0
+        totals[step][0] += count_tokens(text)
+        totals[step][1] += cached
+        seen.append(text)
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Research runs on different topics sharing one cache")
+    parser.add_argument("--sections", type=int, default=4, help="Research sections per report")
+    parser.add_argument("--iterations", type=int, default=2, help="Write/grade iterations per section")
+    parser.add_argument("--source-tokens", type=int, default=6000, help="Approximate size of one search's sources")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    new_calls, old_calls = [], []
+    for run in range(args.runs):
+        stub = StubPipeline(args, rng)
+        v0.call_llm, v0.smart_search, v0.search_results = stub.call_llm, stub.search, stub.search_results
+        v0.chat_agent([], f"Research topic number {run}: {words(6, rng)}")
+        new_calls += stub.calls
+        old_calls += legacy_calls(stub.calls, v0.Configuration())
+
+    print(f"{args.runs} runs x {args.sections} research sections x {args.iterations} iterations, "
+          f"sources ~{args.source_tokens} tokens, {len(new_calls)} calls")
+    print(f"{'':<20} {'before':>32} {'after':>32}")
+    print(f"{'step':<20} {'prompt':>12} {'hit':>6} {'uncached':>12} {'prompt':>12} {'hit':>6} {'uncached':>12}")
+    old, new = simulate_cache(old_calls), simulate_cache(new_calls)
+    for step in list(dict.fromkeys(step for step, _ in new_calls)) + ["total"]:
+        if step == "total":
+            old_prompt, old_cached = map(sum, zip(*old.values()))
+            new_prompt, new_cached = map(sum, zip(*new.values()))
+        else:
+            (old_prompt, old_cached), (new_prompt, new_cached) = old[step], new[step]
+        print(f"{step:<20} {old_prompt:>12} {old_cached / old_prompt:>6.0%} {old_prompt - old_cached:>12} "
+              f"{new_prompt:>12} {new_cached / new_prompt:>6.0%} {new_prompt - new_cached:>12}")
+
+if __name__ == "__main__":
+    main()
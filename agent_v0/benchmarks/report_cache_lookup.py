@@ -0,0 +1,93 @@
+"""
+Benchmark: near-duplicate topic lookups in the research report cache.
+
+Fills a ReportCache with synthetic topics drawn from a fixed vocabulary, then
+measures insert throughput, lookup latency for unseen topics (misses) and for
+near-duplicates of stored topics (one word dropped, added or reordered), and
+the hit rate on those near-duplicates. Lookups only compare against reports
+sharing an LSH bucket, so their latency should stay flat as the cache grows.
+
+Usage:
+    python benchmarks/report_cache_lookup.py [--reports 1000,10000,100000] [--lookups 1000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_cache import ReportCache
+
+def make_vocabulary(size, rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(5, 9))) for _ in range(size)]
+
+def make_topic(vocabulary, rng):
+    return " ".join(rng.sample(vocabulary, rng.randint(4, 8)))
+
+def perturb(topic, vocabulary, rng):
+    words = topic.split()
+    change = rng.choice(["drop", "add", "reorder"])
+    if change == "drop" and len(words) > 4:
+        words.pop(rng.randrange(len(words)))
+    elif change == "add":
+        words.insert(rng.randrange(len(words) + 1), rng.choice(vocabulary))
+    else:
+        rng.shuffle(words)
+    return " ".join(words)
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def timed(fn, items):
+    latencies, results = [], []
+    for item in items:
+        start = time.perf_counter()
+        results.append(fn(item))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", default="1000,10000,100000", help="Comma-separated cache sizes")
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    report = "Report text. " * 50
+
+    print(f"{'reports':>8} {'inserts/s':>10} {'miss p50 ms':>12} {'miss p99 ms':>12} "
+          f"{'dup p50 ms':>11} {'dup p99 ms':>11} {'dup hit rate':>13} {'db MiB':>7}")
+    for size in [int(n) for n in args.reports.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "report_cache.db")
+            cache = ReportCache(path, threshold=args.threshold)
+            topics = [make_topic(vocabulary, rng) for _ in range(size)]
+            start = time.perf_counter()
+            for topic in topics:
+                cache.put(topic, report)
+            inserts_per_second = size / (time.perf_counter() - start)
+
+            unseen = [make_topic(vocabulary, rng) for _ in range(args.lookups)]
+            duplicates = [perturb(rng.choice(topics), vocabulary, rng) for _ in range(args.lookups)]
+            miss_latencies, _ = timed(cache.lookup, unseen)
+            dup_latencies, matches = timed(cache.lookup, duplicates)
+            hit_rate = sum(match is not None for match in matches) / len(matches)
+            cache.close()
+            size_mib = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp)) / 2**20
+
+        print(f"{size:>8} {inserts_per_second:>10.0f} {percentile(miss_latencies, 50):>12.2f} "
+              f"{percentile(miss_latencies, 99):>12.2f} {percentile(dup_latencies, 50):>11.2f} "
+              f"{percentile(dup_latencies, 99):>11.2f} {hit_rate:>13.1%} {size_mib:>7.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark: backend calls and search time of research runs, with and without the search cache.
+
+Serves Tavily from an in-process fake (an httpx mock transport, no network)
+with a log-normal latency per query. Research runs arrive --parallel at a time,
+and every run searches its --sections sections concurrently, --queries queries
+each, through the v0 SearchClient. Each query is, with probability --overlap,
+one of --popular queries shared by all runs, respelled with random case and
+spacing. Otherwise it is a query no other run asks.
+
+"off" sends every query to the backend. "memory" uses one in-memory cache.
+"sqlite" uses two workers with their own cache on one SQLite file, taking
+turns at the runs, so a worker is served results the other one fetched.
+Concurrent runs asking the same popular query share one backend call.
+
+Reports per mode the backend calls, the mean and p95 time of a section's
+search, and the cache lookups by result.
+
+Usage:
+    python benchmarks/search_cache.py [--topics 40] [--parallel 4] [--overlap 0.5] [--popular 60]
+"""
+import os
+import sys
+import math
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("TAVILY_API_KEY", "benchmark-key")
+
+import httpx
+
+import agents.deepresearch_optimus_alpha.search as search
+from metrics import SEARCH_CACHE_LOOKUPS
+from search_cache import SearchCache
+
+class FakeTavily:
+    """Answers Tavily searches after a random latency and counts them."""
+
+    def __init__(self, args):
+        self.rng = random.Random(0)
+        self.mu = math.log(args.median_ms)
+        self.sigma = (math.log(args.p95_ms) - self.mu) / 1.645
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    async def handle(self, request):
+        with self._lock:
+            self.calls += 1
+            latency = self.rng.lognormvariate(self.mu, self.sigma) / 1000
+        await asyncio.sleep(latency)
+        query = request.read().decode()
+        return httpx.Response(200, json={"results": [
+            {"title": f"Result {i}", "url": f"https://example.com/{hash(query)}/{i}", "content": "Fake content."}
+            for i in range(5)]})
+
+def workload(args):
+    """Per run, the query batch of each section."""
+    rng = random.Random(1)
+    popular = [f"popular question {i}" for i in range(args.popular)]
+
+    def spelling(query):
+        words = [word.upper() if rng.random() < 0.2 else word for word in query.split()]
+        return (" " if rng.random() < 0.7 else "  ").join(words)
+
+    runs = []
+    for topic in range(args.topics):
+        runs.append([
+            [spelling(rng.choice(popular)) if rng.random() < args.overlap else f"topic {topic} section {s} query {q}"
+             for q in range(args.queries)]
+            for s in range(args.sections)])
+    return runs
+
+def lookups():
+    return {labels[1]: value for labels, value in SEARCH_CACHE_LOOKUPS._values.items()}
+
+def run(args, caches):
+    fake = FakeTavily(args)
+    clients = [search.SearchClient(concurrency={"tavily": args.concurrency}, query_timeout=30,
+                                   transport=httpx.MockTransport(fake.handle)) for _ in caches]
+    runs = workload(args)
+    before = Counter(lookups())
+    seconds = []
+
+    def section(client, queries):
+        start = time.perf_counter()
+        client.search("tavily", queries)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=args.parallel * args.sections) as pool:
+        for wave, start in enumerate(range(0, len(runs), args.parallel)):
+            worker = wave % len(caches)
+            search.get_search_cache = lambda cache=caches[worker]: cache
+            batches = [queries for topic in runs[start:start + args.parallel] for queries in topic]
+            seconds += pool.map(lambda queries: section(clients[worker], queries), batches)
+    return fake.calls, seconds, Counter(lookups()) - before
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics", type=int, default=40, help="Research runs per mode")
+    parser.add_argument("--parallel", type=int, default=4, help="Runs in flight at a time")
+    parser.add_argument("--sections", type=int, default=5, help="Sections per run, searched concurrently")
+    parser.add_argument("--queries", type=int, default=3, help="Queries per section")
+    parser.add_argument("--overlap", type=float, default=0.5, help="Share of queries drawn from the popular pool")
+    parser.add_argument("--popular", type=int, default=60, help="Popular queries shared between runs")
+    parser.add_argument("--concurrency", type=int, default=8, help="Tavily queries in flight per worker")
+    parser.add_argument("--median-ms", type=float, default=400.0, help="Median query latency")
+    parser.add_argument("--p95-ms", type=float, default=1200.0, help="95th percentile query latency")
+    args = parser.parse_args()
+
+    total = args.topics * args.sections * args.queries
+    print(f"{args.topics} runs ({args.parallel} at a time) x {args.sections} sections x {args.queries} queries = "
+          f"{total} queries, {args.overlap:.0%} from {args.popular} popular queries")
+    print(f"{'mode':<8} {'calls':>6} {'mean s':>8} {'p95 s':>8}  lookups")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search_cache.db")
+        modes = [("off", [None]), ("memory", [SearchCache()]),
+                 ("sqlite", [SearchCache(path=path), SearchCache(path=path)])]
+        for label, caches in modes:
+            calls, seconds, counts = run(args, caches)
+            p95 = sorted(seconds)[max(0, math.ceil(len(seconds) * 0.95) - 1)]
+            summary = ", ".join(f"{key} {counts[key]:.0f}" for key in ("hit", "negative_hit", "miss", "coalesced")
+                                if counts[key])
+            print(f"{label:<8} {calls:>6} {statistics.mean(seconds):>8.2f} {p95:>8.2f}  {summary or '-'}")
+            for cache in caches:
+                if cache is not None:
+                    cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: prompt tokens per v0 research report, with memory threading and with scoped step contexts.
+
+Runs a multi-turn conversation of research requests through
+deepresearch_optimus_alpha with a stub LLM and stub search (no API calls),
+the same stubs as prompt_prefix_cache.py.
+
+"before" rebuilds every call the way the agent used to assemble it: each
+step's system prompt and inputs (sources included) were appended to a memory
+that every later step carried, and that memory was saved as the chat history.
+"after" is what the agent sends now: each step gets the user and assistant
+turns (up to max_history_tokens) plus only the artifact it works from.
+
+Reports per turn the total prompt tokens of the report, the largest single
+prompt, and the size of the chat history saved for the next turn.
+
+Usage:
+    python benchmarks/v0_prompt_context.py [--turns 3] [--sections 4] [--source-tokens 6000]
+"""
+import os
+import sys
+import random
+import argparse
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.prompt_prefix_cache import StubPipeline, legacy_calls, words
+import agents.deepresearch_optimus_alpha.agent as v0
+from token_counter import count_message_tokens
+
+def totals(calls):
+    sizes = [count_message_tokens(messages) for _, messages in calls]
+    return sum(sizes), max(sizes)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=3, help="Research requests in one conversation")
+    parser.add_argument("--sections", type=int, default=4, help="Research sections per report")
+    parser.add_argument("--iterations", type=int, default=2, help="Write/grade iterations per section")
+    parser.add_argument("--source-tokens", type=int, default=6000, help="Approximate size of one search's sources")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    config = v0.Configuration()
+    history, old_history = [], []
+    print(f"{args.sections} research sections x {args.iterations} iterations, sources ~{args.source_tokens} tokens")
+    print(f"{'':<6} {'before':>36} {'after':>36}")
+    print(f"{'turn':<6} {'prompt':>12} {'largest':>10} {'history':>12} {'prompt':>12} {'largest':>10} {'history':>12}")
+    overall = [0, 0]
+    for turn in range(args.turns):
+        query = f"Research topic number {turn}: {words(6, rng)}"
+        stub = StubPipeline(args, rng)
+        v0.call_llm, v0.smart_search, v0.search_results = stub.call_llm, stub.search, stub.search_results
+        report, history = v0.chat_agent(history, query)
+
+        old_calls = legacy_calls(stub.calls, config, old_history + [{"role": "user", "content": query}])
+        # The last call's memory, plus the report, was saved as the chat history
+        old_history = old_calls[-1][1] + [{"role": "assistant", "content": report}]
+
+        (old_prompt, old_largest), (new_prompt, new_largest) = totals(old_calls), totals(stub.calls)
+        overall[0] += old_prompt
+        overall[1] += new_prompt
+        print(f"{turn + 1:<6} {old_prompt:>12} {old_largest:>10} {count_message_tokens(old_history):>12} "
+              f"{new_prompt:>12} {new_largest:>10} {count_message_tokens(history):>12}")
+    print(f"total prompt tokens: {overall[0]} before, {overall[1]} after ({overall[0] / overall[1]:.1f}x fewer)")
+
+if __name__ == "__main__":
+    main()
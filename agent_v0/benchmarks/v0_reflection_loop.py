@@ -0,0 +1,111 @@
+"""
+Benchmark: LLM calls and searches per section of the v0 research loop, before and after reflection.
+
+Runs one section at a time through deepresearch_optimus_alpha with a stub LLM
+and a stub search (no API calls). Each section has a limited corpus: every
+query returns --max-results results drawn from --corpus URLs, so later
+searches increasingly return URLs the section already has. The grader fails a
+section until its --fail-grades grades are used up.
+
+"before" is the loop as it was: every iteration asks the LLM for new queries,
+searches them, and writes and grades the section; the grader's follow-up
+queries are dropped. "after" is _research_section: queries are asked for once,
+later iterations search the grader's follow-up queries, sources accumulate by
+URL, and the loop stops once a search adds no new sources.
+
+Usage:
+    python benchmarks/v0_reflection_loop.py [--sections 20] [--depth 4] [--corpus 12] [--fail-grades 3]
+"""
+import os
+import sys
+import json
+import random
+import argparse
+from collections import Counter
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark-key")
+os.environ.setdefault("LLM_CACHE", "off")
+
+import agents.deepresearch_optimus_alpha.agent as v0
+from agents.deepresearch_optimus_alpha.config import Configuration
+from agents.deepresearch_optimus_alpha.utils import format_search_results
+
+class StubResearch:
+    """Counts LLM calls and searches; serves a fixed corpus of URLs per section."""
+
+    def __init__(self, args, section):
+        self.args = args
+        self.section = section
+        self.rng = random.Random(section)
+        self.counts = Counter()
+
+    def call_llm(self, messages, step="llm", parse=None, **kwargs):
+        self.counts["llm_calls"] += 1
+        if step == "grade_section":
+            self.counts["grades"] += 1
+            passed = self.counts["grades"] > self.args.fail_grades
+            reply = json.dumps({"grade": "pass" if passed else "fail",
+                                "follow_up_queries": [] if passed else [
+                                    {"search_query": f"follow-up {self.counts['grades']}.{i}"} for i in range(2)]})
+        elif step == "section_queries":
+            reply = "\n".join(f"query {self.rng.random():.6f}" for _ in range(2))
+        else:
+            reply = "Section text."
+        return parse(reply) if parse is not None else reply
+
+    def search_results(self, queries, max_results=5):
+        self.counts["searches"] += 1
+        self.counts["queries"] += len(queries)
+        results = []
+        for query in queries:
+            rng = random.Random(f"{self.section}/{query}")
+            for rank, n in enumerate(rng.sample(range(self.args.corpus), min(self.args.max_results, self.args.corpus))):
+                results.append({"query": query, "rank": rank, "title": f"Page {n}",
+                                "url": f"https://example.com/{self.section}/{n}", "content": f"Content of page {n}."})
+        return results
+
+    def smart_search(self, queries, max_results=5, max_tokens=None):
+        return format_search_results(self.search_results(queries, max_results), max_tokens)
+
+def legacy_research_section(topic, section, config, conversation, emit):
+    """The loop before the reflection change."""
+    for _ in range(config.max_search_depth):
+        queries = v0.generate_section_queries(topic, section, config, conversation)
+        sources = v0.smart_search(queries)
+        section["content"] = v0.write_section(topic, section, sources, conversation, config)
+        feedback = v0.grade_section(topic, section, config, conversation, sources)
+        if feedback.get("grade") == "pass":
+            break
+
+def run(research_section, args):
+    config = Configuration(max_search_depth=args.depth)
+    totals = Counter()
+    for index in range(args.sections):
+        stub = StubResearch(args, index)
+        v0.call_llm, v0.search_results, v0.smart_search = stub.call_llm, stub.search_results, stub.smart_search
+        section = {"name": f"Section {index}", "description": f"Aspect {index}", "research": True, "content": ""}
+        research_section("Benchmark topic", section, config, [], lambda event, data: None)
+        totals += stub.counts
+    return {key: value / args.sections for key, value in totals.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=20, help="Sections to research")
+    parser.add_argument("--depth", type=int, default=4, help="max_search_depth")
+    parser.add_argument("--corpus", type=int, default=12, help="Distinct URLs a section's searches can return")
+    parser.add_argument("--max-results", type=int, default=5, help="Results per query")
+    parser.add_argument("--fail-grades", type=int, default=3, help="Grades that fail before one passes")
+    args = parser.parse_args()
+
+    before, after = run(legacy_research_section, args), run(v0._research_section, args)
+    print(f"{args.sections} sections, depth {args.depth}, {args.corpus} URLs per section, "
+          f"{args.fail_grades} failing grades")
+    print(f"{'per section':<14} {'before':>8} {'after':>8}")
+    for key in ("llm_calls", "searches", "queries", "grades"):
+        print(f"{key:<14} {before.get(key, 0):>8.2f} {after.get(key, 0):>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark: wall-clock time of one v0 search batch, sequential vs the async search client.
+
+Serves Tavily from an in-process fake (an httpx mock transport, no network)
+whose latency per query is log-normal, set by median and p95, with a share of
+stragglers that take --straggler-ms. Each batch has --queries queries, as one
+search iteration of a section does.
+
+"before" sends the queries one after another with a fresh client each, as
+tavily_search did with requests.post. "after" uses SearchClient: one pooled
+client, the batch's queries sent concurrently, and a per-query timeout after
+which a straggler becomes an error result instead of holding up the batch.
+
+Reports per mode the mean and p95 batch time, and the share of queries that
+returned results.
+
+Usage:
+    python benchmarks/v0_search_client.py [--batches 50] [--queries 4] [--median-ms 400] [--timeout 3]
+"""
+import os
+import sys
+import math
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("TAVILY_API_KEY", "benchmark-key")
+
+import httpx
+
+from agents.deepresearch_optimus_alpha.search import TAVILY_URL, SearchClient
+
+class FakeTavily:
+    """Answers Tavily searches after a random latency."""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(0)
+        # Log-normal with the given median and p95
+        self.mu = math.log(args.median_ms)
+        self.sigma = (math.log(args.p95_ms) - self.mu) / 1.645
+
+    def latency(self):
+        if self.rng.random() < self.args.straggler_rate:
+            return self.args.straggler_ms / 1000
+        return self.rng.lognormvariate(self.mu, self.sigma) / 1000
+
+    def response(self, request):
+        query = request.read().decode()
+        return httpx.Response(200, json={"results": [
+            {"title": f"Result {i}", "url": f"https://example.com/{hash(query)}/{i}", "content": "Fake content."}
+            for i in range(5)]})
+
+    def handle(self, request):
+        time.sleep(self.latency())
+        return self.response(request)
+
+    async def ahandle(self, request):
+        await asyncio.sleep(self.latency())
+        return self.response(request)
+
+def sequential_batch(fake, queries, timeout):
+    results = 0
+    for query in queries:
+        with httpx.Client(transport=httpx.MockTransport(fake.handle), timeout=timeout) as client:
+            response = client.post(TAVILY_URL, json={"query": query, "max_results": 5})
+            results += bool(response.json()["results"])
+    return results
+
+def summarize(label, seconds, answered, total):
+    p95 = sorted(seconds)[max(0, math.ceil(len(seconds) * 0.95) - 1)]
+    print(f"{label:<8} {statistics.mean(seconds):>8.2f} {p95:>8.2f} {answered / total:>9.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", type=int, default=50, help="Search batches per mode")
+    parser.add_argument("--queries", type=int, default=4, help="Queries per batch")
+    parser.add_argument("--median-ms", type=float, default=400.0, help="Median query latency")
+    parser.add_argument("--p95-ms", type=float, default=1200.0, help="95th percentile query latency")
+    parser.add_argument("--straggler-rate", type=float, default=0.03, help="Share of queries that hang")
+    parser.add_argument("--straggler-ms", type=float, default=8000.0, help="Latency of a hanging query")
+    parser.add_argument("--timeout", type=float, default=3.0, help="Per-query timeout of the async client")
+    args = parser.parse_args()
+
+    total = args.batches * args.queries
+    print(f"{args.batches} batches x {args.queries} queries, median {args.median_ms:.0f}ms, "
+          f"p95 {args.p95_ms:.0f}ms, {args.straggler_rate:.0%} stragglers at {args.straggler_ms:.0f}ms")
+    print(f"{'mode':<8} {'mean s':>8} {'p95 s':>8} {'answered':>9}")
+
+    fake = FakeTavily(args)
+    seconds, answered = [], 0
+    for batch in range(args.batches):
+        start = time.perf_counter()
+        # The old client waited up to 15 seconds per query
+        answered += sequential_batch(fake, [f"query {batch}.{i}" for i in range(args.queries)], timeout=15)
+        seconds.append(time.perf_counter() - start)
+    summarize("before", seconds, answered, total)
+
+    fake = FakeTavily(args)
+    client = SearchClient(concurrency={"tavily": 8}, query_timeout=args.timeout,
+                          transport=httpx.MockTransport(fake.ahandle))
+    seconds, answered = [], 0
+    for batch in range(args.batches):
+        start = time.perf_counter()
+        results = client.search("tavily", [f"query {batch}.{i}" for i in range(args.queries)])
+        seconds.append(time.perf_counter() - start)
+        answered += len({res["query"] for res in results if res["url"]})
+    summarize("after", seconds, answered, total)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark: wall-clock time of a v0 research report with fake-latency LLM and search.
+
+Runs deepresearch_optimus_alpha's pipeline with call_llm and smart_search
+replaced by fakes that sleep for a fixed latency (with optional jitter), once
+per section concurrency limit. With the research sections running concurrently
+(and then the final sections), a report takes about the plan plus its slowest
+section plus one final section, instead of the sum of all sections.
+
+Each research section asks for queries once, then runs search, writer and
+grader --iterations times (the grader fails it until the last iteration). The
+slowest section is measured per run.
+
+Usage:
+    python benchmarks/v0_section_fanout.py [--sections 6] [--concurrency 1,2,4,8] [--llm-ms 200] [--search-ms 300]
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import functools
+import threading
+from collections import defaultdict
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark-key")
+os.environ.setdefault("REPORT_CACHE", "off")
+os.environ.setdefault("RUN_CHECKPOINTS", "off")
+os.environ.setdefault("LLM_CACHE", "off")
+
+import agents.deepresearch_optimus_alpha.agent as v0
+from agents.deepresearch_optimus_alpha.config import Configuration
+
+class FakePipeline:
+    """Answers every step after a fake latency and times each research section."""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(0)
+        self.lock = threading.Lock()
+        self.grades = defaultdict(int)
+        self.section_seconds = []
+
+    def _sleep(self, ms):
+        with self.lock:
+            delay = max(0.0, self.rng.gauss(ms, self.args.jitter_ms))
+        time.sleep(delay / 1000)
+
+    def call_llm(self, messages, step="llm", on_delta=None, parse=None, **kwargs):
+        self._sleep(self.args.llm_ms)
+        if step == "report_plan":
+            sections = [{"name": "Introduction", "description": "Overview", "research": False, "content": ""}]
+            sections += [{"name": f"Topic {i}", "description": f"Aspect {i}", "research": True, "content": ""}
+                         for i in range(self.args.sections)]
+            sections.append({"name": "Conclusion", "description": "Summary", "research": False, "content": ""})
+            reply = json.dumps({"sections": sections})
+        elif step == "grade_section":
+            section = re.search(r"<section topic>\n(.*?)\n", messages[-1]["content"]).group(1)
+            with self.lock:
+                self.grades[section] += 1
+                passed = self.grades[section] >= self.args.iterations
+            reply = json.dumps({"grade": "pass" if passed else "fail",
+                                "follow_up_queries": [] if passed else [{"search_query": "more"}]})
+        else:
+            reply = "Fake query one\nFake query two" if step.endswith("queries") else "Fake section content."
+        if on_delta is not None:
+            on_delta(reply)
+        return parse(reply) if parse is not None else reply
+
+    def smart_search(self, queries, max_tokens=None):
+        self._sleep(self.args.search_ms)
+        return "Fake sources."
+
+    def search_results(self, queries, max_results=5):
+        self._sleep(self.args.search_ms)
+        with self.lock:
+            url = f"https://example.com/{self.rng.random()}"
+        return [{"query": query, "rank": 0, "title": "Fake", "url": url, "content": f"Fake sources from {url}."}
+                for query in queries]
+
+    def timed(self, research_section):
+        def run(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return research_section(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.section_seconds.append(time.perf_counter() - start)
+        return run
+
+def run(concurrency, args):
+    fake = FakePipeline(args)
+    research_section = v0._research_section
+    v0.call_llm, v0.smart_search, v0.search_results = fake.call_llm, fake.smart_search, fake.search_results
+    v0._research_section = fake.timed(research_section)
+    v0.Configuration = functools.partial(Configuration, max_concurrent_sections=concurrency)
+    try:
+        start = time.perf_counter()
+        report, _ = v0.chat_agent([], "Benchmark topic")
+        elapsed = time.perf_counter() - start
+    finally:
+        v0._research_section, v0.Configuration = research_section, Configuration
+    assert report, "empty report"
+    return elapsed, max(fake.section_seconds)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=6, help="Research sections per report")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Comma-separated section concurrency limits")
+    parser.add_argument("--iterations", type=int, default=2, help="Search/write/grade iterations per section")
+    parser.add_argument("--llm-ms", type=float, default=200.0, help="Latency of each LLM call")
+    parser.add_argument("--search-ms", type=float, default=300.0, help="Latency of each search call")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="Standard deviation of the latencies")
+    args = parser.parse_args()
+
+    plan = 2 * args.llm_ms + args.search_ms
+    final = args.llm_ms
+    print(f"{args.sections} research sections + 2 final sections, {args.iterations} iterations, "
+          f"LLM {args.llm_ms:.0f}ms, search {args.search_ms:.0f}ms, jitter {args.jitter_ms:.0f}ms")
+    print(f"{'limit':>6} {'wall s':>8} {'slowest section s':>18} {'plan + slowest + final s':>25}")
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        elapsed, slowest = run(concurrency, args)
+        critical = (plan + final) / 1000 + slowest
+        print(f"{concurrency:>6} {elapsed:>8.2f} {slowest:>18.2f} {critical:>25.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: wall-clock time of a v1 research report with fake-latency LLM and search.
+
+Runs the real deepresearch_optimus_alpha_v1 graph end to end with its chat models
+and search replaced by fakes that sleep for a fixed latency (with optional
+jitter). With every node awaiting its LLM calls, the section fan-out overlaps
+on one event loop, so a report takes about as long as its slowest section
+instead of the sum of all sections.
+
+The critical path of a report is:
+    plan (2 LLM calls + 1 search)
+    + slowest research section (queries, search, writer, grader)
+    + slowest final section (1 LLM call)
+
+Usage:
+    python benchmarks/v1_graph_fanout.py [--sections 1,4,8,16] [--llm-ms 200] [--search-ms 300]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+# Add the agent_v0 directory to sys.path to make imports work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark-key")
+
+from langchain_core.messages import AIMessage
+
+from agents.deepresearch_optimus_alpha_v1 import agent as v1_agent
+from agents.deepresearch_optimus_alpha_v1 import graph
+from agents.deepresearch_optimus_alpha_v1.state import Feedback, Queries, SearchQuery, Section, Sections
+
+class FakeModel:
+    """Stands in for a (structured) chat model; every call sleeps for the configured latency."""
+
+    def __init__(self, schema, latency, sections):
+        self.schema = schema
+        self.latency = latency
+        self.sections = sections
+
+    def _delay(self):
+        return self.latency() / 1000
+
+    def _result(self):
+        if self.schema is Queries:
+            return Queries(queries=[SearchQuery(search_query="fake query")])
+        if self.schema is Sections:
+            sections = [Section(name=f"Section {i + 1}", description="d", research=True, content="")
+                        for i in range(self.sections)]
+            sections.append(Section(name="Conclusion", description="d", research=False, content=""))
+            return Sections(sections=sections)
+        if self.schema is Feedback:
+            return Feedback(grade="pass", follow_up_queries=[])
+        return AIMessage(content="Fake section content.")
+
+    def invoke(self, messages, *args, **kwargs):
+        time.sleep(self._delay())
+        return self._result()
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        await asyncio.sleep(self._delay())
+        return self._result()
+
+def install_fakes(args, sections):
+    def llm_latency():
+        return max(0.0, random.gauss(args.llm_ms, args.jitter_ms))
+
+    async def fake_search(search_api, query_list, params_to_pass, **kwargs):
+        await asyncio.sleep(max(0.0, random.gauss(args.search_ms, args.jitter_ms)) / 1000)
+        return "Fake sources."
+
+    graph.init_chat_model = lambda model, model_provider, **kwargs: FakeModel(None, llm_latency, sections)
+    graph.init_structured_model = lambda model, model_provider, schema, **kwargs: FakeModel(schema, llm_latency, sections)
+    graph.select_and_execute_search = fake_search
+
+async def run(sections, args):
+    install_fakes(args, sections)
+    start = time.perf_counter()
+    report, _ = await v1_agent.achat_agent([], "Benchmark topic")
+    elapsed = time.perf_counter() - start
+    assert report, "empty report"
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", default="1,4,8,16", help="Comma-separated research section counts")
+    parser.add_argument("--llm-ms", type=float, default=200.0, help="Latency of each LLM call")
+    parser.add_argument("--search-ms", type=float, default=300.0, help="Latency of each search call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Standard deviation of the latencies")
+    args = parser.parse_args()
+
+    plan = 2 * args.llm_ms + args.search_ms
+    section = 3 * args.llm_ms + args.search_ms
+    final = args.llm_ms
+    print(f"LLM {args.llm_ms:.0f}ms, search {args.search_ms:.0f}ms, jitter {args.jitter_ms:.0f}ms")
+    print(f"{'sections':>8} {'wall s':>8} {'critical path s':>16} {'sequential s':>13} {'overlap':>8}")
+    for count in [int(c) for c in args.sections.split(",")]:
+        elapsed = asyncio.run(run(count, args))
+        critical = (plan + section + final) / 1000
+        sequential = (plan + count * section + final) / 1000
+        print(f"{count:>8} {elapsed:>8.2f} {critical:>16.2f} {sequential:>13.2f} {sequential / elapsed:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
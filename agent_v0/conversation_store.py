@@ -0,0 +1,424 @@
+"""
+Conversation history storage for the API.
+
+Histories are lists of {"role": ..., "content": ...} dicts, the format every
+agent's chat_agent accepts and returns. Two backends are provided:
+
+- InMemoryConversationStore: LRU bounded by conversation count, total bytes and TTL
+- SQLiteConversationStore: persistent, WAL-mode SQLite mirroring the
+  conversations/messages schema in agent_ui/supabase-schema.sql
+
+TieredConversationStore puts a hot in-memory tier in front of SQLite.
+
+Every conversation carries a version (its turn counter). Writes can pass the
+version they were based on and fail with ConversationConflict if another
+writer got there first, which makes the SQLite backend safe to share between
+API worker processes.
+"""
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Rough per-message bookkeeping overhead (dict, strings, list slot) in bytes
+MESSAGE_OVERHEAD_BYTES = 200
+
+# Times save_history re-reads the version and retries an append after a conflict
+MAX_SAVE_ATTEMPTS = 5
+
+def message_size(message: Dict[str, str]) -> int:
+    """Approximate memory footprint of one history message in bytes."""
+    return len(message.get("role", "")) + len(message.get("content", "").encode("utf-8")) + MESSAGE_OVERHEAD_BYTES
+
+class ConversationConflict(Exception):
+    """Raised when a write is based on a version that is no longer current."""
+
+class ConversationStore(ABC):
+    """Interface for conversation history backends."""
+
+    @abstractmethod
+    def get_with_version(self, conversation_id: str) -> Tuple[Optional[List[Dict[str, str]]], int]:
+        """Return (copy of the history or None, version). Missing conversations have version 0."""
+
+    @abstractmethod
+    def append(self, conversation_id: str, messages: List[Dict[str, str]],
+               expected_version: Optional[int] = None) -> int:
+        """
+        Append messages to a conversation, creating it if needed, and return the new version.
+
+        Raises:
+            ConversationConflict: If expected_version is given and is not the current version
+        """
+
+    @abstractmethod
+    def replace(self, conversation_id: str, messages: List[Dict[str, str]],
+                expected_version: Optional[int] = None) -> int:
+        """
+        Overwrite the whole history of a conversation and return the new version.
+
+        Raises:
+            ConversationConflict: If expected_version is given and is not the current version
+        """
+
+    @abstractmethod
+    def delete(self, conversation_id: str) -> bool:
+        """Delete a conversation. Returns False if it did not exist."""
+
+    def get(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        """Return a copy of the conversation history, or None if it does not exist."""
+        return self.get_with_version(conversation_id)[0]
+
+    def save_history(self, conversation_id: str, previous: Optional[List[Dict[str, str]]],
+                     updated: List[Dict[str, str]], expected_version: Optional[int] = None) -> int:
+        """
+        Persist the history returned by an agent and return the new version.
+
+        Agents return the full updated history; when it extends the previous one
+        only the new messages are appended, otherwise the history is replaced.
+
+        If expected_version is given and another writer saved a turn in the
+        meantime, appended turns are rebased onto the latest history so neither
+        turn is lost. A replaced history cannot be rebased and raises
+        ConversationConflict.
+        """
+        previous = previous or []
+        if len(updated) >= len(previous) and updated[:len(previous)] == previous:
+            new_messages = updated[len(previous):]
+            for attempt in range(MAX_SAVE_ATTEMPTS):
+                try:
+                    return self.append(conversation_id, new_messages, expected_version)
+                except ConversationConflict:
+                    if attempt == MAX_SAVE_ATTEMPTS - 1:
+                        raise
+                    print(f"Warning: conversation {conversation_id} changed concurrently, rebasing the new turn")
+                    expected_version = self.get_with_version(conversation_id)[1]
+        return self.replace(conversation_id, updated, expected_version)
+
+    def close(self) -> None:
+        """Release any resources held by the store."""
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    In-process LRU conversation store.
+
+    Conversations are evicted least-recently-used first when either
+    max_conversations or max_bytes is exceeded, and expire ttl_seconds after
+    their last access. The conversation just written is never evicted, so one
+    larger than max_bytes on its own stays cached until the next write
+    displaces it instead of being dropped as soon as it is saved.
+    """
+
+    def __init__(self, max_conversations: int = 10_000, max_bytes: int = 256 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = 24 * 3600):
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # conversation_id -> [last_access, size_bytes, messages, version]
+        self._data: "OrderedDict[str, list]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _expired(self, entry, now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry[0] > self.ttl_seconds
+
+    def _pop(self, conversation_id: str):
+        entry = self._data.pop(conversation_id, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+        return entry
+
+    def _evict(self, now: float, keep: str) -> None:
+        # Oldest entries are at the front, so expired ones are dropped first
+        while self._data:
+            conversation_id, entry = next(iter(self._data.items()))
+            if conversation_id == keep:
+                break
+            over_capacity = len(self._data) > self.max_conversations or self._bytes > self.max_bytes
+            if not over_capacity and not self._expired(entry, now):
+                break
+            self._pop(conversation_id)
+
+    def _live_entry(self, conversation_id: str, now: float):
+        entry = self._data.get(conversation_id)
+        if entry is not None and self._expired(entry, now):
+            self._pop(conversation_id)
+            return None
+        return entry
+
+    @staticmethod
+    def _check_version(entry, expected_version: Optional[int]) -> None:
+        current = entry[3] if entry is not None else 0
+        if expected_version is not None and current != expected_version:
+            raise ConversationConflict(f"Expected version {expected_version}, found {current}")
+
+    def _write(self, conversation_id: str, messages: List[Dict[str, str]], version: int, now: float, entry=None) -> int:
+        added = sum(message_size(m) for m in messages)
+        if entry is None:
+            entry = [now, 0, [], 0]
+            self._data[conversation_id] = entry
+        entry[0] = now
+        entry[1] += added
+        entry[2].extend(dict(m) for m in messages)
+        entry[3] = version
+        self._bytes += added
+        self._data.move_to_end(conversation_id)
+        self._evict(now, keep=conversation_id)
+        return version
+
+    def get_with_version(self, conversation_id: str) -> Tuple[Optional[List[Dict[str, str]]], int]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live_entry(conversation_id, now)
+            if entry is None:
+                return None, 0
+            entry[0] = now
+            self._data.move_to_end(conversation_id)
+            return list(entry[2]), entry[3]
+
+    def append(self, conversation_id: str, messages: List[Dict[str, str]],
+               expected_version: Optional[int] = None) -> int:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live_entry(conversation_id, now)
+            self._check_version(entry, expected_version)
+            version = (entry[3] if entry is not None else 0) + 1
+            return self._write(conversation_id, messages, version, now, entry)
+
+    def replace(self, conversation_id: str, messages: List[Dict[str, str]],
+                expected_version: Optional[int] = None) -> int:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live_entry(conversation_id, now)
+            self._check_version(entry, expected_version)
+            version = (entry[3] if entry is not None else 0) + 1
+            self._pop(conversation_id)
+            return self._write(conversation_id, messages, version, now)
+
+    def load(self, conversation_id: str, messages: List[Dict[str, str]], version: int) -> None:
+        """Cache a history read from another store at its version."""
+        now = time.monotonic()
+        with self._lock:
+            self._pop(conversation_id)
+            self._write(conversation_id, messages, version, now)
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            return self._pop(conversation_id) is not None
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Persistent conversation store backed by SQLite in WAL mode.
+
+    The database file can be shared by several API worker processes. Messages
+    are stored one row each, so appending a turn never rewrites the history.
+    Version checks run inside BEGIN IMMEDIATE transactions, so compare-and-swap
+    is atomic across processes.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS conversations (
+      id TEXT PRIMARY KEY,
+      title TEXT NOT NULL DEFAULT '',
+      version INTEGER NOT NULL DEFAULT 0,
+      created_at REAL NOT NULL,
+      updated_at REAL NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS messages (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+      role TEXT NOT NULL CHECK (role IN ('user', 'assistant', 'system')),
+      content TEXT NOT NULL,
+      created_at REAL NOT NULL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation_id, id);
+    """
+
+    def __init__(self, path: str = "conversations.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(self.SCHEMA)
+        # Databases created before versioning lack the column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")}
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE conversations ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def get_version(self, conversation_id: str) -> int:
+        """Current version of a conversation (0 if it does not exist), without loading messages."""
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def get_with_version(self, conversation_id: str) -> Tuple[Optional[List[Dict[str, str]]], int]:
+        with self._lock:
+            # Read both tables from one snapshot
+            self._conn.execute("BEGIN")
+            try:
+                row = self._conn.execute(
+                    "SELECT version FROM conversations WHERE id = ?", (conversation_id,)
+                ).fetchone()
+                rows = [] if row is None else self._conn.execute(
+                    "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY id", (conversation_id,)
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        if row is None:
+            return None, 0
+        return [{"role": role, "content": content} for role, content in rows], row[0]
+
+    def _write(self, conversation_id: str, messages: List[Dict[str, str]],
+               expected_version: Optional[int], clear: bool) -> int:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT version FROM conversations WHERE id = ?", (conversation_id,)
+                ).fetchone()
+                current = row[0] if row is not None else 0
+                if expected_version is not None and current != expected_version:
+                    raise ConversationConflict(f"Expected version {expected_version}, found {current}")
+                if row is None:
+                    title = next((m["content"][:100] for m in messages if m.get("role") == "user"), "")
+                    self._conn.execute(
+                        "INSERT INTO conversations (id, title, version, created_at, updated_at) VALUES (?, ?, 1, ?, ?)",
+                        (conversation_id, title, now, now),
+                    )
+                else:
+                    self._conn.execute(
+                        "UPDATE conversations SET version = version + 1, updated_at = ? WHERE id = ?",
+                        (now, conversation_id),
+                    )
+                if clear:
+                    self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                self._conn.executemany(
+                    "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                    [(conversation_id, m["role"], m["content"], now) for m in messages],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return current + 1
+
+    def append(self, conversation_id: str, messages: List[Dict[str, str]],
+               expected_version: Optional[int] = None) -> int:
+        return self._write(conversation_id, messages, expected_version, clear=False)
+
+    def replace(self, conversation_id: str, messages: List[Dict[str, str]],
+                expected_version: Optional[int] = None) -> int:
+        return self._write(conversation_id, messages, expected_version, clear=True)
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        return cursor.rowcount > 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class TieredConversationStore(ConversationStore):
+    """
+    Hot in-memory LRU tier in front of a persistent store (read-through, write-through).
+
+    Reads check the persistent version first, so a history cached in this
+    process is never served after another worker has extended it.
+    """
+
+    def __init__(self, hot: InMemoryConversationStore, cold: SQLiteConversationStore):
+        self.hot = hot
+        self.cold = cold
+
+    def get_with_version(self, conversation_id: str) -> Tuple[Optional[List[Dict[str, str]]], int]:
+        version = self.cold.get_version(conversation_id)
+        if version == 0:
+            self.hot.delete(conversation_id)
+            return None, 0
+        messages, hot_version = self.hot.get_with_version(conversation_id)
+        if messages is not None and hot_version == version:
+            return messages, version
+        messages, version = self.cold.get_with_version(conversation_id)
+        if messages is not None:
+            self.hot.load(conversation_id, messages, version)
+        return messages, version
+
+    def append(self, conversation_id: str, messages: List[Dict[str, str]],
+               expected_version: Optional[int] = None) -> int:
+        version = self.cold.append(conversation_id, messages, expected_version)
+        try:
+            # Only extend the cached copy if it is exactly one turn behind
+            self.hot.append(conversation_id, messages, expected_version=version - 1)
+        except ConversationConflict:
+            self.hot.delete(conversation_id)
+        return version
+
+    def replace(self, conversation_id: str, messages: List[Dict[str, str]],
+                expected_version: Optional[int] = None) -> int:
+        version = self.cold.replace(conversation_id, messages, expected_version)
+        self.hot.load(conversation_id, messages, version)
+        return version
+
+    def delete(self, conversation_id: str) -> bool:
+        in_hot = self.hot.delete(conversation_id)
+        return self.cold.delete(conversation_id) or in_hot
+
+    def close(self) -> None:
+        self.hot.close()
+        self.cold.close()
+
+class ConversationLocks:
+    """
+    Per-conversation asyncio locks, so turns on the same conversation run one
+    at a time within a process and each sees the previous turn's history.
+    Locks are dropped once no request holds or waits for them.
+    """
+
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def get(self, conversation_id: str) -> asyncio.Lock:
+        lock = self._locks.get(conversation_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[conversation_id] = lock
+        return lock
+
+def create_conversation_store() -> ConversationStore:
+    """
+    Build the conversation store configured through environment variables.
+
+    CONVERSATION_STORE: "memory" (default) or "sqlite"
+    CONVERSATION_DB_PATH: SQLite database file (default "conversations.db")
+    CONVERSATION_CACHE_MAX: maximum conversations kept in memory (default 10000)
+    CONVERSATION_CACHE_MAX_BYTES: maximum bytes kept in memory (default 256 MiB)
+    CONVERSATION_CACHE_TTL: seconds before an idle in-memory conversation expires (default 86400)
+    """
+    hot = InMemoryConversationStore(
+        max_conversations=int(os.getenv("CONVERSATION_CACHE_MAX", "10000")),
+        max_bytes=int(os.getenv("CONVERSATION_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+        ttl_seconds=float(os.getenv("CONVERSATION_CACHE_TTL", "86400")),
+    )
+    backend = os.getenv("CONVERSATION_STORE", "memory").lower()
+    if backend == "memory":
+        return hot
+    if backend == "sqlite":
+        return TieredConversationStore(hot, SQLiteConversationStore(os.getenv("CONVERSATION_DB_PATH", "conversations.db")))
+    raise ValueError(f"Unsupported conversation store: {backend}")
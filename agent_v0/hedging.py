@@ -0,0 +1,195 @@
+"""
+Hedged LLM requests.
+
+A few LLM calls take far longer than the rest, and in the research graph one
+slow section holds up every section after the fan-out. Hedging sends the call
+to the primary model and waits for its first streamed token. If none arrives
+within the node's recent p95 first-token latency, the same prompt is sent to a
+secondary model. Whichever finishes first wins and the other call is
+cancelled, which closes its stream. The clock starts when the primary's
+governor admits the call (see llm_governor.py), so time queued behind its rate
+limits never triggers a hedge or counts as latency.
+
+Since the delay tracks the p95, only about one call in twenty is hedged, and a
+per-node budget (LLM_HEDGE_MAX_RATIO) caps extra requests when a provider is
+slow across the board. Outcomes, first-token latencies and current delays are
+exported per node through metrics.py.
+
+Settings (environment variables):
+    LLM_HEDGE_PERCENTILE: first-token latency percentile used as the delay (default 95)
+    LLM_HEDGE_DEFAULT_DELAY: delay in seconds until enough samples are collected (default 20)
+    LLM_HEDGE_MIN_DELAY: lower bound of the delay in seconds (default 1)
+    LLM_HEDGE_MIN_SAMPLES: samples needed before the percentile is used (default 20)
+    LLM_HEDGE_WINDOW: recent first-token latencies kept per node (default 200)
+    LLM_HEDGE_MAX_RATIO: maximum share of a node's calls that may be hedged (default 0.1)
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from metrics import LLM_FIRST_TOKEN_SECONDS, LLM_HEDGE_DELAY_SECONDS, LLM_HEDGES
+
+class HedgePolicy:
+    """First-token latencies and hedge budget of one node."""
+
+    def __init__(self, percentile: float = 95, default_delay: float = 20.0, min_delay: float = 1.0,
+                 min_samples: int = 20, window: int = 200, max_ratio: float = 0.1):
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.calls = 0
+        self.hedges = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        """Seconds to wait for the primary's first token before hedging."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.default_delay
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(round(self.percentile / 100 * (len(ordered) - 1))))
+        return max(self.min_delay, ordered[index])
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def start_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def try_hedge(self) -> bool:
+        """Take a hedge from the budget, if one is left."""
+        with self._lock:
+            if self.hedges + 1 > self.max_ratio * self.calls + 1:
+                return False
+            self.hedges += 1
+            return True
+
+_policies: Dict[str, HedgePolicy] = {}
+_policies_lock = threading.Lock()
+
+def get_policy(node: str) -> HedgePolicy:
+    with _policies_lock:
+        policy = _policies.get(node)
+        if policy is None:
+            policy = _policies[node] = HedgePolicy(
+                percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+                default_delay=float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "20")),
+                min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "1")),
+                min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+                window=int(os.getenv("LLM_HEDGE_WINDOW", "200")),
+                max_ratio=float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1")),
+            )
+        return policy
+
+def reset_policies() -> None:
+    """Forget all latency samples and budgets (e.g. between benchmark runs)."""
+    with _policies_lock:
+        _policies.clear()
+
+class FirstTokenCallback(BaseCallbackHandler):
+    """
+    Marks when a call starts, i.e. is admitted by its governor, and when it
+    streams its first token (or completes, e.g. from the LLM cache).
+    """
+
+    run_inline = True
+
+    def __init__(self, node: str):
+        self.node = node
+        self.start: Optional[float] = None
+        self.first_token_seconds: Optional[float] = None
+        self.started = asyncio.Event()
+        self.event = asyncio.Event()
+
+    def _start(self):
+        if self.start is None:
+            self.start = time.perf_counter()
+            self.started.set()
+
+    def _mark(self):
+        self._start()
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.start
+            LLM_FIRST_TOKEN_SECONDS.observe(self.first_token_seconds, node=self.node)
+            self.event.set()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._start()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._start()
+
+    def on_llm_new_token(self, token, **kwargs):
+        self._mark()
+
+    def on_llm_end(self, response, **kwargs):
+        self._mark()
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def hedged_ainvoke(node: str, primary, secondary, messages):
+    """
+    primary.ainvoke(messages), hedged with secondary when the first token is late.
+
+    Both models should stream (streaming=True) so their first token is seen
+    before the response completes. Without a secondary, this is a plain ainvoke.
+    """
+    if secondary is None:
+        return await primary.ainvoke(messages)
+
+    policy = get_policy(node)
+    policy.start_call()
+    delay = policy.delay()
+    LLM_HEDGE_DELAY_SECONDS.set(delay, node=node)
+
+    first_token = FirstTokenCallback(node)
+    primary_task = asyncio.ensure_future(primary.ainvoke(messages, config={"callbacks": [first_token]}))
+    started = asyncio.ensure_future(first_token.started.wait())
+    waiter = asyncio.ensure_future(first_token.event.wait())
+    tasks = [primary_task]
+    try:
+        # Time queued behind the primary's governor is backpressure, not provider latency: hedging it
+        # would add load exactly when the provider is being throttled, so the clock starts at admission
+        await asyncio.wait({primary_task, started}, return_when=asyncio.FIRST_COMPLETED)
+        if not primary_task.done():
+            await asyncio.wait({primary_task, waiter}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+        if first_token.event.is_set() or primary_task.done():
+            LLM_HEDGES.inc(node=node, outcome="not_hedged")
+            return await primary_task
+        if not policy.try_hedge():
+            LLM_HEDGES.inc(node=node, outcome="over_budget")
+            return await primary_task
+
+        secondary_task = asyncio.ensure_future(secondary.ainvoke(messages))
+        tasks.append(secondary_task)
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                LLM_HEDGES.inc(node=node, outcome="primary_won" if task is primary_task else "secondary_won")
+                return task.result()
+        LLM_HEDGES.inc(node=node, outcome="failed")
+        raise error
+    finally:
+        started.cancel()
+        waiter.cancel()
+        await _cancel([task for task in tasks if not task.done()])
+        # A primary that never streamed still tells us its first token is at least this late
+        if first_token.start is not None:
+            policy.observe(first_token.first_token_seconds or (time.perf_counter() - first_token.start))
@@ -0,0 +1,200 @@
+"""
+Background agent jobs for the API.
+
+A job runs one agent turn outside of any HTTP request: POST /jobs enqueues it
+and returns immediately, and clients poll for progress and the result. Jobs
+wait in a bounded queue and a fixed number of workers run them, which caps the
+number of concurrent research runs per process.
+"""
+import os
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from agent import astream_agent
+from llm_governor import PRIORITY_BACKGROUND, llm_priority
+
+# Progress events kept per job (oldest are dropped first)
+MAX_PROGRESS_EVENTS = 200
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+@dataclass
+class Job:
+    """State of one agent run."""
+    id: str
+    agent_name: str
+    message: str
+    conversation_id: str
+    status: str = "queued"  # queued, running, succeeded, failed, cancelled
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: List[Dict[str, Any]] = field(default_factory=list)
+    sections: Dict[str, str] = field(default_factory=dict)
+    partial_response: str = ""
+    response: Optional[str] = None
+    error: Optional[str] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def record(self, event: Dict[str, Any]) -> None:
+        """Fold one agent event into the job state."""
+        name, data = event["event"], event["data"]
+        if name == "token":
+            self.partial_response += data.get("content", "")
+            return
+        if name == "section_written":
+            self.sections[data["section"]] = data.get("content", "")
+            # Section content is exposed through `sections`, keep progress entries small
+            data = {"section": data["section"]}
+        self.progress.append({"event": name, "data": data, "at": time.time()})
+        del self.progress[:-MAX_PROGRESS_EVENTS]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "agent_name": self.agent_name,
+            "conversation_id": self.conversation_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+            "sections": self.sections,
+            "partial_response": self.partial_response,
+            "error": self.error,
+        }
+
+class JobManager:
+    """
+    Bounded job queue served by a fixed pool of asyncio workers.
+
+    Args:
+        conversations: ConversationStore used to load and save chat history
+        conversation_locks: ConversationLocks shared with the chat endpoints, so a
+            job and a request on the same conversation do not interleave turns
+        workers: Number of jobs run concurrently
+        max_queued: Maximum number of jobs waiting to start
+        ttl_seconds: How long finished jobs are kept for polling
+    """
+
+    def __init__(self, conversations, conversation_locks, workers: int = 2, max_queued: int = 100,
+                 ttl_seconds: float = 3600):
+        self.conversations = conversations
+        self.conversation_locks = conversation_locks
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        self.jobs: Dict[str, Job] = {}
+        # Jobs waiting to start; a cancelled job leaves it at once, freeing its slot
+        self._pending: Deque[Job] = deque()
+        self._pending_changed = asyncio.Event()
+        self._worker_tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Start the worker tasks (call from the running event loop)."""
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel running jobs and stop the workers."""
+        for job in self.jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def _purge(self) -> None:
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished and now - job.finished_at > self.ttl_seconds]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def submit(self, agent_name: str, message: str, conversation_id: Optional[str] = None) -> Job:
+        """
+        Enqueue an agent run and return its job.
+
+        Raises:
+            JobQueueFull: If max_queued jobs are already waiting
+        """
+        self._purge()
+        job = Job(
+            id=os.urandom(8).hex(),
+            agent_name=agent_name,
+            message=message,
+            conversation_id=conversation_id or os.urandom(8).hex(),
+        )
+        if len(self._pending) >= self.max_queued:
+            raise JobQueueFull(f"Job queue is full ({self.max_queued} jobs waiting)")
+        self._pending.append(job)
+        self._pending_changed.set()
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job. Returns None if the job does not exist."""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        if job.task is not None:
+            # Cancelling the task cancels the agent's in-flight LLM and search calls
+            job.task.cancel()
+        else:
+            self._pending.remove(job)
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        return job
+
+    async def _run(self, job: Job) -> None:
+        # Queued jobs yield LLM capacity to interactive requests
+        async with self.conversation_locks.get(job.conversation_id):
+            with llm_priority(PRIORITY_BACKGROUND):
+                chat_history, version = await asyncio.to_thread(self.conversations.get_with_version, job.conversation_id)
+                async for event in astream_agent(job.agent_name, chat_history, job.message):
+                    if event["event"] == "final":
+                        job.response = event["data"]["response"]
+                        await asyncio.to_thread(
+                            self.conversations.save_history,
+                            job.conversation_id, chat_history, event["data"]["history"], expected_version=version,
+                        )
+                    else:
+                        job.record(event)
+
+    async def _next_job(self) -> Job:
+        while not self._pending:
+            self._pending_changed.clear()
+            await self._pending_changed.wait()
+        return self._pending.popleft()
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._next_job()
+            job.status = "running"
+            job.started_at = time.time()
+            job.task = asyncio.create_task(self._run(job))
+            try:
+                await job.task
+                job.status = "succeeded"
+            except asyncio.CancelledError:
+                job.status = "cancelled"
+                # Propagate if the worker itself is being stopped
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception as e:
+                job.status = "failed"
+                job.error = f"Error generating response: {str(e)}"
+            finally:
+                job.finished_at = time.time()
+                job.task = None
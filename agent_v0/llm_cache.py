@@ -0,0 +1,261 @@
+"""
+Content-addressed cache for LLM responses.
+
+Responses are keyed by a hash of (model, normalized messages, sampling
+parameters, output schema), so re-running a topic, replaying a failed job or
+re-rendering a report does not pay for the same calls twice. Entries live in an
+in-memory LRU in front of an optional SQLite tier, with a TTL and a size cap.
+
+Only deterministic calls are cached: a call with a temperature other than 0
+(including the provider default, when no temperature is set) bypasses the
+cache unless caching is forced, e.g. to replay a run. Both agents ask for
+search queries, report plans and section grades at temperature 0, so those are
+cached; the section writers sample at the default temperature and are not.
+
+The cache is off unless LLM_CACHE is set. The v0 agent uses it in call_llm and
+the v1 graph through LangChainLLMCache, attached to its chat models.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import warnings
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+def normalize_messages(messages) -> List[Dict[str, str]]:
+    """Role/content pairs of message dicts or LangChain messages, whitespace-trimmed."""
+    normalized = []
+    for message in messages:
+        if isinstance(message, dict):
+            role, content = message.get("role", ""), message.get("content", "")
+        else:
+            role, content = message.type, message.content
+        normalized.append({"role": role, "content": content.strip() if isinstance(content, str) else content})
+    return normalized
+
+def cache_key(model: str, messages, params: Optional[Dict[str, Any]] = None, schema: Any = None) -> str:
+    """Hash of everything that determines a response."""
+    if schema is not None and not isinstance(schema, (str, dict)):
+        schema = schema.model_json_schema() if hasattr(schema, "model_json_schema") else repr(schema)
+    payload = {
+        "model": model,
+        "messages": normalize_messages(messages),
+        "params": {k: v for k, v in (params or {}).items() if v is not None},
+        "schema": schema,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    In-memory LRU of LLM responses, optionally backed by SQLite.
+
+    Args:
+        path: SQLite database file for the disk tier, or None for memory only
+        max_entries: Responses kept in memory
+        max_bytes: Size cap of the disk tier; least recently used rows are dropped first
+        ttl_seconds: Age after which a response is no longer served
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS llm_responses (
+      key TEXT PRIMARY KEY,
+      model TEXT NOT NULL,
+      value TEXT NOT NULL,
+      size INTEGER NOT NULL,
+      created_at REAL NOT NULL,
+      accessed_at REAL NOT NULL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed_at ON llm_responses(accessed_at);
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 1024,
+                 max_bytes: int = 512 * 1024 * 1024, ttl_seconds: Optional[float] = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        # key -> (created_at, value)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path is not None:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, created_at: float, value: str) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry[0], now):
+                del self._memory[key]
+                entry = None
+            if entry is None and self._conn is not None:
+                row = self._conn.execute("SELECT created_at, value FROM llm_responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and self._expired(row[0], now):
+                    self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                    row = None
+                if row is not None:
+                    self._conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    entry = (row[0], row[1])
+                    self._remember(key, *entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: str, model: str = "") -> None:
+        """Store a response."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._conn is None:
+                return
+            size = len(value.encode("utf-8")) + len(key)
+            old = self._conn.execute("SELECT size FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, size, now, now),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            if self._disk_bytes > self.max_bytes:
+                self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        # Other processes may share the file, so recount before evicting
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+        # Leave some headroom so every insert does not trigger another trim
+        target = int(self.max_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM llm_responses ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM llm_responses WHERE key = ?", [(key,) for key, _ in rows])
+            self._disk_bytes -= sum(size for _, size in rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM llm_responses")
+                self._disk_bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class LangChainLLMCache(BaseCache):
+    """
+    LangChain cache adapter, passed as cache= to a chat model.
+
+    LangChain serializes the model configuration (model name, sampling
+    parameters, bound tools or response format of structured output) into
+    llm_string, so hashing it with the prompt gives the same content address.
+    """
+
+    def __init__(self, cache: LLMResponseCache):
+        self.cache = cache
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _serializable(generation):
+        # Structured output keeps the parsed pydantic object on the message, which
+        # LangChain cannot serialize; the output parser accepts the plain dict as well
+        message = getattr(generation, "message", None)
+        parsed = message.additional_kwargs.get("parsed") if message is not None else None
+        if parsed is None or not hasattr(parsed, "model_dump"):
+            return generation
+        additional_kwargs = {**message.additional_kwargs, "parsed": parsed.model_dump()}
+        return generation.model_copy(update={"message": message.model_copy(update={"additional_kwargs": additional_kwargs})})
+
+    def lookup(self, prompt: str, llm_string: str):
+        value = self.cache.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                return loads(value, allowed_objects="core")
+        except Exception as e:
+            print(f"Warning: could not deserialize cached LLM response: {e}")
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        self.cache.set(self._key(prompt, llm_string), dumps([self._serializable(g) for g in return_val]))
+
+    def clear(self, **kwargs) -> None:
+        self.cache.clear()
+
+def cache_forced() -> bool:
+    return os.getenv("LLM_CACHE_FORCE", "").lower() in ("1", "true", "yes")
+
+def should_cache(temperature: Optional[float], force: Optional[bool] = None) -> bool:
+    """Whether a call with this temperature may use the cache."""
+    if get_llm_cache() is None:
+        return False
+    if force is None:
+        force = cache_forced()
+    return force or temperature == 0
+
+@lru_cache(maxsize=None)
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """
+    Process-wide LLM response cache configured through environment variables, or None if disabled.
+
+    LLM_CACHE: "off" (default), "memory" or "sqlite"
+    LLM_CACHE_PATH: SQLite database file (default "llm_cache.db")
+    LLM_CACHE_MAX_ENTRIES: responses kept in memory (default 1024)
+    LLM_CACHE_MAX_BYTES: size cap of the SQLite tier (default 512 MiB)
+    LLM_CACHE_TTL: seconds a response is served for (default 604800, one week)
+    LLM_CACHE_FORCE: cache calls with a non-zero or default temperature too (default off)
+    """
+    backend = os.getenv("LLM_CACHE", "off").lower()
+    if backend in ("", "off", "0", "false", "none"):
+        return None
+    if backend not in ("memory", "sqlite"):
+        raise ValueError(f"Unsupported LLM cache: {backend}")
+    return LLMResponseCache(
+        path=os.getenv("LLM_CACHE_PATH", "llm_cache.db") if backend == "sqlite" else None,
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+        ttl_seconds=float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+    )
+
+def langchain_cache(temperature: Optional[float] = None, force: Optional[bool] = None) -> Optional[LangChainLLMCache]:
+    """Cache to attach to a chat model with this temperature, or None to bypass."""
+    if not should_cache(temperature, force):
+        return None
+    return LangChainLLMCache(get_llm_cache())
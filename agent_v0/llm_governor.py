@@ -0,0 +1,538 @@
+"""
+Process-wide rate limiting and concurrency control for LLM providers.
+
+Every concurrent request and every parallel section branch calls the provider
+independently, so under load they overshoot its rate limit together and get a
+storm of 429s. A Governor per (provider, model) makes calls take a slot first:
+
+- token buckets cap requests per minute and tokens per minute
+- the number of calls in flight follows AIMD: it grows by about one per
+  window of successful calls and halves on a 429. A Retry-After header
+  pauses new calls until it has passed.
+- waiting calls are served by priority, then in arrival order
+
+429s are observed on the HTTP responses (see observe_response), which also
+catches the ones the OpenAI client retries internally. Clients that do not use
+httpx call report_rate_limit instead. Slots work from threads
+(the v0 agent runs on the agent executor) and from the event loop (v1 graph).
+
+Limits come from LLM_LIMITS, a JSON object keyed by "provider" or
+"provider:model" (the more specific entry wins), e.g.
+    {"openrouter": {"rpm": 500, "tpm": 1000000, "max_concurrency": 32}}
+Keys: rpm, tpm, burst_seconds (default 10), initial_concurrency (default 16),
+min_concurrency (default 1), max_concurrency (default 64).
+LLM_GOVERNOR=off disables the governor.
+"""
+import os
+import json
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps
+from langchain_core.runnables.config import get_executor_for_config
+
+from token_counter import count_message_tokens, count_tokens, message_content
+from metrics import (
+    LLM_GOVERNOR_CONCURRENCY_LIMIT,
+    LLM_GOVERNOR_QUEUED,
+    LLM_GOVERNOR_WAIT_SECONDS,
+    LLM_RATE_LIMITED,
+)
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_BACKGROUND = 10
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=PRIORITY_DEFAULT)
+_current_slot: contextvars.ContextVar[Optional["Slot"]] = contextvars.ContextVar("llm_slot", default=None)
+
+@contextmanager
+def llm_priority(priority: int):
+    """Queue the LLM calls made inside the block (including tasks it starts) with this priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class TokenBucket:
+    """Refills at rate units per second up to capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount is available (amounts above capacity wait for a full bucket)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        # May go negative when a call used more tokens than reserved
+        self.level -= amount
+
+    def drain(self, now: float) -> None:
+        self._refill(now)
+        self.level = min(self.level, 0.0)
+
+class _Waiter:
+    def __init__(self, priority: int, seq: int, tokens: int, loop=None):
+        self.key = (priority, seq)
+        self.tokens = tokens
+        self.loop = loop
+        self.event = asyncio.Event() if loop is not None else threading.Event()
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+    def wake(self):
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.event.set)
+            except RuntimeError:
+                # The waiter's event loop is closed
+                pass
+        else:
+            self.event.set()
+
+class Slot:
+    """One admitted call; records what the provider said about it."""
+
+    def __init__(self, governor: "Governor", tokens: int):
+        self.governor = governor
+        self.tokens = tokens
+        self.used_tokens: Optional[int] = None
+        self.rate_limited = False
+
+    def record_tokens(self, total_tokens: Optional[int]) -> None:
+        """Actual prompt + completion tokens, to correct the reservation."""
+        self.used_tokens = total_tokens
+
+    def record_rate_limit(self, retry_after: Optional[float]) -> None:
+        self.rate_limited = True
+        self.governor._on_rate_limit(retry_after)
+
+def _reset_slot(token) -> None:
+    try:
+        _current_slot.reset(token)
+    except ValueError:
+        # A stream closed from another context, e.g. an abandoned async generator finalized by the loop
+        pass
+
+class Governor:
+    """
+    Admission control for one provider and model.
+
+    Args:
+        rpm / tpm: Requests and tokens per minute, or None for no limit
+        burst_seconds: Bucket capacity, in seconds worth of the rate
+        initial_concurrency / min_concurrency / max_concurrency: AIMD bounds of calls in flight
+    """
+
+    # 429s within this window after a decrease belong to the same burst and do not halve again
+    DECREASE_INTERVAL = 2.0
+
+    def __init__(self, provider: str, model: str, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 burst_seconds: float = 10.0, initial_concurrency: int = 16, min_concurrency: int = 1,
+                 max_concurrency: int = 64):
+        self.provider = provider
+        self.model = model
+        self.requests = TokenBucket(rpm / 60, max(1.0, rpm / 60 * burst_seconds)) if rpm else None
+        self.tokens = TokenBucket(tpm / 60, max(1.0, tpm / 60 * burst_seconds)) if tpm else None
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._labels = {"provider": provider, "model": model}
+        LLM_GOVERNOR_CONCURRENCY_LIMIT.set(self.limit, **self._labels)
+
+    # --- Admission ---
+
+    def _try_admit(self, waiter: _Waiter, now: float) -> Optional[float]:
+        """0 if admitted, else seconds to wait before retrying (None: until woken). Holds the lock."""
+        if self._waiters[0] is not waiter or self.in_flight >= int(self.limit):
+            return None
+        wait = self.paused_until - now
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None and waiter.tokens:
+            wait = max(wait, self.tokens.wait_time(waiter.tokens, now))
+        if wait > 0:
+            return wait
+        if self.requests is not None:
+            self.requests.take(1, now)
+        if self.tokens is not None:
+            self.tokens.take(waiter.tokens, now)
+        self.in_flight += 1
+        heapq.heappop(self._waiters)
+        LLM_GOVERNOR_QUEUED.dec(**self._labels)
+        self._wake_head()
+        return 0
+
+    def _wake_head(self) -> None:
+        if self._waiters:
+            self._waiters[0].wake()
+
+    def _enqueue(self, tokens: int, loop=None) -> _Waiter:
+        waiter = _Waiter(_priority.get(), next(self._seq), tokens, loop)
+        with self._lock:
+            heapq.heappush(self._waiters, waiter)
+            LLM_GOVERNOR_QUEUED.inc(**self._labels)
+        return waiter
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                LLM_GOVERNOR_QUEUED.dec(**self._labels)
+                self._wake_head()
+
+    def _acquire(self, tokens: int) -> None:
+        start = time.monotonic()
+        waiter = self._enqueue(tokens)
+        try:
+            while True:
+                waiter.event.clear()
+                with self._lock:
+                    wait = self._try_admit(waiter, time.monotonic())
+                if wait == 0:
+                    break
+                waiter.event.wait(wait)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        LLM_GOVERNOR_WAIT_SECONDS.observe(time.monotonic() - start, **self._labels)
+
+    async def _aacquire(self, tokens: int) -> None:
+        start = time.monotonic()
+        waiter = self._enqueue(tokens, asyncio.get_running_loop())
+        try:
+            while True:
+                waiter.event.clear()
+                with self._lock:
+                    wait = self._try_admit(waiter, time.monotonic())
+                if wait == 0:
+                    break
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        LLM_GOVERNOR_WAIT_SECONDS.observe(time.monotonic() - start, **self._labels)
+
+    # --- Feedback ---
+
+    def _release(self, slot: Slot, ok: bool) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if self.tokens is not None and slot.used_tokens is not None:
+                # Settle the reservation against what the call actually used
+                self.tokens.take(slot.used_tokens - slot.tokens, time.monotonic())
+            if ok and not slot.rate_limited:
+                # Additive increase: about +1 per limit's worth of successful calls
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                LLM_GOVERNOR_CONCURRENCY_LIMIT.set(self.limit, **self._labels)
+            self._wake_head()
+
+    def _on_rate_limit(self, retry_after: Optional[float]) -> None:
+        LLM_RATE_LIMITED.inc(**self._labels)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_decrease > self.DECREASE_INTERVAL:
+                # Multiplicative decrease, once per burst of 429s
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                self._last_decrease = now
+                LLM_GOVERNOR_CONCURRENCY_LIMIT.set(self.limit, **self._labels)
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            if self.requests is not None:
+                self.requests.drain(now)
+
+    # --- Public API ---
+
+    @contextmanager
+    def slot(self, tokens: int = 0):
+        """Hold a slot for a blocking call; tokens is the estimated prompt + completion size."""
+        self._acquire(tokens)
+        slot = Slot(self, tokens)
+        context = _current_slot.set(slot)
+        ok = False
+        try:
+            yield slot
+            ok = True
+        finally:
+            _reset_slot(context)
+            self._release(slot, ok)
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int = 0):
+        """Async counterpart of slot, for calls made on the event loop."""
+        await self._aacquire(tokens)
+        slot = Slot(self, tokens)
+        context = _current_slot.set(slot)
+        ok = False
+        try:
+            yield slot
+            ok = True
+        finally:
+            _reset_slot(context)
+            self._release(slot, ok)
+
+# Reserved for the completion when a call does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+def estimate_tokens(messages, max_tokens: Optional[int] = None) -> int:
+    """Tokens to reserve for a call: the prompt plus its completion limit."""
+    return count_message_tokens(messages) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+def _output_text(output) -> str:
+    """Text of a model output (message, chunk, parsed object or dict), for token estimates."""
+    if hasattr(output, "content"):
+        return message_content(output)
+    if hasattr(output, "model_dump_json"):
+        return output.model_dump_json()
+    return output if isinstance(output, str) else json.dumps(output, default=str)
+
+class GovernedModel:
+    """
+    Chat model (or structured-output runnable) whose calls take a governor slot first.
+
+    invoke, ainvoke, stream, astream, batch and abatch are governed; a stream
+    holds its slot until it is exhausted or closed. invoke and ainvoke check
+    the model's LLM cache first, and cache hits skip the governor. Calls whose
+    result reports no token usage settle their reservation from an estimate. Other entry points that
+    would call the provider (transform, astream_events, bind, ...) raise
+    AttributeError instead of bypassing the governor. Everything else is
+    delegated to the wrapped runnable.
+    """
+
+    # Runnable methods that call the provider, or build a runnable that would, past the governor
+    UNGOVERNED = frozenset({
+        "transform", "atransform", "astream_log", "astream_events", "batch_as_completed", "abatch_as_completed",
+        "bind", "bind_tools", "with_structured_output", "with_config", "with_retry", "with_fallbacks",
+        "with_listeners", "with_alisteners", "with_types", "pipe", "assign", "pick", "map",
+    })
+
+    def __init__(self, runnable, provider: str, model: str, max_tokens: Optional[int] = None):
+        self.runnable = runnable
+        self.provider = provider
+        self.model = model
+        self.max_tokens = max_tokens
+
+    @staticmethod
+    def _record(slot: Slot, result) -> None:
+        usage = getattr(result, "usage_metadata", None)
+        if usage:
+            slot.record_tokens(usage.get("total_tokens"))
+
+    @staticmethod
+    def _settle(slot: Slot, input, outputs) -> None:
+        """Without reported usage (e.g. structured output), settle the reservation from an estimate."""
+        if slot.used_tokens is None:
+            text = "".join(_output_text(output) for output in outputs)
+            slot.record_tokens(count_message_tokens(input) + count_tokens(text))
+
+    def _cache_lookup(self, input, kwargs):
+        """(cache, prompt, llm_string) the wrapped chat model will look up, or None if it has no cache."""
+        model, bound = self.runnable, {}
+        # with_structured_output builds model.bind(...) | parser
+        model = getattr(model, "first", model)
+        if hasattr(model, "bound") and hasattr(model, "kwargs"):
+            model, bound = model.bound, model.kwargs
+        cache = getattr(model, "cache", None)
+        if not isinstance(cache, BaseCache):
+            return None
+        try:
+            call_kwargs = {**bound, **kwargs}
+            stop = call_kwargs.pop("stop", None)
+            # BaseChatModel.generate drops these before the cache lookup
+            call_kwargs.pop("ls_structured_output_format", None)
+            call_kwargs.pop("structured_output_format", None)
+            messages = [m.model_copy(update={"id": None}) if getattr(m, "id", None) is not None else m
+                        for m in model._convert_input(input).to_messages()]
+            return cache, dumps(messages), model._get_llm_string(stop=stop, **call_kwargs)
+        except Exception as e:
+            print(f"Warning: could not check the LLM cache before the governor: {e}")
+            return None
+
+    def _cached(self, input, kwargs) -> bool:
+        """Whether the response is already cached, so the call never reaches the provider."""
+        lookup = self._cache_lookup(input, kwargs)
+        return lookup is not None and lookup[0].lookup(lookup[1], lookup[2]) is not None
+
+    async def _acached(self, input, kwargs) -> bool:
+        lookup = self._cache_lookup(input, kwargs)
+        return lookup is not None and await lookup[0].alookup(lookup[1], lookup[2]) is not None
+
+    def invoke(self, input, config=None, **kwargs):
+        governor = get_governor(self.provider, self.model)
+        # Cache hits neither queue for a slot nor use up the token bucket
+        if governor is None or self._cached(input, kwargs):
+            return self.runnable.invoke(input, config, **kwargs)
+        with governor.slot(estimate_tokens(input, self.max_tokens)) as slot:
+            result = self.runnable.invoke(input, config, **kwargs)
+            self._record(slot, result)
+            self._settle(slot, input, [result])
+            return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        governor = get_governor(self.provider, self.model)
+        if governor is None or await self._acached(input, kwargs):
+            return await self.runnable.ainvoke(input, config, **kwargs)
+        async with governor.aslot(estimate_tokens(input, self.max_tokens)) as slot:
+            result = await self.runnable.ainvoke(input, config, **kwargs)
+            self._record(slot, result)
+            self._settle(slot, input, [result])
+            return result
+
+    def stream(self, input, config=None, **kwargs):
+        governor = get_governor(self.provider, self.model)
+        if governor is None:
+            yield from self.runnable.stream(input, config, **kwargs)
+            return
+        with governor.slot(estimate_tokens(input, self.max_tokens)) as slot:
+            chunks = []
+            for chunk in self.runnable.stream(input, config, **kwargs):
+                # Usage arrives with the last chunk, when the provider reports it
+                self._record(slot, chunk)
+                chunks.append(chunk)
+                yield chunk
+            self._settle(slot, input, chunks)
+
+    async def astream(self, input, config=None, **kwargs):
+        governor = get_governor(self.provider, self.model)
+        if governor is None:
+            async for chunk in self.runnable.astream(input, config, **kwargs):
+                yield chunk
+            return
+        async with governor.aslot(estimate_tokens(input, self.max_tokens)) as slot:
+            chunks = []
+            async for chunk in self.runnable.astream(input, config, **kwargs):
+                self._record(slot, chunk)
+                chunks.append(chunk)
+                yield chunk
+            self._settle(slot, input, chunks)
+
+    @staticmethod
+    def _configs(config, count: int) -> list:
+        return list(config) if isinstance(config, (list, tuple)) else [config] * count
+
+    def batch(self, inputs, config=None, *, return_exceptions: bool = False, **kwargs):
+        """One governed invoke per input, on threads that keep the caller's context (e.g. llm_priority)."""
+        if not inputs:
+            return []
+        configs = self._configs(config, len(inputs))
+
+        def one(input, config):
+            try:
+                return self.invoke(input, config, **kwargs)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        with get_executor_for_config(configs[0]) as executor:
+            return list(executor.map(one, inputs, configs))
+
+    async def abatch(self, inputs, config=None, *, return_exceptions: bool = False, **kwargs):
+        """One governed ainvoke per input, run concurrently (at most max_concurrency from the config)."""
+        configs = self._configs(config, len(inputs))
+        max_concurrency = (configs[0] or {}).get("max_concurrency") if configs else None
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def one(input, config):
+            if semaphore is None:
+                return await self.ainvoke(input, config, **kwargs)
+            async with semaphore:
+                return await self.ainvoke(input, config, **kwargs)
+
+        return await asyncio.gather(*(one(input, config) for input, config in zip(inputs, configs)),
+                                    return_exceptions=return_exceptions)
+
+    def __getattr__(self, name):
+        if name in self.UNGOVERNED:
+            raise AttributeError(f"GovernedModel.{name} would bypass the LLM governor; use invoke, ainvoke, "
+                                 f"stream, astream, batch or abatch, or wrap the runnable it builds")
+        return getattr(self.runnable, name)
+
+@lru_cache(maxsize=None)
+def _limits() -> Dict[str, Dict]:
+    return json.loads(os.getenv("LLM_LIMITS", "") or "{}")
+
+_governors: Dict[Tuple[str, str], Governor] = {}
+_governors_lock = threading.Lock()
+
+def get_governor(provider: str, model: str) -> Optional[Governor]:
+    """The process-wide governor of a provider and model, or None if the governor is off."""
+    if os.getenv("LLM_GOVERNOR", "on").lower() in ("off", "0", "false", "no"):
+        return None
+    key = (provider, model)
+    with _governors_lock:
+        governor = _governors.get(key)
+        if governor is None:
+            limits = {**_limits().get(provider, {}), **_limits().get(f"{provider}:{model}", {})}
+            governor = _governors[key] = Governor(provider, model, **limits)
+        return governor
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Seconds from Retry-After (seconds or HTTP date) or retry-after-ms, if present."""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def report_rate_limit(retry_after: Optional[float] = None) -> None:
+    """Report a 429 to the governor of the call in progress, for clients that do not use httpx."""
+    slot = _current_slot.get()
+    if slot is not None:
+        slot.record_rate_limit(retry_after)
+
+def observe_response(response) -> None:
+    """httpx response hook: report 429s to the governor of the call in progress."""
+    if response.status_code == 429:
+        report_rate_limit(parse_retry_after(response.headers))
+
+async def aobserve_response(response) -> None:
+    """Async httpx response hook; see observe_response."""
+    observe_response(response)
+
+HTTPX_EVENT_HOOKS = {"response": [observe_response]}
+ASYNC_HTTPX_EVENT_HOOKS = {"response": [aobserve_response]}
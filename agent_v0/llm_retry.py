@@ -0,0 +1,221 @@
+"""
+Retries with deadlines and a circuit breaker for blocking LLM calls.
+
+A research run makes dozens of LLM calls over several minutes, and a single
+transient 5xx, timeout or dropped connection used to abort all of it.
+call_with_retries runs one attempt at a time:
+
+- transient errors (connection errors, timeouts, 408/409/429 and 5xx) are
+  retried with full-jitter exponential backoff, honouring Retry-After
+- every attempt gets a timeout, and all attempts together a deadline; no
+  attempt or backoff sleep runs past the deadline
+- a circuit breaker per provider opens after a run of consecutive transient
+  failures. While it is open, calls fail at once with CircuitOpenError instead
+  of each waiting out its own retries. After the reset timeout a single probe
+  call is let through; its outcome closes or reopens the circuit.
+
+429s do not count towards the breaker: a rate-limited provider is up, and
+llm_governor.py slows callers down instead.
+
+Settings (environment variables):
+    LLM_RETRY_ATTEMPTS: attempts per call, including the first (default 4)
+    LLM_RETRY_BASE_DELAY: backoff before the first retry, in seconds (default 0.5)
+    LLM_RETRY_MAX_DELAY: upper bound of one backoff, in seconds (default 20)
+    LLM_ATTEMPT_TIMEOUT: timeout of one attempt, in seconds (default 120)
+    LLM_CALL_DEADLINE: time for all attempts of one call, in seconds (default 300)
+    LLM_BREAKER_THRESHOLD: consecutive transient failures that open the circuit (default 5)
+    LLM_BREAKER_RESET: seconds the circuit stays open before a probe (default 30)
+"""
+import os
+import time
+import random
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, TypeVar
+
+import openai
+
+from llm_governor import parse_retry_after
+from metrics import LLM_CALL_FAILURES, LLM_CIRCUIT_STATE, LLM_CIRCUIT_TRANSITIONS, LLM_RETRIES
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429})
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+def failure_reason(exc: BaseException) -> Optional[str]:
+    """Short reason for a transient error, or None if retrying will not help."""
+    if isinstance(exc, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(exc, openai.APIConnectionError):
+        return "connection"
+    if isinstance(exc, openai.APIStatusError):
+        if exc.status_code == 429:
+            return "rate_limited"
+        if exc.status_code >= 500:
+            return "server_error"
+        if exc.status_code in RETRYABLE_STATUS_CODES:
+            return f"status_{exc.status_code}"
+    return None
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float, exc: Optional[BaseException] = None) -> float:
+    """
+    Full-jitter backoff before retry number attempt (0-based).
+
+    A Retry-After header on the failed response sets a lower bound.
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    response = getattr(exc, "response", None)
+    retry_after = parse_retry_after(response.headers) if response is not None else None
+    return max(delay, min(retry_after, max_delay)) if retry_after else delay
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one provider.
+
+    States are exported as llm_circuit_state: 0 closed, 1 open, 2 half open.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    _STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+    def __init__(self, provider: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        LLM_CIRCUIT_STATE.set(0, provider=provider)
+
+    def _transition(self, state: str) -> None:
+        """Holds the lock."""
+        if state != self.state:
+            self.state = state
+            LLM_CIRCUIT_STATE.set(self._STATE_VALUES[state], provider=self.provider)
+            LLM_CIRCUIT_TRANSITIONS.inc(provider=self.provider, state=state)
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go to the provider now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"LLM provider '{self.provider}' is failing; circuit open, next probe in {retry_in:.0f}s")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._transition(self.CLOSED)
+
+    def release_probe(self) -> None:
+        """End a call that never got an answer from the provider, leaving the state as it is."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition(self.OPEN)
+            self._probe_in_flight = False
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    attempt_timeout: float = 120.0
+    deadline: float = 300.0
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            attempts=int(os.getenv("LLM_RETRY_ATTEMPTS", "4")),
+            base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "20")),
+            attempt_timeout=float(os.getenv("LLM_ATTEMPT_TIMEOUT", "120")),
+            deadline=float(os.getenv("LLM_CALL_DEADLINE", "300")),
+        )
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """The process-wide circuit breaker of a provider."""
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(
+                provider,
+                failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30")),
+            )
+        return breaker
+
+def call_with_retries(attempt: Callable[[float], T], provider: str, model: str,
+                      policy: Optional[RetryPolicy] = None, sleep: Callable[[float], None] = time.sleep) -> T:
+    """
+    Run attempt(timeout) until it succeeds, retrying transient errors.
+
+    attempt receives the timeout in seconds for that attempt. Raises the last
+    error once the attempts or the deadline are used up, CircuitOpenError if the
+    provider's circuit is open, and any non-transient error at once.
+    """
+    policy = policy or RetryPolicy.from_env()
+    breaker = get_breaker(provider)
+    deadline = time.monotonic() + policy.deadline
+    labels = {"provider": provider, "model": model}
+    last_error = None
+    for number in range(max(1, policy.attempts)):
+        try:
+            breaker.before_call()
+        except CircuitOpenError as e:
+            LLM_CALL_FAILURES.inc(reason="circuit_open", **labels)
+            raise e from last_error
+        remaining = deadline - time.monotonic()
+        try:
+            result = attempt(min(policy.attempt_timeout, remaining))
+        except Exception as e:
+            reason = failure_reason(e)
+            if reason is None:
+                if isinstance(e, openai.APIStatusError):
+                    # The provider answered; the request itself is at fault
+                    breaker.record_success()
+                else:
+                    # Cancelled, unparseable or a bug on our side: says nothing about the provider
+                    breaker.release_probe()
+                LLM_CALL_FAILURES.inc(reason="not_retryable", **labels)
+                raise
+            if reason == "rate_limited":
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            delay = backoff_delay(number, policy.base_delay, policy.max_delay, e)
+            if number + 1 >= max(1, policy.attempts):
+                LLM_CALL_FAILURES.inc(reason="attempts", **labels)
+                raise
+            if time.monotonic() + delay >= deadline:
+                LLM_CALL_FAILURES.inc(reason="deadline", **labels)
+                raise
+            last_error = e
+            LLM_RETRIES.inc(reason=reason, **labels)
+            print(f"Warning: LLM call to {model} ({provider}) failed ({reason}: {e}); retry {number + 1} in {delay:.1f}s")
+            sleep(delay)
+            continue
+        except BaseException:
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
@@ -0,0 +1,352 @@
+"""
+In-process Prometheus metrics for the API and the agents.
+
+Counters, gauges and histograms live in this process and are rendered in the
+Prometheus text exposition format by GET /metrics. Recording a sample is a dict
+lookup and a few additions under a lock, cheap enough for every LLM call,
+search and graph node. With several API workers, each worker reports its own
+series; scrape every worker (or aggregate with the `instance` label).
+"""
+import time
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from token_counter import cached_prompt_tokens, record_usage
+
+# Latency buckets in seconds: LLM calls and research runs take from milliseconds to minutes
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Result count buckets for one search call
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_registry: List["_Metric"] = []
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set."""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. requests in flight."""
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, with sum and count."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts (not cumulative), sum, count]
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+# --- Metric definitions ---
+
+AGENT_REQUEST_SECONDS = Histogram(
+    "agent_request_duration_seconds", "Time to complete an agent request.", ["agent", "mode"])
+AGENT_REQUESTS = Counter(
+    "agent_requests_total", "Agent requests by outcome.", ["agent", "mode", "status"])
+AGENT_REQUESTS_IN_FLIGHT = Gauge(
+    "agent_requests_in_flight", "Agent requests currently running.", ["agent"])
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds", "Latency of LLM calls, from governor admission.", ["model"])
+LLM_REQUESTS = Counter(
+    "llm_requests_total", "LLM calls by outcome.", ["model", "status"])
+LLM_PROMPT_TOKENS = Counter(
+    "llm_prompt_tokens_total", "Prompt tokens reported by the provider.", ["model"])
+LLM_COMPLETION_TOKENS = Counter(
+    "llm_completion_tokens_total", "Completion tokens reported by the provider.", ["model"])
+LLM_CACHED_PROMPT_TOKENS = Counter(
+    "llm_cached_prompt_tokens_total", "Prompt tokens the provider served from its prompt cache.", ["model"])
+LLM_REQUESTS_IN_FLIGHT = Gauge(
+    "llm_requests_in_flight", "LLM calls currently waiting for a response.", ["model"])
+
+LLM_GOVERNOR_CONCURRENCY_LIMIT = Gauge(
+    "llm_governor_concurrency_limit", "Current AIMD limit of LLM calls in flight.", ["provider", "model"])
+LLM_GOVERNOR_QUEUED = Gauge(
+    "llm_governor_queued", "LLM calls waiting for a governor slot.", ["provider", "model"])
+LLM_GOVERNOR_WAIT_SECONDS = Histogram(
+    "llm_governor_wait_seconds", "Time LLM calls waited for a governor slot.", ["provider", "model"])
+LLM_RATE_LIMITED = Counter(
+    "llm_rate_limited_total", "HTTP 429 responses from LLM providers.", ["provider", "model"])
+
+LLM_RETRIES = Counter(
+    "llm_retries_total", "LLM call attempts retried after a transient error.", ["provider", "model", "reason"])
+LLM_CALL_FAILURES = Counter(
+    "llm_call_failures_total",
+    "LLM calls given up on (attempts, deadline, not_retryable, circuit_open).",
+    ["provider", "model", "reason"])
+LLM_CIRCUIT_STATE = Gauge(
+    "llm_circuit_state", "Circuit breaker state per provider (0 closed, 1 open, 2 half open).", ["provider"])
+LLM_CIRCUIT_TRANSITIONS = Counter(
+    "llm_circuit_transitions_total", "Circuit breaker state changes by new state.", ["provider", "state"])
+LLM_STRUCTURED_OUTPUT_FAILURES = Counter(
+    "llm_structured_output_failures_total", "LLM replies that were not valid JSON of the requested schema.", ["step"])
+
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_first_token_seconds", "Time to the first streamed token of hedgeable LLM calls.", ["node"])
+LLM_HEDGES = Counter(
+    "llm_hedged_requests_total",
+    "Hedgeable LLM calls by outcome (not_hedged, over_budget, primary_won, secondary_won, failed).",
+    ["node", "outcome"])
+LLM_HEDGE_DELAY_SECONDS = Gauge(
+    "llm_hedge_delay_seconds", "Current wait for a first token before a hedged request is sent.", ["node"])
+
+SEARCH_SECONDS = Histogram(
+    "search_duration_seconds", "Latency of one search call (all of its queries).", ["backend"])
+SEARCH_RESULTS = Histogram(
+    "search_results", "Results returned by one search call.", ["backend"], buckets=COUNT_BUCKETS)
+SEARCH_ERRORS = Counter(
+    "search_errors_total", "Failed search calls or queries.", ["backend"])
+SEARCH_IN_FLIGHT = Gauge(
+    "search_requests_in_flight", "Search calls currently running.", ["backend"])
+SEARCH_CACHE_LOOKUPS = Counter(
+    "search_cache_lookups_total", "Search cache lookups per query (hit, negative_hit, miss, coalesced).",
+    ["backend", "result"])
+SEARCH_QUERY_TIMEOUTS = Counter(
+    "search_query_timeouts_total", "Search queries given up on after their timeout; the rest of the batch is kept.",
+    ["backend"])
+
+RESEARCH_RESUMES = Counter(
+    "research_runs_resumed_total", "Research runs resumed from a checkpoint of an earlier failed run.", ["agent"])
+RESEARCH_STEPS_RESUMED = Counter(
+    "research_steps_resumed_total", "Research steps restored from a checkpoint instead of run again.", ["agent"])
+RESEARCH_EARLY_STOPS = Counter(
+    "research_early_stops_total", "Section research loops stopped because a search found no new sources.", ["agent"])
+
+GRAPH_NODE_SECONDS = Histogram(
+    "graph_node_duration_seconds", "Duration of LangGraph node runs.", ["graph", "node", "status"])
+GRAPH_NODES_IN_FLIGHT = Gauge(
+    "graph_nodes_in_flight", "LangGraph nodes currently running.", ["graph", "node"])
+
+# --- Helpers ---
+
+@contextmanager
+def track_agent_request(agent: str, mode: str):
+    """Time an agent request and keep the in-flight gauge up to date."""
+    AGENT_REQUESTS_IN_FLIGHT.inc(agent=agent)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    except (asyncio.CancelledError, GeneratorExit):
+        # GeneratorExit: the consumer of a stream went away
+        status = "cancelled"
+        raise
+    finally:
+        AGENT_REQUESTS_IN_FLIGHT.dec(agent=agent)
+        AGENT_REQUEST_SECONDS.observe(time.perf_counter() - start, agent=agent, mode=mode)
+        AGENT_REQUESTS.inc(agent=agent, mode=mode, status=status)
+
+@contextmanager
+def track_llm_call(model: str):
+    """Time an LLM call made without LangChain (token counts are recorded by the caller)."""
+    LLM_REQUESTS_IN_FLIGHT.inc(model=model)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        LLM_REQUESTS_IN_FLIGHT.dec(model=model)
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model=model)
+        LLM_REQUESTS.inc(model=model, status=status)
+
+def record_llm_usage(model: str, prompt_tokens, completion_tokens, cached_tokens=0) -> None:
+    record_usage(prompt_tokens, completion_tokens, cached_tokens)
+    if prompt_tokens:
+        LLM_PROMPT_TOKENS.inc(prompt_tokens, model=model)
+    if completion_tokens:
+        LLM_COMPLETION_TOKENS.inc(completion_tokens, model=model)
+    if cached_tokens:
+        LLM_CACHED_PROMPT_TOKENS.inc(cached_tokens, model=model)
+
+@contextmanager
+def track_search(backend: str):
+    """Time a search call; raised exceptions count as errors."""
+    SEARCH_IN_FLIGHT.inc(backend=backend)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SEARCH_ERRORS.inc(backend=backend)
+        raise
+    finally:
+        SEARCH_IN_FLIGHT.dec(backend=backend)
+        SEARCH_SECONDS.observe(time.perf_counter() - start, backend=backend)
+
+def record_search_results(backend: str, results: int, errors: int = 0) -> None:
+    SEARCH_RESULTS.observe(results, backend=backend)
+    if errors:
+        SEARCH_ERRORS.inc(errors, backend=backend)
+
+def timed_node(graph: str, node: str, func):
+    """Wrap a LangGraph node function (sync or async) to record its duration."""
+
+    @contextmanager
+    def track():
+        GRAPH_NODES_IN_FLIGHT.inc(graph=graph, node=node)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            GRAPH_NODES_IN_FLIGHT.dec(graph=graph, node=node)
+            GRAPH_NODE_SECONDS.observe(time.perf_counter() - start, graph=graph, node=node, status=status)
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with track():
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with track():
+            return func(*args, **kwargs)
+    return wrapper
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    LangChain callback recording latency, outcome and token usage of chat model calls.
+
+    Attach it with callbacks=[llm_metrics_callback] when creating a chat model;
+    it covers invoke, ainvoke, stream, astream and batch calls alike.
+    """
+
+    # Record synchronously instead of dispatching to a thread for async runs
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[object, Tuple[str, float]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, invocation_params=None, **kwargs):
+        params = invocation_params or {}
+        model = (metadata or {}).get("ls_model_name") or params.get("model_name") or params.get("model") or "unknown"
+        self._runs[run_id] = (model, time.perf_counter())
+        LLM_REQUESTS_IN_FLIGHT.inc(model=model)
+
+    def _finish(self, run_id, status: str):
+        model, start = self._runs.pop(run_id, (None, None))
+        if model is None:
+            return None
+        LLM_REQUESTS_IN_FLIGHT.dec(model=model)
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model=model)
+        LLM_REQUESTS.inc(model=model, status=status)
+        return model
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        model = self._finish(run_id, "ok")
+        if model is None:
+            return
+        prompt_tokens = completion_tokens = cached_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+                    cached_tokens += cached_prompt_tokens(usage)
+        if not prompt_tokens and not completion_tokens:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = token_usage.get("prompt_tokens", 0)
+            completion_tokens = token_usage.get("completion_tokens", 0)
+            cached_tokens = cached_prompt_tokens(token_usage)
+        record_llm_usage(model, prompt_tokens, completion_tokens, cached_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "error")
+
+llm_metrics_callback = LLMMetricsCallback()
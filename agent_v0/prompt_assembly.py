@@ -0,0 +1,55 @@
+"""
+Prompt assembly that keeps prompts prefix-stable for provider prompt caching.
+
+OpenAI-compatible providers (including OpenRouter's upstreams) reuse the work
+done on a prompt prefix they have seen recently. This usually starts at 1024
+tokens and grows in 128-token steps, and it saves both cost and prefill
+latency. A prompt that formats the topic or the sources into the middle of
+its instructions diverges early and shares almost nothing with the previous
+call. assemble_messages orders a prompt from the most to the least stable
+part:
+
+1. the system prompt: static instructions, byte-identical across calls
+2. the conversation history: the user and assistant turns only, the same for
+   every step of a run (conversation_turns)
+3. the shared block: large content used as is by several calls with the same
+   history, such as the sources a section is both written and graded from
+4. the task: which step to run and its small variable inputs
+
+The cached prompt tokens reported by the provider are collected per run by
+token_counter and exported by metrics as llm_cached_prompt_tokens_total.
+"""
+from typing import Dict, List, Optional
+
+from token_counter import count_message_tokens
+
+CONVERSATION_ROLES = ("user", "assistant")
+
+def conversation_turns(history: Optional[List[Dict]], max_tokens: Optional[int] = None) -> List[Dict]:
+    """
+    The user and assistant turns of a chat history, without pipeline messages.
+
+    With max_tokens, the oldest turns are dropped until the rest fit; the last
+    turn is always kept.
+    """
+    turns = [{"role": m["role"], "content": m.get("content", "")}
+             for m in history or [] if m.get("role") in CONVERSATION_ROLES]
+    if max_tokens is None:
+        return turns
+    kept, tokens = [], 0
+    for turn in reversed(turns):
+        tokens += count_message_tokens([turn])
+        if kept and tokens > max_tokens:
+            break
+        kept.append(turn)
+    return kept[::-1]
+
+def assemble_messages(system: str, task: str, shared: Optional[str] = None,
+                      history: Optional[List[Dict]] = None) -> List[Dict]:
+    """Chat messages for one call, most stable first: system, history, shared block, task."""
+    messages = [{"role": "system", "content": system}]
+    messages += history or []
+    if shared is not None:
+        messages.append({"role": "user", "content": shared})
+    messages.append({"role": "user", "content": task})
+    return messages
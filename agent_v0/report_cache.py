@@ -0,0 +1,299 @@
+"""
+Near-duplicate topic cache for research reports.
+
+Users often ask for almost the same topic ("impact of AI on jobs" vs "AI's
+impact on employment"), and every request runs the full research
+pipeline. This cache stores finished reports and finds earlier reports on a
+near-duplicate topic with MinHash signatures over normalized word shingles,
+indexed with locality-sensitive hashing (LSH), all local and CPU-only.
+
+A topic is lowercased, stripped of punctuation and stop words, lightly
+stemmed and mapped through a small synonym table (SYNONYMS, SYNONYM_PHRASES),
+then turned into word shingles. Its MinHash signature estimates the
+Jaccard similarity of two shingle sets. The signature is split into bands, and
+each band is hashed into a bucket stored in an indexed SQLite table. A lookup
+only compares against reports that share at least one bucket, so its cost does
+not grow with the number of stored reports, and scores those candidates by the
+exact Jaccard similarity of their stored normalized topics. Reports older than
+the freshness window are never served.
+
+Topics are short, so one different word moves the similarity a lot: "benefits
+of remote work for software teams" and "drawbacks of ..." share 4 of 6 words
+(0.67). The default threshold of 0.8 only accepts rewordings and small
+additions, not a swapped subject. Synonyms are what let rewordings through:
+on words alone, "impact of AI on jobs" ({ai, impact, job}) and "AI's impact on
+employment" ({ai, employment, impact}) score 0.5, and with employment mapped
+to job they score 1.0. A synonym missing from the table still counts as a
+different word, so such rewordings miss the cache rather than risk serving a
+report on another subject.
+
+The cache is off unless REPORT_CACHE is set.
+"""
+import os
+import re
+import time
+import random
+import struct
+import sqlite3
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers how i if
+in into is it its itself just me more most my no nor not now of off on once only or other our out over own same she
+should so some such than that the their them then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your
+""".split())
+
+# Stemmed word -> canonical word, for rewordings common in research topics
+SYNONYMS = {
+    "employment": "job", "occupation": "job", "workforce": "job",
+    "labour": "labor",
+    "effect": "impact", "influence": "impact", "consequence": "impact",
+    "advantage": "benefit", "pro": "benefit",
+    "disadvantage": "drawback", "con": "drawback", "downside": "drawback",
+    "usa": "us", "america": "us",
+}
+
+# Stemmed two-word phrase -> canonical word
+SYNONYM_PHRASES = {
+    ("artificial", "intelligence"): "ai",
+    ("machine", "learning"): "ml",
+    ("labor", "market"): "job",
+    ("job", "market"): "job",
+    ("united", "state"): "us",
+}
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+def normalize_topic(topic: str) -> List[str]:
+    """Lowercased, stemmed and canonicalized content words of a topic, in order."""
+    words = re.findall(r"[a-z0-9]+", topic.lower().replace("'s", ""))
+    tokens = []
+    for word in words:
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        word = SYNONYMS.get(word, word)
+        if tokens and (tokens[-1], word) in SYNONYM_PHRASES:
+            tokens[-1] = SYNONYM_PHRASES[tokens[-1], word]
+            continue
+        tokens.append(word)
+    return tokens
+
+def shingles(tokens: List[str], size: int = 1) -> set:
+    """Word n-grams of size 1..size (topics are short, so unigrams carry most of the signal)."""
+    result = set()
+    for n in range(1, size + 1):
+        result.update(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return result
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+class MinHasher:
+    """MinHash signatures with num_perm universal hash functions, split into bands for LSH."""
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        self._params = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+        self._format = f"<{num_perm}Q"
+
+    def signature(self, shingle_set) -> tuple:
+        if not shingle_set:
+            return tuple([MERSENNE_PRIME] * self.num_perm)
+        hashes = [_hash64(s) % MERSENNE_PRIME for s in shingle_set]
+        return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self._params)
+
+    def band_buckets(self, signature) -> List[int]:
+        """One bucket id per band; equal buckets mean the band rows are identical."""
+        buckets = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(struct.pack(f"<I{self.rows}Q", band, *rows), digest_size=8).digest()
+            # SQLite integers are signed 64-bit
+            buckets.append(int.from_bytes(digest, "little", signed=True))
+        return buckets
+
+    def pack(self, signature) -> bytes:
+        return struct.pack(self._format, *signature)
+
+    def unpack(self, blob: bytes) -> tuple:
+        return struct.unpack(self._format, blob)
+
+class ReportCache:
+    """
+    Stores research reports and finds reports on near-duplicate topics.
+
+    Args:
+        path: SQLite database file, or ":memory:"
+        max_age_seconds: Freshness window; older reports are not served and are purged on write
+        threshold: Minimum Jaccard similarity of the topics' shingle sets
+        shingle_size: Largest word n-gram used as a shingle
+        num_perm / bands: MinHash signature length and LSH bands. With r = num_perm / bands
+            rows per band, topics with similarity s become candidates with probability
+            1 - (1 - s^r)^bands; the defaults (128 / 32) put the steep part around 0.4,
+            so topics above the threshold are practically always found
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS reports (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      topic TEXT NOT NULL,
+      normalized TEXT NOT NULL,
+      signature BLOB NOT NULL,
+      report TEXT NOT NULL,
+      created_at REAL NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS report_buckets (
+      bucket INTEGER NOT NULL,
+      report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_reports_normalized ON reports(normalized);
+    CREATE INDEX IF NOT EXISTS idx_reports_created_at ON reports(created_at);
+    CREATE INDEX IF NOT EXISTS idx_report_buckets_bucket ON report_buckets(bucket);
+    CREATE INDEX IF NOT EXISTS idx_report_buckets_report_id ON report_buckets(report_id);
+    """
+
+    # Purge expired reports at most this often
+    PURGE_INTERVAL = 3600
+
+    def __init__(self, path: str = ":memory:", max_age_seconds: Optional[float] = 7 * 24 * 3600,
+                 threshold: float = 0.8, shingle_size: int = 1, num_perm: int = 128, bands: int = 32):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm, bands)
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(self.SCHEMA)
+
+    def _signature(self, tokens):
+        return self.hasher.signature(shingles(tokens, self.shingle_size))
+
+    def _similarity(self, a: set, normalized: str) -> float:
+        b = shingles(normalized.split(), self.shingle_size)
+        return len(a & b) / len(a | b) if a or b else 0.0
+
+    def _cutoff(self, now: float) -> float:
+        return now - self.max_age_seconds if self.max_age_seconds is not None else float("-inf")
+
+    def put(self, topic: str, report: str) -> int:
+        """Store a finished report; returns its id."""
+        tokens = normalize_topic(topic)
+        signature = self._signature(tokens)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT INTO reports (topic, normalized, signature, report, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (topic, " ".join(tokens), self.hasher.pack(signature), report, now),
+                )
+                report_id = cursor.lastrowid
+                self._conn.executemany(
+                    "INSERT INTO report_buckets (bucket, report_id) VALUES (?, ?)",
+                    [(bucket, report_id) for bucket in set(self.hasher.band_buckets(signature))],
+                )
+                if self.max_age_seconds is not None and now - self._last_purge > self.PURGE_INTERVAL:
+                    self._conn.execute("DELETE FROM reports WHERE created_at < ?", (self._cutoff(now),))
+                    self._last_purge = now
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return report_id
+
+    def lookup(self, topic: str) -> Optional[Dict]:
+        """
+        Freshest stored report on a near-duplicate topic, or None.
+
+        Returns a dict with id, topic, report, created_at and similarity.
+        """
+        tokens = normalize_topic(topic)
+        if not tokens:
+            return None
+        now = time.time()
+        cutoff = self._cutoff(now)
+        with self._lock:
+            # Same words after normalization: no need to estimate anything
+            row = self._conn.execute(
+                "SELECT id, topic, report, created_at FROM reports WHERE normalized = ? AND created_at >= ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (" ".join(tokens), cutoff),
+            ).fetchone()
+            if row is not None:
+                return {"id": row[0], "topic": row[1], "report": row[2], "created_at": row[3], "similarity": 1.0}
+
+            signature = self._signature(tokens)
+            buckets = self.hasher.band_buckets(signature)
+            placeholders = ",".join("?" * len(buckets))
+            candidates = self._conn.execute(
+                f"SELECT id, normalized, created_at FROM reports WHERE created_at >= ? AND id IN "
+                f"(SELECT report_id FROM report_buckets WHERE bucket IN ({placeholders}))",
+                (cutoff, *buckets),
+            ).fetchall()
+        # LSH only finds candidates; score them exactly, as MinHash estimates are off by several points
+        query_shingles = shingles(tokens, self.shingle_size)
+        best = None
+        for report_id, normalized, created_at in candidates:
+            similarity = self._similarity(query_shingles, normalized)
+            if similarity >= self.threshold and (best is None or (similarity, created_at) > (best[1], best[2])):
+                best = (report_id, similarity, created_at)
+        if best is None:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT topic, report FROM reports WHERE id = ?", (best[0],)).fetchone()
+        if row is None:
+            return None
+        return {"id": best[0], "topic": row[0], "report": row[1], "created_at": best[2], "similarity": best[1]}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+@lru_cache(maxsize=None)
+def get_report_cache() -> Optional[ReportCache]:
+    """
+    Process-wide report cache configured through environment variables, or None if disabled.
+
+    REPORT_CACHE: "off" (default), "memory" or "sqlite"
+    REPORT_CACHE_PATH: SQLite database file (default "report_cache.db")
+    REPORT_CACHE_MAX_AGE: freshness window in seconds (default 604800, one week)
+    REPORT_CACHE_THRESHOLD: minimum topic similarity, 0-1 (default 0.8)
+    REPORT_CACHE_SHINGLE_SIZE: largest word n-gram used as a shingle (default 1)
+    """
+    backend = os.getenv("REPORT_CACHE", "off").lower()
+    if backend in ("", "off", "0", "false", "none"):
+        return None
+    if backend not in ("memory", "sqlite"):
+        raise ValueError(f"Unsupported report cache: {backend}")
+    return ReportCache(
+        path=os.getenv("REPORT_CACHE_PATH", "report_cache.db") if backend == "sqlite" else ":memory:",
+        max_age_seconds=float(os.getenv("REPORT_CACHE_MAX_AGE", str(7 * 24 * 3600))),
+        threshold=float(os.getenv("REPORT_CACHE_THRESHOLD", "0.8")),
+        shingle_size=int(os.getenv("REPORT_CACHE_SHINGLE_SIZE", "1")),
+    )
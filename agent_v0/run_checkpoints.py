@@ -0,0 +1,112 @@
+"""
+Checkpoints of research runs, so a failed run resumes instead of restarting.
+
+Each step of the v0 research pipeline (the plan, each section) depends only on
+the run's inputs and the steps before it, so it is safe to skip when an earlier
+attempt of the same run already completed it. The pipeline saves its state
+after every step, keyed by a hash of the run's inputs (chat history and query).
+If the run fails, for example because the provider's circuit is open, sending
+the same message again picks up after the last completed step. A run that
+finishes deletes its checkpoint.
+
+Checkpoints are kept in memory unless RUN_CHECKPOINTS=sqlite, which lets runs
+resume across restarts and API workers.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+def run_key(*inputs) -> str:
+    """Stable key of a run's inputs (JSON-serializable values)."""
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class RunCheckpoints:
+    """
+    Latest state of unfinished runs, as JSON.
+
+    Args:
+        path: SQLite database file, or ":memory:"
+        max_age_seconds: Checkpoints not updated for this long are not resumed and are purged on write
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS run_checkpoints (
+      key TEXT PRIMARY KEY,
+      state TEXT NOT NULL,
+      updated_at REAL NOT NULL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_run_checkpoints_updated_at ON run_checkpoints(updated_at);
+    """
+
+    # Purge expired checkpoints at most this often
+    PURGE_INTERVAL = 3600
+
+    def __init__(self, path: str = ":memory:", max_age_seconds: Optional[float] = 24 * 3600):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def _cutoff(self, now: float) -> float:
+        return now - self.max_age_seconds if self.max_age_seconds is not None else float("-inf")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """The saved state of a run, or None if it has no (fresh) checkpoint."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM run_checkpoints WHERE key = ? AND updated_at >= ?",
+                (key, self._cutoff(time.time())),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, key: str, state: Dict[str, Any]) -> None:
+        now = time.time()
+        payload = json.dumps(state, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO run_checkpoints (key, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (key, payload, now),
+            )
+            if self.max_age_seconds is not None and now - self._last_purge > self.PURGE_INTERVAL:
+                self._conn.execute("DELETE FROM run_checkpoints WHERE updated_at < ?", (self._cutoff(now),))
+                self._last_purge = now
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM run_checkpoints WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+@lru_cache(maxsize=None)
+def get_run_checkpoints() -> Optional[RunCheckpoints]:
+    """
+    Process-wide run checkpoints configured through environment variables, or None if disabled.
+
+    RUN_CHECKPOINTS: "off", "memory" (default) or "sqlite"
+    RUN_CHECKPOINT_PATH: SQLite database file (default "run_checkpoints.db")
+    RUN_CHECKPOINT_MAX_AGE: seconds an unfinished run can be resumed (default 86400, one day)
+    """
+    backend = os.getenv("RUN_CHECKPOINTS", "memory").lower()
+    if backend in ("", "off", "0", "false", "none"):
+        return None
+    if backend not in ("memory", "sqlite"):
+        raise ValueError(f"Unsupported run checkpoint store: {backend}")
+    return RunCheckpoints(
+        path=os.getenv("RUN_CHECKPOINT_PATH", "run_checkpoints.db") if backend == "sqlite" else ":memory:",
+        max_age_seconds=float(os.getenv("RUN_CHECKPOINT_MAX_AGE", str(24 * 3600))),
+    )
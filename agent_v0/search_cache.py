@@ -0,0 +1,261 @@
+"""
+Shared TTL cache for search results.
+
+The planner, the section query writers and repeated research on popular topics
+send the same or overlapping queries all the time, and every one of them used
+to go to the search backend. SearchCache stores each query's result under a
+hash of (backend, normalized query, effective params):
+
+- results are served for a per-backend TTL; empty and failed results are
+  cached too, for a short negative TTL, so a failing query is not hammered
+- entries live in an in-memory LRU in front of an optional SQLite tier (WAL,
+  safe to share between workers on one host)
+- concurrent lookups of a query that is already being fetched wait for that
+  fetch instead of making their own call (single flight), across threads and
+  event loops of the process; if the fetching caller is cancelled, they fetch
+  the query themselves
+
+Callers search a batch through fetch(), which only sends the queries that miss
+to the backend. The v0 search client and the v1 select_and_execute_search use
+it for every backend.
+
+The cache is off unless SEARCH_CACHE is set (see get_search_cache).
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from metrics import SEARCH_CACHE_LOOKUPS
+
+def normalize_query(query: str) -> str:
+    """Lowercased query with whitespace collapsed."""
+    return " ".join(str(query).lower().split())
+
+def search_cache_key(backend: str, query: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Hash of everything that determines a query's results."""
+    payload = {
+        "backend": backend,
+        "query": normalize_query(query),
+        "params": {k: v for k, v in (params or {}).items() if v is not None},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+
+class _Released(Exception):
+    """The caller fetching a query gave up on it; waiters fetch it themselves."""
+
+class SearchCache:
+    """
+    In-memory LRU of per-query search results, optionally backed by SQLite.
+
+    Args:
+        path: SQLite database file for the disk tier, or None for memory only
+        max_entries: Results kept in memory
+        ttl_seconds: Default age after which a result is no longer served
+        backend_ttls: TTL per backend, overriding ttl_seconds
+        negative_ttl_seconds: TTL of empty or failed results
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS search_results (
+      key TEXT PRIMARY KEY,
+      backend TEXT NOT NULL,
+      value TEXT NOT NULL,
+      negative INTEGER NOT NULL,
+      expires_at REAL NOT NULL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_search_results_expires_at ON search_results(expires_at);
+    """
+
+    # Expired rows are purged at most this often
+    PURGE_INTERVAL = 3600
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 4096, ttl_seconds: float = 24 * 3600,
+                 backend_ttls: Optional[Dict[str, float]] = None, negative_ttl_seconds: float = 120):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend_ttls = backend_ttls or {}
+        self.negative_ttl_seconds = negative_ttl_seconds
+        # key -> (expires_at, negative, JSON of the value); callers each get their own copy
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # key -> future of the fetch in progress, resolving to the JSON of the value
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._last_purge = time.time()
+        self._conn = None
+        if path is not None:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+
+    def ttl(self, backend: str, negative: bool = False) -> float:
+        if negative:
+            return self.negative_ttl_seconds
+        return float(self.backend_ttls.get(backend, self.ttl_seconds))
+
+    def _remember(self, key: str, entry: tuple) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key: str, now: float) -> Optional[tuple]:
+        """(negative, value) for key; call with the lock held."""
+        entry = self._memory.get(key)
+        if entry is not None and entry[0] <= now:
+            del self._memory[key]
+            entry = None
+        if entry is None and self._conn is not None:
+            row = self._conn.execute(
+                "SELECT expires_at, negative, value FROM search_results WHERE key = ? AND expires_at > ?",
+                (key, now)).fetchone()
+            if row is not None:
+                entry = (row[0], bool(row[1]), row[2])
+                self._remember(key, entry)
+        if entry is None:
+            return None
+        self._memory.move_to_end(key)
+        return entry[1], json.loads(entry[2])
+
+    def get(self, key: str) -> Optional[Any]:
+        """The cached result for key, or None."""
+        with self._lock:
+            entry = self._lookup(key, time.time())
+        return entry[1] if entry is not None else None
+
+    def set(self, key: str, backend: str, value: Any, negative: bool = False) -> str:
+        """Store a query's result; returns it as stored (JSON)."""
+        now = time.time()
+        expires_at = now + self.ttl(backend, negative)
+        text = json.dumps(value, default=str)
+        with self._lock:
+            self._remember(key, (expires_at, negative, text))
+            if self._conn is None:
+                return text
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, backend, value, negative, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, backend, text, int(negative), expires_at),
+            )
+            if now - self._last_purge > self.PURGE_INTERVAL:
+                self._last_purge = now
+                self._conn.execute("DELETE FROM search_results WHERE expires_at <= ?", (now,))
+        return text
+
+    async def fetch(self, backend: str, queries: List[str], params: Optional[Dict[str, Any]],
+                    search: Callable[[List[str]], Awaitable[List[Any]]],
+                    negative: Callable[[Any], bool] = lambda value: not value) -> List[Any]:
+        """
+        Results of a batch of queries, one per query, in order.
+
+        search(queries) runs the queries that are neither cached nor being
+        fetched, and must return one result per query. negative(result) tells
+        empty or failed results apart, which are kept for the negative TTL.
+        """
+        keys = [search_cache_key(backend, query, params) for query in queries]
+        results: List[Any] = [None] * len(queries)
+        waiting, owned = [], {}
+        now = time.time()
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._lookup(key, now)
+                if entry is not None:
+                    results[i] = entry[1]
+                    SEARCH_CACHE_LOOKUPS.inc(backend=backend, result="negative_hit" if entry[0] else "hit")
+                elif key in owned:
+                    waiting.append((i, owned[key][1]))
+                    SEARCH_CACHE_LOOKUPS.inc(backend=backend, result="coalesced")
+                elif key in self._inflight:
+                    waiting.append((i, self._inflight[key]))
+                    SEARCH_CACHE_LOOKUPS.inc(backend=backend, result="coalesced")
+                else:
+                    future = self._inflight[key] = concurrent.futures.Future()
+                    owned[key] = (i, future)
+                    SEARCH_CACHE_LOOKUPS.inc(backend=backend, result="miss")
+
+        if owned:
+            try:
+                fetched = await search([queries[i] for i, _ in owned.values()])
+                if len(fetched) != len(owned):
+                    raise ValueError(f"{backend} returned {len(fetched)} results for {len(owned)} queries")
+            except Exception as e:
+                self._release(owned, e)
+                raise
+            except BaseException:
+                # Cancelled: the waiters fetch the queries themselves instead of failing with this caller
+                self._release(owned)
+                raise
+            try:
+                for (key, (i, future)), value in zip(owned.items(), fetched):
+                    results[i] = value
+                    text = self.set(key, backend, value, negative(value))
+                    with self._lock:
+                        del self._inflight[key]
+                    future.set_result(text)
+            finally:
+                # Storing a result failed: no waiter may be left hanging on the rest
+                self._release(owned)
+
+        for i, future in waiting:
+            try:
+                # Shielded, so a cancelled waiter does not cancel the fetch for the others
+                results[i] = json.loads(await asyncio.shield(asyncio.wrap_future(future)))
+            except _Released:
+                results[i] = (await self.fetch(backend, [queries[i]], params, search, negative))[0]
+        return results
+
+    def _release(self, owned: Dict[str, tuple], error: Optional[BaseException] = None) -> None:
+        """Drop owned fetches that are still in flight; their waiters get error, or fetch again."""
+        with self._lock:
+            for key, (_, future) in owned.items():
+                if future.done():
+                    continue
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+                future.set_exception(error if error is not None else _Released())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM search_results")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+@lru_cache(maxsize=None)
+def get_search_cache() -> Optional[SearchCache]:
+    """
+    Process-wide search cache configured through environment variables, or None if disabled.
+
+    SEARCH_CACHE: "off" (default), "memory" or "sqlite"
+    SEARCH_CACHE_PATH: SQLite database file (default "search_cache.db")
+    SEARCH_CACHE_MAX_ENTRIES: results kept in memory (default 4096)
+    SEARCH_CACHE_TTL: seconds a result is served for (default 86400, one day)
+    SEARCH_CACHE_TTLS: JSON object of TTLs per backend, e.g. {"arxiv": 604800, "tavily": 21600}
+    SEARCH_CACHE_NEGATIVE_TTL: seconds an empty or failed result is served for (default 120)
+    """
+    backend = os.getenv("SEARCH_CACHE", "off").lower()
+    if backend in ("", "off", "0", "false", "none"):
+        return None
+    if backend not in ("memory", "sqlite"):
+        raise ValueError(f"Unsupported search cache: {backend}")
+    return SearchCache(
+        path=os.getenv("SEARCH_CACHE_PATH", "search_cache.db") if backend == "sqlite" else None,
+        max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "4096")),
+        ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600))),
+        backend_ttls=json.loads(os.getenv("SEARCH_CACHE_TTLS", "") or "{}"),
+        negative_ttl_seconds=float(os.getenv("SEARCH_CACHE_NEGATIVE_TTL", "120")),
+    )
@@ -0,0 +1,189 @@
+"""
+Structured LLM output: JSON-schema response formats and an incremental JSON parser.
+
+Agents that call the OpenAI-compatible API directly ask for JSON through the
+provider's JSON-schema mode (json_schema_response_format) where the model
+supports it, and parse the reply with JSONStreamParser while it streams. The
+parser returns each element of one array in the document (e.g. the sections
+of a report plan) as soon as that element is complete, so callers can start
+working on it before the rest of the reply has been generated.
+
+Text before the first "{" or "[" (a preamble or a ```json fence) and after
+the end of the document is ignored. Malformed or truncated JSON raises
+StructuredOutputError instead of being silently replaced by a default.
+"""
+import json
+from typing import Any, Dict, List, Optional, Sequence, Type
+
+from pydantic import BaseModel, ValidationError
+
+class StructuredOutputError(ValueError):
+    """The reply is not valid JSON of the requested shape."""
+
+def strict_json_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A pydantic JSON schema adapted to strict JSON-schema mode.
+
+    Strict mode requires every object to list all of its properties as required
+    and to forbid additional properties, and does not accept defaults or titles.
+    """
+    if isinstance(schema, list):
+        return [strict_json_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    result = {}
+    for key, value in schema.items():
+        if key in ("default", "title"):
+            continue
+        if key in ("properties", "$defs"):
+            # Maps of names to schemas; the names themselves are kept
+            result[key] = {name: strict_json_schema(sub) for name, sub in value.items()}
+        else:
+            result[key] = strict_json_schema(value)
+    schema = result
+    if schema.get("type") == "object" and "properties" in schema:
+        schema["required"] = list(schema["properties"])
+        schema["additionalProperties"] = False
+    return schema
+
+def json_schema_response_format(model: Type[BaseModel]) -> Dict[str, Any]:
+    """response_format requesting a reply that matches a pydantic model."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "strict": True,
+            "schema": strict_json_schema(model.model_json_schema()),
+        },
+    }
+
+class _Frame:
+    __slots__ = ("kind", "key", "index", "expect_key")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.key: Optional[str] = None
+        self.index = 0
+        self.expect_key = kind == "{"
+
+    @property
+    def selector(self):
+        return self.key if self.kind == "{" else self.index
+
+class JSONStreamParser:
+    """
+    Parses a JSON document fed in chunks.
+
+    Args:
+        item_path: Keys (and indices) leading to the array whose elements feed()
+            returns as they complete, e.g. ("sections",) for {"sections": [...]}.
+            Elements must be objects or arrays. Empty: only close() parses.
+    """
+
+    def __init__(self, item_path: Sequence = ()):
+        self.item_path = tuple(item_path)
+        self.items: List[Any] = []
+        self._text = ""
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._item_start: Optional[int] = None
+        self._item_depth = 0
+
+    @property
+    def complete(self) -> bool:
+        """Whether the whole document has been received."""
+        return self._end is not None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Add text; return the elements at item_path completed by it."""
+        self._text += chunk
+        completed = []
+        text = self._text
+        while self._pos < len(text) and self._end is None:
+            pos = self._pos
+            char = text[pos]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    frame = self._stack[-1] if self._stack else None
+                    if frame is not None and frame.kind == "{" and frame.expect_key:
+                        frame.key = json.loads(text[self._string_start:pos + 1])
+                continue
+            if self._start is None:
+                if char in "{[":
+                    self._start = pos
+                else:
+                    continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char in "{[":
+                if self._stack and self._is_item_parent():
+                    self._item_start, self._item_depth = pos, len(self._stack)
+                self._stack.append(_Frame(char))
+            elif char in "}]":
+                if not self._stack:
+                    raise StructuredOutputError(f"Unexpected {char!r} at offset {pos}")
+                self._stack.pop()
+                if self._item_start is not None and len(self._stack) == self._item_depth:
+                    completed.append(self._load(text[self._item_start:pos + 1]))
+                    self._item_start = None
+                if not self._stack:
+                    self._end = pos + 1
+            elif char == ":":
+                if self._stack and self._stack[-1].kind == "{":
+                    self._stack[-1].expect_key = False
+            elif char == ",":
+                if self._stack:
+                    frame = self._stack[-1]
+                    if frame.kind == "{":
+                        frame.expect_key = True
+                    else:
+                        frame.index += 1
+        self.items += completed
+        return completed
+
+    def _is_item_parent(self) -> bool:
+        """Whether a value starting now is an element of the array at item_path."""
+        if not self.item_path or self._stack[-1].kind != "[":
+            return False
+        path = tuple(frame.selector for frame in self._stack[:-1])
+        return path == self.item_path
+
+    @staticmethod
+    def _load(text: str) -> Any:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise StructuredOutputError(f"Invalid JSON: {e}") from e
+
+    def close(self) -> Any:
+        """The whole parsed document; raises StructuredOutputError if it is missing or incomplete."""
+        if self._start is None:
+            raise StructuredOutputError("No JSON found in the reply")
+        if self._end is None:
+            raise StructuredOutputError("The reply ended before the JSON document was complete")
+        return self._load(self._text[self._start:self._end])
+
+def parse_json(text: str) -> Any:
+    """Parse a complete reply that contains one JSON document."""
+    parser = JSONStreamParser()
+    parser.feed(text)
+    return parser.close()
+
+def validate(model: Type[BaseModel], data: Any) -> Dict[str, Any]:
+    """data checked against a pydantic model, as a plain dict."""
+    try:
+        return model.model_validate(data).model_dump()
+    except ValidationError as e:
+        raise StructuredOutputError(f"Reply does not match {model.__name__}: {e}") from e
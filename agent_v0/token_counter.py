@@ -0,0 +1,163 @@
+"""
+Token counting shared by the agents.
+
+Uses tiktoken when its encoding can be loaded and falls back to a
+4-characters-per-token estimate otherwise, so counting never fails.
+
+Agents measure each prompt they assemble with measure_prompt. Inside a
+track_token_usage() block, measured prompts and the prompt/completion tokens
+reported by the provider (including prompt tokens served from its prompt
+cache) are added up per run.
+"""
+import os
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Optional
+
+# Encoding used to approximate the tokenizers of the served models
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+@lru_cache(maxsize=None)
+def get_encoder(name: str = TOKENIZER_ENCODING):
+    """Return the cached tiktoken encoder, or None if it is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"Warning: tokenizer '{name}' unavailable, estimating tokens from characters: {e}")
+        return None
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Count the tokens in a string."""
+    if not text:
+        return 0
+    encoder = get_encoder()
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+def message_content(message) -> str:
+    """Text content of a message dict ({"role", "content"}) or LangChain message."""
+    content = message.get("content", "") if isinstance(message, dict) else message.content
+    return content if isinstance(content, str) else str(content)
+
+def count_message_tokens(messages) -> int:
+    """Count the tokens of a list of chat messages, including per-message overhead."""
+    return sum(count_tokens(message_content(m)) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut a string to at most max_tokens tokens."""
+    if max_tokens <= 0 or not text:
+        return ""
+    encoder = get_encoder()
+    if encoder is None:
+        return text[:max_tokens * 4]
+    tokens = encoder.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[:max_tokens])
+
+def context_budget(max_prompt_tokens: int, messages, minimum: int = 500) -> int:
+    """Tokens left for context (e.g. sources) in a prompt whose other parts are messages."""
+    return max(int(max_prompt_tokens) - count_message_tokens(messages), minimum)
+
+class TokenUsage:
+    """Token counts of one agent run."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.measured_prompt_tokens = 0
+        self.over_budget_prompts = 0
+        self.steps: Dict[str, Dict[str, int]] = {}
+        # A run's steps may call the LLM from several threads
+        self._lock = threading.Lock()
+
+    def add_prompt(self, step: str, tokens: int, over_budget: bool = False) -> None:
+        with self._lock:
+            self._add_prompt(step, tokens, over_budget)
+
+    def _add_prompt(self, step: str, tokens: int, over_budget: bool) -> None:
+        entry = self.steps.setdefault(step, {"calls": 0, "measured_prompt_tokens": 0, "max_prompt_tokens": 0})
+        entry["calls"] += 1
+        entry["measured_prompt_tokens"] += tokens
+        entry["max_prompt_tokens"] = max(entry["max_prompt_tokens"], tokens)
+        self.measured_prompt_tokens += tokens
+        self.over_budget_prompts += int(over_budget)
+
+    def add_usage(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> None:
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+            self.cached_prompt_tokens += cached_tokens or 0
+
+    def as_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "prompt_cache_hit_ratio": round(self.cached_prompt_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            "measured_prompt_tokens": self.measured_prompt_tokens,
+            "over_budget_prompts": self.over_budget_prompts,
+            "steps": {step: dict(entry) for step, entry in self.steps.items()},
+        }
+
+_current_usage: contextvars.ContextVar[Optional[TokenUsage]] = contextvars.ContextVar("token_usage", default=None)
+
+@contextmanager
+def track_token_usage():
+    """Collect the token usage of everything run inside the block (including tasks it starts)."""
+    usage = TokenUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _current_usage.reset(token)
+        except ValueError:
+            # An async generator closed from another context (e.g. at garbage collection)
+            pass
+
+def measure_prompt(step: str, messages, max_tokens: Optional[int] = None) -> int:
+    """Count the tokens of a prompt about to be sent and record them for the current run."""
+    tokens = count_message_tokens(messages)
+    over_budget = max_tokens is not None and tokens > int(max_tokens)
+    if over_budget:
+        print(f"Warning: {step} prompt has {tokens} tokens, over the {max_tokens} token budget")
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.add_prompt(step, tokens, over_budget)
+    return tokens
+
+def record_usage(prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> None:
+    """Record provider-reported usage of one call for the current run."""
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.add_usage(prompt_tokens, completion_tokens, cached_tokens)
+
+def cached_prompt_tokens(usage) -> int:
+    """
+    Prompt tokens a provider served from its prompt cache, from any usage shape.
+
+    Understands OpenAI usage objects and dicts (prompt_tokens_details.cached_tokens)
+    and LangChain usage_metadata (input_token_details.cache_read).
+    """
+    if not usage:
+        return 0
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+    details = usage.get("prompt_tokens_details") or {}
+    if details.get("cached_tokens"):
+        return int(details["cached_tokens"])
+    details = usage.get("input_token_details") or {}
+    return int(details.get("cache_read") or 0)